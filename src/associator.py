@@ -0,0 +1,282 @@
+"""
+associator.py: Groups a continuous stream of pulses from many sensors into candidate incidents, for
+               a feed where nobody has put the pulses of one incident in one folder or json. Two
+               pulses can belong to the same incident when their sensors are within twice the
+               hearing radius of each other and their arrival times differ by no more than the
+               distance between the sensors over the speed of sound (plus a tolerance for onset
+               and clock errors), and every pulse of an incident arrives within the radius over
+               the speed of sound of its first one. A pulse joins the open candidate incident with
+               the most pulses that it is compatible with every pulse of, otherwise it opens a new
+               one.
+
+               A stray pulse, or a pulse of another shot nearby, can open an incident or join one
+               ahead of the pulses of a shot, which then open a second incident. So an incident is
+               only closed once two windows have passed its first pulse, when any rival incident
+               has heard all of its pulses, and each of its pulses compatible with every pulse of
+               a larger open incident is moved there first.
+
+               Sensors are kept in a grid index of cells twice the radius wide, so a new sensor
+               only measures its distance to the sensors of the 3 x 3 cells around it, and every
+               sensor keeps the bound on the time difference to each of its neighbours. Only the
+               pulses of the last window, the longest an incident can take to be heard by all of
+               its sensors, are kept. Closed incidents are handed to find_location when they have
+               enough pulses.
+
+Usage: Keep this file in your working directory and add:
+       from associator import pulse_associator
+       associator = pulse_associator(weather)
+       for pulse in feed:
+           for incident in associator.add(pulse):
+               ...
+       then associator.flush() for the incidents still open at the end of the feed.
+"""
+
+import bisect
+from collections import deque
+import math
+
+import conversion as utm
+from find_location import find_location
+from location import location
+import utc_time
+
+
+"""
+An incident being assembled: the find_pulses.py style json pulses, their sensors and arrival times
+in seconds after the associator's epoch, whether it has been closed and then the find_location of
+it (None when it wasn't located).
+"""
+class candidate_incident:
+
+    def __init__(self):
+        self.pulses = []
+        self.sensors = []
+        self.times = []
+        self.closed = False
+        self.located = None
+
+    """
+    Adds a pulse heard by sensor at time, keeping the pulses in arrival time order.
+    """
+    def insert(self, pulse, sensor, time):
+        index = bisect.bisect(self.times, time)
+        self.pulses.insert(index, pulse)
+        self.sensors.insert(index, sensor)
+        self.times.insert(index, time)
+
+    """
+    Removes and returns the (pulse, sensor, time) of the index'th pulse.
+    """
+    def pop(self, index):
+        return self.pulses.pop(index), self.sensors.pop(index), self.times.pop(index)
+
+    """
+    The find_pulses.py style json of the incident, as find_location and location_service take it.
+    """
+    def as_json(self, weather):
+        return {"pulses": self.pulses, "weather": weather}
+
+
+class pulse_associator:
+
+    """
+    Associates pulses heard under weather (a find_pulses.py style weather dictionary, whose
+    temperature and humidity give the speed of sound) by sensors that hear gunshots out to radius
+    meters. tolerance is the slack in seconds allowed on top of the travel time between two
+    sensors. Closed incidents of at least min_pulses pulses are located with find_location, passed
+    the registry and any other find_location_args, unless locate is False.
+    """
+    def __init__(self, weather, radius=2000.0, tolerance=0.01, min_pulses=3, locate=True, registry=None,
+                 **find_location_args):
+        self.weather = weather
+        self.speed = location().compute_speed(weather["temperature"], weather.get("humidity"))
+        self.radius = radius
+        self.tolerance = tolerance
+        self.min_pulses = min_pulses
+        self.locate = locate
+        self.registry = registry
+        self.find_location_args = find_location_args
+        # The longest an incident takes to reach all of its sensors: its first pulse is at least as
+        # close as any, and every sensor that hears it is within radius
+        self.window = radius / self.speed + tolerance
+        # Sensors by serial number, their UTM positions in the zone of the first one and, for each,
+        # the bound on the arrival time difference to every sensor within two radii
+        self.sensor_index = {}
+        self.positions = []
+        self.neighbours = []
+        self.cells = {}
+        self.zone = None
+        # Integer nanoseconds of the first pulse, times are float seconds after it
+        self.epoch = None
+        # The recent (time, incident) pulses of each sensor, and the open incidents oldest first
+        self.recent = []
+        self.open = deque()
+        # When the recent pulses were last forgotten
+        self.pruned = -math.inf
+        # Pulses and incidents seen, incidents closed with too few pulses to locate and pulses moved
+        # to a larger incident when theirs closed
+        self.counters = {"pulses": 0, "incidents": 0, "dropped": 0, "moved": 0}
+
+    """
+    The index of the sensor of a json pulse, registering it the first time it is seen: projected
+    into the zone of the first sensor, put in the grid index and given its neighbour bounds.
+    """
+    def sensor(self, pulse):
+        serial_number = pulse["serialNumber"]
+        index = self.sensor_index.get(serial_number)
+        if index is not None:
+            return index
+        latitude, longitude = pulse["location"]["latitude"], pulse["location"]["longitude"]
+        if self.zone is None:
+            self.zone = (utm.latlon_to_zone_number(latitude, longitude), utm.latitude_to_zone_letter(latitude))
+        easting, northing, _, _ = utm.from_latlon(latitude, longitude, *self.zone)
+        index = len(self.positions)
+        self.sensor_index[serial_number] = index
+        self.positions.append((float(easting), float(northing)))
+        self.neighbours.append({})
+        self.recent.append(deque())
+        cell_size = 2 * self.radius
+        cell = (int(easting // cell_size), int(northing // cell_size))
+        for dx in (-1, 0, 1):
+            for dy in (-1, 0, 1):
+                for other in self.cells.get((cell[0] + dx, cell[1] + dy), ()):
+                    distance = math.hypot(easting - self.positions[other][0], northing - self.positions[other][1])
+                    if distance <= cell_size:
+                        bound = distance / self.speed + self.tolerance
+                        self.neighbours[index][other] = bound
+                        self.neighbours[other][index] = bound
+        self.cells.setdefault(cell, []).append(index)
+        return index
+
+    """
+    Adds one find_pulses.py style json pulse of the feed, which must come in arrival time order.
+    Returns the list of candidate_incident closed by the time of this pulse, most often empty.
+    """
+    def add(self, pulse):
+        sensor = self.sensor(pulse)
+        arrival = utc_time.parse_utc_ns(pulse["arrivalTime"])
+        if self.epoch is None:
+            self.epoch = arrival
+        time = (arrival - self.epoch) * 1e-9
+        self.counters["pulses"] += 1
+        closed = self.expire(time)
+        bounds = self.neighbours[sensor]
+        # Incidents within the window holding a recent pulse of a neighbour that this pulse is
+        # compatible with, those still open but waiting to close are past it
+        candidates = {}
+        for neighbour, bound in bounds.items():
+            for other_time, incident in self.recent[neighbour]:
+                if abs(time - other_time) <= bound and time - incident.times[0] <= self.window:
+                    candidates[incident] = None
+        best = None
+        for incident in candidates:
+            if best is not None and len(incident.sensors) <= len(best.sensors):
+                continue
+            if self.compatible(sensor, time, incident):
+                best = incident
+        if best is None:
+            best = candidate_incident()
+            self.open.append(best)
+        best.insert(pulse, sensor, time)
+        self.recent[sensor].append((time, best))
+        return closed
+
+    """
+    Whether a pulse heard by sensor at time can join incident: its sensor hasn't heard the incident
+    yet, it is compatible with every pulse of it and within the window of its first pulse.
+    """
+    def compatible(self, sensor, time, incident):
+        if sensor in incident.sensors or time - incident.times[0] > self.window:
+            return False
+        bounds = self.neighbours[sensor]
+        return all(other in bounds and abs(time - other_time) <= bounds[other]
+                   for other, other_time in zip(incident.sensors, incident.times))
+
+    """
+    Closes the open incidents whose first pulse is more than two windows before time. Once a window,
+    also forgets the pulses that can't be compatible with any later one, until then they are
+    merely skipped. Returns the closed incidents.
+    """
+    def expire(self, time):
+        closed = []
+        while self.open and self.open[0].times[0] < time - 2 * self.window:
+            incident = self.open.popleft()
+            if self.merge(incident):
+                closed.append(self.close(incident))
+        if time - self.pruned >= self.window:
+            self.pruned = time
+            for recent in self.recent:
+                while recent and recent[0][0] < time - self.window:
+                    recent.popleft()
+        return closed
+
+    """
+    Closes the incidents still open, at the end of the feed. Returns the closed incidents.
+    """
+    def flush(self):
+        closed = []
+        while self.open:
+            incident = self.open.popleft()
+            if self.merge(incident):
+                closed.append(self.close(incident))
+        for recent in self.recent:
+            recent.clear()
+        return closed
+
+    """
+    Moves each pulse of incident, which has just left the open incidents, to the largest open
+    incident at least its size that the pulse is compatible with, where a rival incident for the
+    same shot has gathered the rest of its pulses. Returns the number of pulses left in incident.
+    """
+    def merge(self, incident):
+        moved = False
+        index = 0
+        while index < len(incident.pulses):
+            sensor, time = incident.sensors[index], incident.times[index]
+            best = None
+            for other in self.open:
+                if len(other.sensors) < len(incident.sensors) or best and len(other.sensors) <= len(best.sensors):
+                    continue
+                # The pulse can come before the first pulse of other, all must be within a window
+                if self.compatible(sensor, time, other) and other.times[-1] - time <= self.window:
+                    best = other
+            if best is None:
+                index += 1
+                continue
+            pulse, sensor, time = incident.pop(index)
+            best.insert(pulse, sensor, time)
+            recent = self.recent[sensor]
+            for position, (recent_time, owner) in enumerate(recent):
+                if owner is incident and recent_time == time:
+                    recent[position] = (time, best)
+            self.counters["moved"] += 1
+            moved = True
+        if moved:
+            # A moved pulse can be the new first pulse of its incident
+            self.open = deque(sorted(self.open, key=lambda other: other.times[0]))
+        return len(incident.pulses)
+
+    """
+    Marks incident closed, locating it with find_location when it has enough pulses (and locate is
+    set). Returns the incident.
+    """
+    def close(self, incident):
+        self.counters["incidents"] += 1
+        incident.closed = True
+        if len(incident.pulses) < self.min_pulses:
+            self.counters["dropped"] += 1
+        elif self.locate:
+            incident.located = find_location(incident.as_json(self.weather), registry=self.registry,
+                                             **self.find_location_args)
+        return incident
+
+
+"""
+Associates a whole feed, an iterable of json pulses in arrival time order, yielding every closed
+candidate_incident as soon as it closes. associator_args are those of pulse_associator.
+"""
+def associate(pulses, weather, **associator_args):
+    associator = pulse_associator(weather, **associator_args)
+    for pulse in pulses:
+        yield from associator.add(pulse)
+    yield from associator.flush()
@@ -0,0 +1,388 @@
+"""
+benchmark.py: Timing harness for the location pipeline. Builds synthetic incidents of sensors
+              scattered around a source on a UTM grid and times the stages against each other.
+              The stages live in solver_stages.py, input_stages.py and service_stages.py, the
+              inputs they share in synthetic.py, and this file runs the one asked for.
+
+Usage: Run as a script with the stage to benchmark, for example:
+
+       python src/benchmark.py loc2D --incidents 10000 --sensors 6
+
+       The suite stage times every stage of the pipeline from 3 to 50 sensors and 1 to 1M
+       incidents and records the results in a json file, to compare later runs against:
+
+       python src/benchmark.py suite --output results.json --baseline previous.json
+
+       and generate writes synthetic incidents as find_pulses.py style json:
+
+       python src/benchmark.py generate --incidents 100 --sensors 8 --output incidents/
+"""
+
+import argparse
+from datetime import datetime
+import json
+import os
+import pathlib
+import platform
+import subprocess
+import sys
+
+import numpy as np
+
+from find_location import find_location
+import input_stages
+from location import location
+from pulse_batch import pulse_batch
+import service_stages
+import smjx_reader
+import solver_stages
+from synthetic import example_requests, example_wavs, incident_requests, synthetic_incidents, timed
+
+
+def parse_arguments():
+    parser = argparse.ArgumentParser(description="Benchmarks stages of the location pipeline on "
+                                     "synthetic incidents.")
+    subparsers = parser.add_subparsers(dest="stage", required=True)
+    loc2D_parser = subparsers.add_parser("loc2D", help="scalar loc2D against loc2D_batch")
+    loc2D_parser.add_argument("--incidents", type=int, default=10000)
+    loc2D_parser.add_argument("--sensors", type=int, default=6)
+    loc2D_parser.add_argument("--seed", type=int, default=0)
+    references_parser = subparsers.add_parser("references", help="rotation loop against "
+                                              "loc2D_references")
+    references_parser.add_argument("--incidents", type=int, default=200)
+    references_parser.add_argument("--sensors", type=int, default=12)
+    references_parser.add_argument("--noise", type=float, default=1e-4)
+    references_parser.add_argument("--seed", type=int, default=0)
+    pulses_parser = subparsers.add_parser("pulses", help="per pulse objects against pulse_batch")
+    pulses_parser.add_argument("--pulses", type=int, default=100000)
+    pulses_parser.add_argument("--seed", type=int, default=0)
+    utm_parser = subparsers.add_parser("utm", help="per point UTM conversion against one array call")
+    utm_parser.add_argument("--points", type=int, default=100000)
+    utm_parser.add_argument("--seed", type=int, default=0)
+    coerce_parser = subparsers.add_parser("coerce", help="zone coercion of interior against zone "
+                                          "boundary arrays")
+    coerce_parser.add_argument("--incidents", type=int, default=2000)
+    coerce_parser.add_argument("--sensors", type=int, default=8)
+    coerce_parser.add_argument("--seed", type=int, default=0)
+    smjx_parser = subparsers.add_parser("smjx", help="smjx metadata reads against recording length")
+    smjx_parser.add_argument("--seconds", type=float, nargs="+", default=[2, 60, 600, 3600])
+    pcm_parser = subparsers.add_parser("pcm", help="reading a window of samples by UTC time from mapped "
+                                       "recordings against reading them whole")
+    pcm_parser.add_argument("--seconds", type=float, nargs="+", default=[2, 60, 600, 3600])
+    pcm_parser.add_argument("--window", type=float, default=0.05, help="seconds of samples to read")
+    index_parser = subparsers.add_parser("index", help="bulk WAV indexing with 1, 2, 4 and 8 workers")
+    index_parser.add_argument("--files", type=int, default=5000)
+    index_parser.add_argument("--workers", type=int, nargs="+", default=[1, 2, 4, 8])
+    detect_parser = subparsers.add_parser("detect", help="automatic onset detection on an example "
+                                          "incident")
+    detect_parser.add_argument("--incident", default="ChicagoILDistrict7_312*")
+    tdoa_parser = subparsers.add_parser("tdoa", help="per incident cost of the cross correlation TDOA "
+                                        "refinement on an example incident")
+    tdoa_parser.add_argument("--incident", default="ChicagoILDistrict7_312*")
+    service_parser = subparsers.add_parser("service", help="load generator replaying the example "
+                                           "incidents against find_location.py and location_service.py")
+    service_parser.add_argument("--cli-runs", type=int, default=20)
+    service_parser.add_argument("--requests", type=int, default=2000)
+    service_parser.add_argument("--clients", type=int, nargs="+", default=[1, 8])
+    service_parser.add_argument("--workers", type=int, nargs="+", default=[0, os.cpu_count()])
+    registry_parser = subparsers.add_parser("registry", help="find_location with and without a "
+                                            "sensor_registry on incidents from a fixed fleet")
+    registry_parser.add_argument("--incidents", type=int, default=2000)
+    registry_parser.add_argument("--fleet", type=int, default=300)
+    registry_parser.add_argument("--subsets", type=int, default=50)
+    registry_parser.add_argument("--sensors", type=int, default=6)
+    registry_parser.add_argument("--seed", type=int, default=0)
+    prepared_parser = subparsers.add_parser("prepared", help="loc2D and loc2D_references with and "
+                                            "without prepared geometry for repeat sensor sets")
+    prepared_parser.add_argument("--incidents", type=int, default=2000)
+    prepared_parser.add_argument("--sensors", type=int, nargs="+", default=[3, 4, 6, 8, 12])
+    prepared_parser.add_argument("--seed", type=int, default=0)
+    diagnostics_parser = subparsers.add_parser("diagnostics", help="the per call logging.basicConfig "
+                                               "diagnostics removed from loc2D, and the cost of recording a failure")
+    diagnostics_parser.add_argument("--incidents", type=int, default=20000)
+    diagnostics_parser.add_argument("--sensors", type=int, default=6)
+    diagnostics_parser.add_argument("--seed", type=int, default=0)
+    status_parser = subparsers.add_parser("status", help="reprocessing incidents with a growing share of "
+                                          "unsolvable ones, per incident with exceptions against loc2D_batch")
+    status_parser.add_argument("--incidents", type=int, default=20000)
+    status_parser.add_argument("--sensors", type=int, default=6)
+    status_parser.add_argument("--bad", type=float, nargs="+", default=[0.0, 0.01, 0.1, 0.5])
+    status_parser.add_argument("--seed", type=int, default=0)
+    refine_parser = subparsers.add_parser("refine", help="Levenberg-Marquardt refinement of the "
+                                          "closed form roots of noisy incidents")
+    refine_parser.add_argument("--incidents", type=int, default=20000)
+    refine_parser.add_argument("--sensors", type=int, nargs="+", default=[4, 6, 8, 12])
+    refine_parser.add_argument("--noise", type=float, default=1e-4)
+    refine_parser.add_argument("--seed", type=int, default=0)
+    robust_parser = subparsers.add_parser("robust", help="ransac_inliers runtime and accuracy against "
+                                          "sensor count with one echo delayed arrival per incident")
+    robust_parser.add_argument("--incidents", type=int, default=200)
+    robust_parser.add_argument("--sensors", type=int, nargs="+", default=[5, 6, 8, 12, 16, 20, 30])
+    robust_parser.add_argument("--max-subsets", type=int, nargs="+", default=[100, 500])
+    robust_parser.add_argument("--echo", type=float, default=0.05, help="seconds the echo arrives late")
+    robust_parser.add_argument("--seed", type=int, default=0)
+    three_d_parser = subparsers.add_parser("3d", help="loc2D_batch on zeroed elevations against "
+                                           "loc3D_batch for sensors and sources at different heights")
+    three_d_parser.add_argument("--incidents", type=int, default=20000)
+    three_d_parser.add_argument("--sensors", type=int, default=8)
+    three_d_parser.add_argument("--heights", type=float, nargs="+", default=[0, 10, 50, 150],
+                                help="sensors and sources are up to this many meters high")
+    three_d_parser.add_argument("--noise", type=float, default=1e-4)
+    three_d_parser.add_argument("--seed", type=int, default=0)
+    wind_parser = subparsers.add_parser("wind", help="temperature only loc2D_batch against the wind and "
+                                        "humidity corrected loc2D_wind_batch")
+    wind_parser.add_argument("--incidents", type=int, default=20000)
+    wind_parser.add_argument("--sensors", type=int, default=8)
+    wind_parser.add_argument("--winds", type=float, nargs="+", default=[0, 5, 10, 15], help="wind speeds in m/s")
+    wind_parser.add_argument("--temperature", type=float, default=30.0)
+    wind_parser.add_argument("--humidity", type=float, default=80.0)
+    wind_parser.add_argument("--seed", type=int, default=0)
+    grid_parser = subparsers.add_parser("grid", help="grid_search cells per second and memory against grid "
+                                        "size, tile size and workers, and grid_locate on unsolvable incidents")
+    grid_parser.add_argument("--cells", type=int, nargs="+", default=[101, 301, 1001, 3001])
+    grid_parser.add_argument("--sensors", type=int, default=6)
+    grid_parser.add_argument("--tile-cells", type=int, default=2**16)
+    grid_parser.add_argument("--workers", type=int, nargs="+", default=[0, os.cpu_count()])
+    grid_parser.add_argument("--incidents", type=int, default=200)
+    grid_parser.add_argument("--seed", type=int, default=0)
+    uncertainty_parser = subparsers.add_parser("uncertainty", help="Monte Carlo confidence ellipses, incidents "
+                                               "per second and how often the ellipse holds the source")
+    uncertainty_parser.add_argument("--incidents", type=int, default=1000)
+    uncertainty_parser.add_argument("--sensors", type=int, default=6)
+    uncertainty_parser.add_argument("--draws", type=int, default=1000)
+    uncertainty_parser.add_argument("--batches", type=int, nargs="+", default=[1, 10, 100],
+                                    help="incidents per monte_carlo_batch call")
+    uncertainty_parser.add_argument("--pdop", type=float, default=2.0)
+    uncertainty_parser.add_argument("--clock-error", type=float, default=1e-3, help="clock error bound in seconds")
+    uncertainty_parser.add_argument("--seed", type=int, default=0)
+    shots_parser = subparsers.add_parser("shots", help="detect, group and locate every shot of synthetic "
+                                         "bursts")
+    shots_parser.add_argument("--shots", type=int, nargs="+", default=[1, 10, 30, 300])
+    shots_parser.add_argument("--sensors", type=int, default=8)
+    shots_parser.add_argument("--interval", type=float, default=0.08, help="mean seconds between rounds")
+    shots_parser.add_argument("--seed", type=int, default=0)
+    associate_parser = subparsers.add_parser("associate", help="pulses per second of the pulse associator on a "
+                                             "synthetic city wide feed")
+    associate_parser.add_argument("--sensors", type=int, default=400)
+    associate_parser.add_argument("--size", type=float, default=20000.0, help="side of the city in meters")
+    associate_parser.add_argument("--incidents", type=int, default=2000)
+    associate_parser.add_argument("--rate", type=float, default=0.2, help="incidents per second of the feed")
+    associate_parser.add_argument("--radius", type=float, default=1500.0, help="hearing radius in meters")
+    associate_parser.add_argument("--false-pulses", type=float, default=0.5,
+                                  help="stray pulses per incident at random sensors")
+    associate_parser.add_argument("--seed", type=int, default=0)
+    suite_parser = subparsers.add_parser("suite", help="every stage from the examples and from synthetic "
+                                         "incidents of each size, recorded to a json file")
+    suite_parser.add_argument("--sensors", type=int, nargs="+", default=[3, 6, 12, 25, 50])
+    suite_parser.add_argument("--incidents", type=int, nargs="+", default=[1, 100, 10000, 1000000])
+    suite_parser.add_argument("--noise", type=float, default=1e-4, help="arrival time noise in seconds")
+    suite_parser.add_argument("--json-limit", type=int, default=1000, help="most incidents timed through "
+                              "the per incident json stages")
+    suite_parser.add_argument("--batch-limit", type=int, default=2 * 10**7, help="most sensor solves timed "
+                              "through each batched stage")
+    suite_parser.add_argument("--output", type=pathlib.Path, help="defaults to benchmark_results.json in the "
+                              "repository root, wherever it is run from",
+                              default=pathlib.Path(os.path.dirname(os.path.abspath(__file__))).parent
+                              / "benchmark_results.json")
+    suite_parser.add_argument("--baseline", type=pathlib.Path, help="results of an earlier run to compare with")
+    suite_parser.add_argument("--seed", type=int, default=0)
+    generate_parser = subparsers.add_parser("generate", help="write synthetic incidents: a directory of "
+                                            "find_pulses.py style json files, a .jsonl of location_service "
+                                            "requests or a .npz of arrays")
+    generate_parser.add_argument("--incidents", type=int, default=100)
+    generate_parser.add_argument("--sensors", type=int, default=6)
+    generate_parser.add_argument("--noise", type=float, default=0.0, help="arrival time noise in seconds")
+    generate_parser.add_argument("--temperature", type=float, default=20.0)
+    generate_parser.add_argument("--output", type=pathlib.Path, required=True)
+    generate_parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+    return args
+
+
+"""
+One record of the suite results: stage timed over timed of the incidents (of sensors each) from
+source ("examples" or "synthetic") in seconds.
+"""
+def suite_record(stage, source, sensors, incidents, timed_incidents, seconds):
+    return {"stage": stage, "source": source, "sensors": sensors, "incidents": incidents,
+            "timed_incidents": timed_incidents, "seconds": seconds,
+            "us_per_incident": 1e6 * seconds / timed_incidents, "incidents_per_second": timed_incidents / seconds}
+
+
+"""
+Times the per incident stages of find_pulses.py style requests: parsing the arrival times and
+projecting to UTM (pulse_batch.from_json), zone coercion, the whole find_location and writing its
+results as find_location.py prints them. Returns the suite records.
+"""
+def suite_json_stages(requests, source, sensors, incidents):
+    count = len(requests)
+    utm_time, batches = timed(lambda: [pulse_batch.from_json(request["pulses"]) for request in requests])
+    coerce_time, _ = timed(lambda: [batch.coerce_utm() for batch in batches])
+    locate_time, located = timed(lambda: [find_location(request) for request in requests])
+    output_time, _ = timed(lambda: [json.dumps([x.as_dict() for x in location_obj.computed_locations],
+                                               sort_keys=True, indent=4) for location_obj in located])
+    return [suite_record("utm", source, sensors, incidents, count, utm_time),
+            suite_record("coerce", source, sensors, incidents, count, coerce_time),
+            suite_record("find_location", source, sensors, incidents, count, locate_time),
+            suite_record("json_output", source, sensors, incidents, count, output_time)]
+
+
+"""
+Times loc2D_batch and reference selection (loc2D_references_batch and the choice of the best root)
+on up to batch_limit sensor solves of incidents synthetic incidents of sensors each, generated and
+solved a chunk at a time so that memory stays bounded at a million incidents. Returns the records.
+"""
+def suite_batch_stages(sensors, incidents, noise, batch_limit, seed):
+    loc = location()
+    records = []
+    for stage, solves_per_incident in (("loc2D", sensors), ("references", sensors * sensors)):
+        count = max(1, min(incidents, batch_limit // solves_per_incident))
+        chunk = max(1, 2 * 10**6 // solves_per_incident)
+        elapsed = 0.0
+        for start in range(0, count, chunk):
+            positions, arrivals, _, speed = synthetic_incidents(min(chunk, count - start), sensors, seed + start,
+                                                                noise=noise)
+            if stage == "loc2D":
+                chunk_time, _ = timed(loc.loc2D_batch, positions, arrivals, speed, repeat=1)
+            else:
+                def select():
+                    solved = loc.loc2D_references_batch(positions, arrivals, speed)
+                    errors = np.where(np.isnan(solved[3]), np.inf, solved[3])
+                    return np.argmin(errors.reshape(len(arrivals), -1), axis=1)
+                chunk_time, _ = timed(select, repeat=1)
+            elapsed += chunk_time
+        records.append(suite_record(stage, "synthetic", sensors, incidents, count, elapsed))
+    return records
+
+
+"""
+The stages of every size of synthetic incident and of the example incidents, printed as they are
+timed and written to output as json along with the machine they ran on. With a baseline (an earlier
+output) each stage is also compared with its time there.
+"""
+def bench_suite(sensor_counts, incident_counts, noise, json_limit, batch_limit, output, baseline, seed):
+    records = []
+    wavpaths = example_wavs("*")
+    smjx_time, _ = timed(lambda: [smjx_reader.read_smjx_from_file(wavpath) for wavpath in wavpaths])
+    records.append(suite_record("smjx", "examples", 1, len(wavpaths), len(wavpaths), smjx_time))
+    requests = example_requests()
+    records.extend(suite_json_stages(requests, "examples", max(len(request["pulses"]) for request in requests),
+                                     len(requests)))
+    for sensors in sensor_counts:
+        for incidents in incident_counts:
+            count = min(incidents, json_limit)
+            positions, arrivals, _, _ = synthetic_incidents(count, sensors, seed, noise=noise)
+            records.extend(suite_json_stages(incident_requests(positions, arrivals, seed=seed), "synthetic",
+                                             sensors, incidents))
+            records.extend(suite_batch_stages(sensors, incidents, noise, batch_limit, seed))
+    previous = {}
+    if baseline is not None:
+        with open(baseline) as f:
+            previous = {(record["stage"], record["source"], record["sensors"], record["incidents"]): record
+                        for record in json.load(f)["results"]}
+    for record in records:
+        before = previous.get((record["stage"], record["source"], record["sensors"], record["incidents"]))
+        change = "" if before is None else "  {0:+6.1%} against baseline".format(
+            record["us_per_incident"] / before["us_per_incident"] - 1)
+        sys.stdout.write("{0:14s} {1:9s} {2:3d} sensors {3:8d} incidents: {4:11.2f} us/incident "
+                         "({5} timed){6}\n".format(record["stage"], record["source"], record["sensors"],
+                                                  record["incidents"], record["us_per_incident"],
+                                                  record["timed_incidents"], change))
+    try:
+        commit = subprocess.run(["git", "rev-parse", "HEAD"], capture_output=True, text=True,
+                                cwd=os.path.dirname(os.path.abspath(__file__))).stdout.strip() or None
+    except OSError:
+        commit = None
+    with open(output, "w") as f:
+        json.dump({"created": datetime.now().astimezone().isoformat(), "commit": commit,
+                   "python": platform.python_version(), "numpy": np.__version__, "platform": platform.platform(),
+                   "cpus": os.cpu_count(), "results": records}, f, indent=4)
+    sys.stdout.write("results written to {0}\n".format(output))
+
+
+"""
+Writes synthetic incidents to output: a .npz of the positions, arrivals, sources and speed arrays,
+a .jsonl of location_service requests, one per line, or otherwise a directory of one find_pulses.py
+style json file per incident.
+"""
+def generate(incidents, sensors, noise, temperature, output, seed):
+    positions, arrivals, sources, speed = synthetic_incidents(incidents, sensors, seed, temp=temperature,
+                                                              noise=noise)
+    if output.suffix == ".npz":
+        np.savez(output, positions=positions, arrivals=arrivals, sources=sources, speed=speed)
+        return
+    requests = incident_requests(positions, arrivals, temperature, seed)
+    if output.suffix == ".jsonl":
+        with open(output, "w") as f:
+            for i, request in enumerate(requests):
+                request["id"] = i
+                f.write(json.dumps(request) + "\n")
+        return
+    output.mkdir(parents=True, exist_ok=True)
+    for i, request in enumerate(requests):
+        with open(output / "incident_{0:07d}.json".format(i), "w") as f:
+            json.dump(request, f, indent=4, sort_keys=True)
+
+
+def main():
+    args = parse_arguments()
+    if args.stage == "loc2D":
+        solver_stages.bench_loc2D(args.incidents, args.sensors, args.seed)
+    elif args.stage == "references":
+        solver_stages.bench_references(args.incidents, args.sensors, args.noise, args.seed)
+    elif args.stage == "pulses":
+        input_stages.bench_pulses(args.pulses, args.seed)
+    elif args.stage == "utm":
+        input_stages.bench_utm(args.points, args.seed)
+    elif args.stage == "coerce":
+        input_stages.bench_coerce(args.incidents, args.sensors, args.seed)
+    elif args.stage == "smjx":
+        input_stages.bench_smjx(args.seconds)
+    elif args.stage == "suite":
+        bench_suite(args.sensors, args.incidents, args.noise, args.json_limit, args.batch_limit, args.output,
+                    args.baseline, args.seed)
+    elif args.stage == "generate":
+        generate(args.incidents, args.sensors, args.noise, args.temperature, args.output, args.seed)
+    elif args.stage == "pcm":
+        input_stages.bench_pcm(args.seconds, args.window)
+    elif args.stage == "index":
+        input_stages.bench_index(args.files, args.workers)
+    elif args.stage == "detect":
+        input_stages.bench_detect(args.incident)
+    elif args.stage == "tdoa":
+        input_stages.bench_tdoa(args.incident)
+    elif args.stage == "service":
+        service_stages.bench_service(args.cli_runs, args.requests, args.clients, args.workers)
+    elif args.stage == "registry":
+        service_stages.bench_registry(args.incidents, args.fleet, args.subsets, args.sensors, args.seed)
+    elif args.stage == "prepared":
+        solver_stages.bench_prepared(args.incidents, args.sensors, args.seed)
+    elif args.stage == "diagnostics":
+        solver_stages.bench_diagnostics(args.incidents, args.sensors, args.seed)
+    elif args.stage == "status":
+        solver_stages.bench_status(args.incidents, args.sensors, args.bad, args.seed)
+    elif args.stage == "refine":
+        solver_stages.bench_refine(args.incidents, args.sensors, args.noise, args.seed)
+    elif args.stage == "robust":
+        solver_stages.bench_robust(args.incidents, args.sensors, args.max_subsets, args.echo, args.seed)
+    elif args.stage == "3d":
+        solver_stages.bench_3d(args.incidents, args.sensors, args.heights, args.noise, args.seed)
+    elif args.stage == "wind":
+        solver_stages.bench_wind(args.incidents, args.sensors, args.winds, args.temperature, args.humidity,
+                                 args.seed)
+    elif args.stage == "grid":
+        solver_stages.bench_grid(args.cells, args.sensors, args.tile_cells, args.workers, args.incidents,
+                                 args.seed)
+    elif args.stage == "associate":
+        service_stages.bench_associate(args.sensors, args.size, args.incidents, args.rate, args.radius,
+                                       args.false_pulses, args.seed)
+    elif args.stage == "shots":
+        input_stages.bench_shots(args.shots, args.sensors, args.interval, args.seed)
+    elif args.stage == "uncertainty":
+        solver_stages.bench_uncertainty(args.incidents, args.sensors, args.draws, args.batches, args.pdop,
+                                        args.clock_error, args.seed)
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
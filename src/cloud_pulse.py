@@ -2,17 +2,16 @@
 Zac Plett 07/24/2018 - ShotSpotter
 
 cloud_pulse.py: This class will be fed JSON data from the array of pulses and convert each pulse
-                into a cloud_pulse object.
+                into a cloud_pulse object. Whole arrays of pulses should be read with
+                pulse_batch.from_json instead, which does not create an object per pulse.
 
 Usage: Keep this file in your working directory and add:
        from cloud_pulse import cloud_pulse
 """
 
-from dateutil.parser import parse
 import uuid
 
-import conversion as utm
-from location_pulse import location_pulse
+from pulse_batch import pulse_batch
 
 
 class cloud_pulse:
@@ -29,12 +28,9 @@ class cloud_pulse:
                          "elevation": json_data["location"]["elevation"]}
 
     """
-    Converts cloud_pulse object to a location_pulse object. 
+    Converts cloud_pulse object to a location_pulse object, a view onto a single row pulse_batch.
     """
     def cloud_to_location(self):
-        # Converts the ISO 8601 arrival time to a python datetime object.
-        arrival_time_obj = parse(self.arrival_time)
-        # Converts the lat / lon coordinates to UTM before creating the location pulse.
-        return location_pulse(self.pulse_id, self.serial_number, arrival_time_obj, 
-                              utm.from_latlon(self.location["latitude"], 
-                              self.location["longitude"]), self.location["elevation"])
+        # The batch parses the ISO 8601 arrival time to nanoseconds and converts the lat / lon
+        # coordinates to UTM
+        return pulse_batch.from_json([self.json_data])[0]
@@ -66,27 +66,49 @@ def in_bounds(x, lower, upper, upper_strict=False):
     return lower <= x <= upper
 
 
+def is_array(x):
+    return use_numpy and isinstance(x, mathlib.ndarray)
+
+
+def upper(zone_letter):
+    if is_array(zone_letter):
+        return mathlib.char.upper(zone_letter.astype(str))
+    return zone_letter.upper()
+
+
+def has_letter(zone_letter):
+    if is_array(zone_letter):
+        return zone_letter.size > 0
+    return bool(zone_letter)
+
+
 def check_valid_zone(zone_number, zone_letter):
-    if not 1 <= zone_number <= 60:
+    if not in_bounds(zone_number, 1, 60):
         raise OutOfRangeError('zone number out of range (must be between 1 and 60)')
 
-    if zone_letter:
-        zone_letter = zone_letter.upper()
+    if has_letter(zone_letter):
+        zone_letter = upper(zone_letter)
 
-        if not 'C' <= zone_letter <= 'X' or zone_letter in ['I', 'O']:
+        if is_array(zone_letter):
+            invalid = ((zone_letter < 'C') | (zone_letter > 'X') | (zone_letter == 'I') |
+                       (zone_letter == 'O'))
+            if invalid.any():
+                raise OutOfRangeError('zone letter out of range (must be between C and X)')
+        elif not 'C' <= zone_letter <= 'X' or zone_letter in ['I', 'O']:
             raise OutOfRangeError('zone letter out of range (must be between C and X)')
 
 
-def mixed_signs(x):
-    return use_numpy and mathlib.min(x) < 0 and mathlib.max(x) >= 0
-
-
 def negative(x):
     if use_numpy:
         return mathlib.max(x) < 0
     return x < 0
 
 
+def mod_angle(value):
+    """Returns angle in radians to be between -pi and pi"""
+    return (value + mathlib.pi) % (2 * mathlib.pi) - mathlib.pi
+
+
 def to_latlon(easting, northing, zone_number, zone_letter=None, northern=None, strict=True):
     """This function convert an UTM coordinate into Latitude and Longitude
         Parameters
@@ -97,20 +119,22 @@ def to_latlon(easting, northing, zone_number, zone_letter=None, northern=None, s
             Northing value of UTM coordinate
         zone_number: int
             Zone Number is represented with global map numbers of an UTM Zone
-            Numbers Map. More information see utmzones [1]_
+            Numbers Map. More information see utmzones [1]_. May be an array
+            with one zone per coordinate.
         zone_letter: str
             Zone Letter can be represented as string values. Where UTM Zone
-            Designators can be accessed in [1]_
+            Designators can be accessed in [1]_. May be an array with one
+            letter per coordinate.
         northern: bool
             You can set True or False to set this parameter. Default is None
         strict: bool
 
        .. _[1]: http://www.jaworski.ca/utmzones.htm
     """
-    if not zone_letter and northern is None:
+    if not has_letter(zone_letter) and northern is None:
         raise ValueError('either zone_letter or northern needs to be set')
 
-    elif zone_letter and northern is not None:
+    elif has_letter(zone_letter) and northern is not None:
         raise ValueError('set either zone_letter or northern, but not both')
 
     if strict:
@@ -121,14 +145,16 @@ def to_latlon(easting, northing, zone_number, zone_letter=None, northern=None, s
     
     check_valid_zone(zone_number, zone_letter)
     
-    if zone_letter:
-        zone_letter = zone_letter.upper()
+    if has_letter(zone_letter):
+        zone_letter = upper(zone_letter)
         northern = (zone_letter >= 'N')
 
     x = easting - 500000
     y = northing
 
-    if not northern:
+    if is_array(northern):
+        y = mathlib.where(northern, y, y - 10000000)
+    elif not northern:
         y -= 10000000
 
     m = y / K0
@@ -174,8 +200,11 @@ def to_latlon(easting, northing, zone_number, zone_letter=None, northern=None, s
                  d3 / 6 * (1 + 2 * p_tan2 + c) +
                  d5 / 120 * (5 - 2 * c + 28 * p_tan2 - 3 * c2 + 8 * E_P2 + 24 * p_tan4)) / p_cos
 
+    # Wrapped, a point past the edge of zone 60 or zone 1 is on the other side of the antimeridian
+    longitude = mod_angle(longitude + mathlib.radians(zone_number_to_central_longitude(zone_number)))
+
     return (mathlib.degrees(latitude),
-            mathlib.degrees(longitude) + zone_number_to_central_longitude(zone_number))
+            mathlib.degrees(longitude))
 
 
 def from_latlon(latitude, longitude, force_zone_number=None, force_zone_letter=None):
@@ -189,11 +218,16 @@ def from_latlon(latitude, longitude, force_zone_number=None, force_zone_letter=N
         force_zone_number: int
             Zone Number is represented with global map numbers of an UTM Zone
             Numbers Map. You may force conversion including one UTM Zone Number.
-            More information see utmzones [1]_
+            More information see utmzones [1]_. May be an array with one zone
+            per coordinate.
         force_zone_letter: str
             Zone Letter is used with the Zone Number to represent a specific UTM
-            Zone with the number.
+            Zone with the number. May be an array with one letter per
+            coordinate.
             More information see utmzones [1]_
+
+        Array input is converted element-wise, every point in its own zone
+        unless forced, and the zone numbers and letters are returned as arrays.
        .. _[1]: http://www.jaworski.ca/utmzones.htm
     """
     if not in_bounds(latitude, -80.0, 84.0):
@@ -228,7 +262,8 @@ def from_latlon(latitude, longitude, force_zone_number=None, force_zone_letter=N
     n = R / mathlib.sqrt(1 - E * lat_sin**2)
     c = E_P2 * lat_cos**2
 
-    a = lat_cos * (lon_rad - central_lon_rad)
+    # Wrapped, so a point forced into a zone across the antimeridian (zone 1 into 60) stays near it
+    a = lat_cos * mod_angle(lon_rad - central_lon_rad)
     a2 = a * a
     a3 = a2 * a
     a4 = a3 * a
@@ -247,20 +282,23 @@ def from_latlon(latitude, longitude, force_zone_number=None, force_zone_letter=N
     northing = K0 * (m + n * lat_tan * (a2 / 2 +
                                         a4 / 24 * (5 - lat_tan2 + 9 * c + 4 * c**2) +
                                         a6 / 720 * (61 - 58 * lat_tan2 + lat_tan4 + 600 * c - 330 * E_P2)))
-    
-    if mixed_signs(latitude):
-        raise ValueError("latitudes must all have the same sign")
-    if zone_letter <= "M":
+
+    # Zone letters are per point, so arrays may span the equator
+    if is_array(zone_letter):
+        northing = mathlib.where(zone_letter <= "M", northing + 10000000, northing)
+    elif zone_letter <= "M":
         northing += 10000000
-        
+
     return easting, northing, zone_number, zone_letter
 
 
 def latitude_to_zone_letter(latitude):
-    # If the input is a numpy array, just use the first element
-    # User responsibility to make sure that all points are in one zone
-    if use_numpy and isinstance(latitude, mathlib.ndarray):
-        latitude = latitude.flat[0]
+    # If the input is a numpy array, every element gets its own letter and those out of range an
+    # empty string
+    if is_array(latitude):
+        in_range = (latitude >= -80) & (latitude <= 84)
+        index = (mathlib.where(in_range, latitude, -80) + 80).astype(int) >> 3
+        return mathlib.where(in_range, mathlib.array(list(ZONE_LETTERS))[index], '')
 
     if -80 <= latitude <= 84:
         return ZONE_LETTERS[int(latitude + 80) >> 3]
@@ -269,13 +307,19 @@ def latitude_to_zone_letter(latitude):
 
 
 def latlon_to_zone_number(latitude, longitude):
-    # If the input is a numpy array, just use the first element
-    # User responsibility to make sure that all points are in one zone
-    if use_numpy:
-        if isinstance(latitude, mathlib.ndarray):
-            latitude = latitude.flat[0]
-        if isinstance(longitude, mathlib.ndarray):
-            longitude = longitude.flat[0]
+    # If the input is a numpy array, every element gets its own zone number with the same special
+    # cases for Norway and Svalbard as a single point
+    if is_array(latitude) or is_array(longitude):
+        latitude, longitude = mathlib.broadcast_arrays(latitude, longitude)
+        zone_number = ((longitude + 180) / 6).astype(int) + 1
+        zone_number = mathlib.where((latitude >= 56) & (latitude < 64) & (longitude >= 3) &
+                                    (longitude < 12), 32, zone_number)
+        svalbard = (latitude >= 72) & (latitude <= 84) & (longitude >= 0)
+        zone_number = mathlib.where(svalbard & (longitude < 42),
+                                    mathlib.select([longitude < 9, longitude < 21, longitude < 33],
+                                                   [31, 33, 35], 37),
+                                    zone_number)
+        return zone_number
 
     if 56 <= latitude < 64 and 3 <= longitude < 12:
         return 32
@@ -0,0 +1,192 @@
+"""
+detect_pulses.py: Automatic impulse onset detection for ShotSpotter WAV files, the batch
+                  replacement for find_pulses.manually_locate_pulses. Every sensor of an incident
+                  is processed at once as one row of a 2D array.
+
+                  The samples are high-pass filtered with a first difference and turned into a
+                  short trailing-window energy envelope. A row triggers at the first sample whose
+                  energy reaches peak_fraction of that row's peak, provided the peak stands at
+                  least min_snr_db above the row's median (noise floor) energy. The onset is then
+                  backtracked from the trigger to where the envelope last rose through floor_db
+                  above the noise floor, with linear interpolation between the two samples either
+                  side of that crossing for a sub-sample onset.
+
+Usage: Keep this file in your working directory and add:
+       import detect_pulses
+       or run find_pulses.py with --auto.
+"""
+
+import json
+import uuid
+
+import numpy as np
+
+import smjx_reader
+import utc_time
+
+
+"""
+Pads a list of 1D sample arrays of possibly different lengths into a (sensors, samples) float array,
+along with the number of valid samples in each row.
+"""
+def stack_signals(signals):
+    lengths = np.array([len(signal) for signal in signals])
+    stacked = np.zeros((len(signals), lengths.max() if len(signals) else 0))
+    for row, signal in enumerate(signals):
+        stacked[row, :len(signal)] = signal
+    return stacked, lengths
+
+
+"""
+Trailing-window mean energy of the first difference of every row, samples past a row's length are
+nan. Computed with a cumulative sum so the cost doesn't depend on the window length.
+"""
+def energy_envelope(stacked, lengths, window):
+    highpass = np.diff(stacked, axis=1, prepend=stacked[:, :1])
+    cumulative = np.cumsum(highpass * highpass, axis=1)
+    envelope = cumulative.copy()
+    envelope[:, window:] -= cumulative[:, :-window]
+    envelope /= window
+    envelope[np.arange(stacked.shape[1]) >= lengths[:, np.newaxis]] = np.nan
+    return envelope
+
+
+"""
+Onset sample of the first impulse in each of the signals, as a float with sub-sample precision,
+or nan for a signal where no impulse stands out from the noise.
+"""
+def detect_onsets(signals, sr, window_seconds=0.001, peak_fraction=0.1, min_snr_db=20.0, floor_db=6.0):
+    stacked, lengths = stack_signals(signals)
+    if stacked.size == 0:
+        return np.full(len(signals), np.nan)
+    window = max(1, int(round(window_seconds * sr)))
+    envelope = energy_envelope(stacked, lengths, window)
+    # Envelope samples one window apart barely overlap, so the noise floor is taken from those
+    # alone. nanmedian is several times slower than median, only pay for it when rows were padded.
+    spaced = envelope[:, ::window]
+    if (lengths == envelope.shape[1]).all():
+        noise = np.median(spaced, axis=1)
+    else:
+        noise = np.nanmedian(spaced, axis=1)
+    peak = np.nanmax(envelope, axis=1)
+    detected = peak >= noise * 10**(min_snr_db / 10)
+    with np.errstate(invalid="ignore"):
+        trigger = np.argmax(envelope >= (peak_fraction * peak)[:, np.newaxis], axis=1)
+        floor = (noise * 10**(floor_db / 10))[:, np.newaxis]
+        # Nothing after the latest trigger is needed for the backtrack
+        searched = envelope[:, :trigger.max() + 1]
+        samples = np.arange(searched.shape[1])
+        below = (searched < floor) & (samples < trigger[:, np.newaxis])
+    # The last sample below the floor before the trigger, and the interpolated crossing after it
+    last_below = np.where(below, samples, -1).max(axis=1)
+    rows = np.arange(len(signals))
+    start = np.maximum(last_below, 0)
+    before = envelope[rows, start]
+    after = envelope[rows, np.minimum(start + 1, envelope.shape[1] - 1)]
+    with np.errstate(divide="ignore", invalid="ignore"):
+        fraction = np.clip((floor[:, 0] - before) / (after - before), 0.0, 1.0)
+    onsets = np.where(last_below >= 0, start + np.nan_to_num(fraction), trigger.astype(np.float64))
+    return np.where(detected, onsets, np.nan)
+
+
+"""
+Onset samples of every impulse in each of the signals, for recordings of bursts of several shots.
+Returns a list with one ascending float array of onsets (sub-sample, as detect_onsets) per signal.
+
+With several impulses of different strengths a threshold relative to the peak would miss the
+weaker ones, so an impulse is triggered where the envelope rises to min_snr_db above the row's
+noise floor after at least hold_seconds below it, which also keeps the echoes and reverberation
+that follow within hold_seconds of an impulse from triggering. Each trigger is backtracked to
+where the envelope rose through floor_db above the noise floor, at most hold_seconds back. The
+work is a fixed number of passes over the samples, and a gather of hold_seconds of envelope per
+impulse, whatever the number of impulses.
+"""
+def detect_all_onsets(signals, sr, window_seconds=0.001, min_snr_db=20.0, floor_db=6.0, hold_seconds=0.02):
+    stacked, lengths = stack_signals(signals)
+    if stacked.size == 0:
+        return [np.empty(0) for _ in signals]
+    window = max(1, int(round(window_seconds * sr)))
+    hold = max(1, int(round(hold_seconds * sr)))
+    envelope = energy_envelope(stacked, lengths, window)
+    noise = np.nanmedian(envelope[:, ::window], axis=1)[:, np.newaxis]
+    with np.errstate(invalid="ignore"):
+        above = envelope >= noise * 10**(min_snr_db / 10)
+    # How many of the hold samples before each sample were above the threshold
+    count = np.zeros((stacked.shape[0], stacked.shape[1] + 1), dtype=np.int64)
+    np.cumsum(above, axis=1, out=count[:, 1:])
+    before = count[:, :-1] - count[:, np.maximum(np.arange(stacked.shape[1]) - hold, 0)]
+    rows, triggers = np.nonzero(above & (before == 0))
+    # The hold samples of envelope up to each trigger, the last of them below the floor and the
+    # interpolated crossing after it as in detect_onsets
+    samples = np.maximum(triggers[:, np.newaxis] + np.arange(-hold, 1), 0)
+    floor = (noise * 10**(floor_db / 10))[rows]
+    with np.errstate(invalid="ignore"):
+        below = envelope[rows[:, np.newaxis], samples] < floor
+    below[:, -1] = False
+    last_below = np.where(below.any(axis=1), hold - np.argmax(below[:, ::-1], axis=1), -1)
+    start = samples[np.arange(len(rows)), np.maximum(last_below, 0)]
+    previous = envelope[rows, start]
+    following = envelope[rows, np.minimum(start + 1, stacked.shape[1] - 1)]
+    with np.errstate(divide="ignore", invalid="ignore"):
+        fraction = np.clip((floor[:, 0] - previous) / (following - previous), 0.0, 1.0)
+    onsets = np.where(last_below >= 0, start + np.nan_to_num(fraction), triggers.astype(np.float64))
+    return np.split(onsets, np.searchsorted(rows, np.arange(1, len(signals))))
+
+
+"""
+Maps the first channel of every WAV file in smjxs, a list of (wavpath, (sample_rate, smjx)) as built
+by find_pulses.main, see smjx_reader.read_pcm_from_file. Returns the list of read only sample views
+and their shared sample rate.
+"""
+def read_signals(smjxs):
+    signals = []
+    rates = []
+    for wavpath, _ in smjxs:
+        sr, samples = smjx_reader.read_pcm_from_file(wavpath)
+        signals.append(samples[:, 0])
+        rates.append(sr)
+    if len(set(rates)) != 1:
+        raise ValueError("Files in one incident must share a sample rate, got {0}".format(sorted(set(rates))))
+    return signals, rates[0]
+
+
+"""
+Builds the pulse_sample structure that find_pulses.manually_locate_pulses writes from one onset
+sample per file of smjxs, skipping the files whose onset is nan just like a file the user enters
+nothing for. Onsets may be fractional, arrivalTime keeps the sub-sample precision. The weather is
+filled in even when no onset was kept, so the json can still be read by find_location.
+"""
+def pulse_sample_from_onsets(smjxs, onsets, json_filename=None):
+    pulse_sample = {"pulses": [], "weather": {}}
+    for (wavpath, (sr, smjx)), onset in zip(smjxs, onsets):
+        pulse_sample["weather"]["temperature"] = smjx["weather"]["temperature"]
+        pulse_sample["weather"]["windspeed"] = smjx["weather"]["speed"]
+        pulse_sample["weather"]["winddir"] = smjx["weather"]["direction"]
+        pulse_sample["weather"]["humidity"] = smjx["weather"].get("relativeHumidity")
+        if np.isnan(onset):
+            continue
+        start_time = utc_time.parse_utc_ns(smjx["startTimeUTC"])
+        pulse = {"serialNumber": smjx["serialNumber"],
+                 "user_input": int(round(onset)),
+                 "arrivalTime": utc_time.isoformat_utc_ns(utc_time.add_seconds(start_time, onset / sr)),
+                 "location": smjx["geolocation"]}
+        # The GPS pdop and clock error bound of Scepter sensors, for find_location's uncertainty
+        pulse.update({name: smjx[name] for name in ("pdop", "lambda") if name in smjx})
+        pulse["pulseId"] = str(uuid.uuid3(uuid.NAMESPACE_DNS, "{0}{1}".format(wavpath.name,
+                                          pulse["arrivalTime"])))
+        pulse_sample["pulses"].append(pulse)
+    if json_filename is not None:
+        with open(json_filename, "w") as f:
+            f.write(json.dumps(pulse_sample, indent=4, sort_keys=True))
+    return pulse_sample
+
+
+"""
+Reads the PCM samples of every WAV file in smjxs, detects each file's impulse onset and returns the
+same pulse_sample structure that find_pulses.manually_locate_pulses writes, with no user input.
+"""
+def detect_pulses(smjxs, json_filename=None, **detect_args):
+    if not smjxs:
+        return pulse_sample_from_onsets(smjxs, [], json_filename)
+    signals, sr = read_signals(smjxs)
+    return pulse_sample_from_onsets(smjxs, detect_onsets(signals, sr, **detect_args), json_filename)
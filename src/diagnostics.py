@@ -0,0 +1,83 @@
+"""
+diagnostics.py: Structured record of why locations could not be solved, replacing the error.log
+                that loc2D used to configure and write on every call. Each failure is counted by
+                reason. Keeping the records themselves, or writing them to a log file, is switched
+                on once at startup with configure, and only failing solves ever reach this module,
+                so successful solves pay nothing for it.
+
+                Reasons:
+                too_few_pulses     fewer than 3 pulses to locate with
+                singular_geometry  the sensors don't span the plane (A lacks full column rank) or
+                                   its pseudo-inverse could not be computed
+                no_quadratic       the range equation degenerates to a linear one (qA == 0)
+                negative_radicand  the range equation has no real roots
+
+Usage: Keep this file in your working directory and add:
+       import diagnostics
+       diagnostics.configure(keep_records=1000, log_name="diagnostics.log")  (optional, once)
+       diagnostics.counters["negative_radicand"]
+"""
+
+from collections import Counter, deque
+import logging
+import time
+
+
+TOO_FEW_PULSES = "too_few_pulses"
+SINGULAR_GEOMETRY = "singular_geometry"
+NO_QUADRATIC = "no_quadratic"
+NEGATIVE_RADICAND = "negative_radicand"
+
+# Failures counted by reason since start up (or the last reset)
+counters = Counter()
+
+# The most recent failure records when configure asked to keep them, otherwise None
+records = None
+
+# Logger the records are also written to when configure was given a log file, otherwise None
+logger = None
+
+
+"""
+Sets up what happens to failure records beyond counting them. keep_records is how many of the most
+recent records to keep in records, 0 keeps none. log_name is a file each record is appended to, in
+addition, through a logger of its own so the root logger is left alone. Call once at startup, in
+every process that solves.
+"""
+def configure(keep_records=0, log_name=None):
+    global records, logger
+    records = deque(maxlen=keep_records) if keep_records > 0 else None
+    logger = None
+    if log_name is not None:
+        logger = logging.getLogger("location.diagnostics")
+        for handler in list(logger.handlers):
+            logger.removeHandler(handler)
+            handler.close()
+        logger.addHandler(logging.FileHandler(log_name))
+        logger.setLevel(logging.INFO)
+        logger.propagate = False
+
+
+"""
+Counts count failures for reason. details are only looked at, and only formatted when logging,
+if configure asked for records to be kept or logged.
+"""
+def record(reason, count=1, **details):
+    count = int(count)
+    if count == 0:
+        return
+    counters[reason] += count
+    if records is None and logger is None:
+        return
+    entry = {"time": time.time(), "reason": reason, "count": count}
+    entry.update(details)
+    if records is not None:
+        records.append(entry)
+    if logger is not None:
+        logger.info("%s", entry)
+
+
+def reset():
+    counters.clear()
+    if records is not None:
+        records.clear()
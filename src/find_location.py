@@ -2,8 +2,8 @@
 Zac Plett 07/27/2018 - ShotSpotter
 Scott Lamkin 09/13/2022 - ShotSpotter, edits
 
-find_location.py: Class that takes in an array of location_pulses and coerces them to a common UTM 
-                  zone and then computes their location using the loc2D algorithm.
+find_location.py: Class that takes in a pulse_batch and coerces it to a common UTM zone and then
+                  computes its location using the loc2D algorithm.
 
 Usage: Add this file to your working directory and then include it in your import statements with
        the following:
@@ -15,17 +15,19 @@ Arbitrary Array Geometries,” IEEE Transactions on Signal Processing, 41(1), pp
 """
 
 import argparse
-from dateutil.parser import parse
 import json
 import pathlib
 import sys
 
 import numpy as np
 
-from cloud_pulse import cloud_pulse
 import conversion as utm
-from location import location
-from location_pulse import location_pulse
+import diagnostics
+from error import OutOfRangeError
+import grid_search
+from location import Algorithm, Status, confidence_ellipse, error_budget, location, wind_vector
+from pulse_batch import pulse_batch
+import utc_time
 
 
 def parse_json(file_name):
@@ -37,182 +39,295 @@ def parse_arguments():
     parser = argparse.ArgumentParser(description=".json file generated by find_pulses.py to \
                                      locate with")
     parser.add_argument('json_path', type=pathlib.Path, help="path to .json")
+    parser.add_argument('--3d', dest='three_d', action='store_true', help="locate in three dimensions "
+                        "using the sensor elevations, for sensors at different heights")
+    parser.add_argument('--weather', action='store_true', help="correct the speed of sound for the "
+                        "humidity and wind of the weather, by default it comes from the temperature alone")
+    parser.add_argument('--robust', action='store_true', help="leave out sensors whose arrival time "
+                        "disagrees with the rest (an echo for example) before locating")
+    parser.add_argument('--draws', type=int, default=0, help="Monte Carlo draws of the sensor clock "
+                        "and GPS errors to estimate the 95%% confidence ellipse of the location with, "
+                        "0 (the default) skips it")
     args = parser.parse_args()
     return args
 
 
 class location_result:
 
-    def __init__(self, geolocation, discharge_time, self_consistent_error, algorithm, reference_sensor):
+    def __init__(self, geolocation, discharge_time, self_consistent_error, algorithm, reference_sensor,
+                 residual=None, covariance=None, ellipse=None):
         self.geolocation = geolocation
+        # Integer nanoseconds since the Unix epoch, only formatted as a string by as_dict
         self.discharge_time = discharge_time
         self.self_consistent_error = self_consistent_error
         self.algorithm = algorithm
         self.reference_sensor = reference_sensor
+        # For a root refined by location.refine_batch, which moves geolocation and discharge_time,
+        # the mean squared residual (square meters) of the refined location, self_consistent_error
+        # remaining that of the closed form root, and the covariance of easting, northing (and
+        # elevation, in three dimensions) and discharge time in meters and seconds, 3x3 or 4x4. None
+        # for roots that weren't refined.
+        self.residual = residual
+        self.covariance = covariance
+        # For the best root when find_location was asked for draws, its 95% confidence ellipse:
+        # semi_major and semi_minor in meters, orientation of the major axis in degrees clockwise
+        # from north, and solved, the fraction of the draws that had a solution. None otherwise, and
+        # when a sensor didn't report its pdop and clock error bound.
+        self.ellipse = ellipse
+
+    """
+    The JSON ready form of the result, with the discharge time formatted as a UTC string.
+    """
+    def as_dict(self):
+        out = dict(self.__dict__)
+        out["discharge_time"] = utc_time.format_utc_ns(self.discharge_time)
+        return out
 
 
 class find_location:
 
     """
-    Initialization function that takes in an array of location_pulses and then calls the coerce
-    operation on them.
+    Initialization function that takes in a find_pulses.py style json file, or that json already
+    parsed into a dictionary, reads its pulses and then calls the coerce operation on them. A
+    sensor_registry shared between instances saves redoing the geometry work for sensors, and
+    subsets of sensors, that have been seen before. With robust, the sensors that
+    location.ransac_inliers finds disagreeing with the others are left out of the solve and their
+    serial numbers kept in outliers. With three_d the elevations of the sensors are used to locate
+    in three dimensions (location.loc3D_references), falling back to two, at the mean height of the
+    sensors, when the heights can't be resolved, as for sensors that are all at the same height.
+    With use_weather, the humidity and wind of the weather (when present) correct the speed of sound
+    along the direction to every sensor, otherwise it comes from the temperature alone. With draws,
+    the best closed form root gets a 95% confidence ellipse from that many solves of its arrivals
+    and sensor positions perturbed by their reported errors (see uncertainty).
     """
-    def __init__(self, json_file):
+    def __init__(self, json_file, registry=None, robust=False, three_d=False, use_weather=False, draws=0):
         # Class variables
         self.json_file = json_file
-        self.json = parse_json(self.json_file)
+        self.json = json_file if isinstance(json_file, dict) else parse_json(self.json_file)
+        self.registry = registry
+        self.robust = robust
+        self.three_d = three_d
+        self.draws = draws
+        self.outliers = []
+        # The grid_search.grid_result of an incident the closed form couldn't solve, with its heat map
+        self.grid = None
         self.json_pulses = self.json["pulses"]
+        # The location.Status of the incident, set by compute_loc2D, Status.Ok or (from the fewest
+        # sensors that can locate it) Status.Underdetermined when there are locations
+        self.status = Status.Ok
+        if len(self.json_pulses) < 3:
+            # Checked before the weather is read, a json with no pulses may have no weather either
+            diagnostics.record(diagnostics.TOO_FEW_PULSES, pulses=len(self.json_pulses))
+            self.status = Status.TooFewPulses
+            self.computed_locations = []
+            return
         self.weather = self.json["weather"]
         self.temp = self.weather["temperature"]
         self.loc = location()
-        self.speed = self.loc.compute_speed(self.temp)
+        # The wind as an (east, north) velocity in m/s, None for still air
+        self.wind = None
+        if not use_weather:
+            self.speed = self.loc.compute_speed(self.temp)
+        else:
+            self.speed = self.loc.compute_speed(self.temp, self.weather.get("humidity"))
+            if self.weather.get("windspeed") and self.weather.get("winddir") is not None:
+                self.wind = wind_vector(self.weather["windspeed"], self.weather["winddir"])
         self.computed_locations = self.compute_loc2D()
         self.computed_locations.sort(key=lambda x: x.self_consistent_error)
 
 
     """
-    Uses the coerced pulses and computes a location using loc2D.
+    Uses the coerced pulses and computes a location using loc2D. Returns no locations, with the
+    reason in self.status, rather than raising when the incident can't be located.
     """
     def compute_loc2D(self):
-        # Empty pulse and arrival time lists
-        uncoerced_pulses = []
-        arrivals = []
-        # Iterates through the pulses loaded as json objects and creates a cloud pulse object from
-        # each pulse and then a location pulse from the resulting cloud pulse. The data fields of
-        # the location pulse are then loaded into the respective lists
-        for pulse in self.json_pulses:
-            cp = cloud_pulse(pulse)
-            lp = cp.cloud_to_location()
-            arrivals.append(lp.arrival_time)
-            uncoerced_pulses.append(lp)
-        # Coerces the pulses to a common UTM zone
-        coerced_pulses = self.coerce_utm(uncoerced_pulses)
-        # We take the zone letter and number from the first element in the pulses list but could
-        # take them from any arbitrary element in the list as they have all been coerced to the
-        # same UTM zone 
+        # Reads every pulse straight into the columns of a single pulse_batch, which parses the
+        # arrival times and converts the lat / lon coordinates to UTM, coercing the pulses to a
+        # common UTM zone as it goes
+        coerced_pulses = pulse_batch.from_json(self.json_pulses, common_zone=True, registry=self.registry)
+        out = []
+        if len(coerced_pulses) < 3:
+            diagnostics.record(diagnostics.TOO_FEW_PULSES, pulses=len(coerced_pulses))
+            self.status = Status.TooFewPulses
+            return out
+        # We take the zone letter and number from the first pulse but could take them from any
+        # pulse as they have all been coerced to the same UTM zone
         # The common zone number
-        zone_number = coerced_pulses[0].zone_number
+        zone_number = int(coerced_pulses.zone_number[0])
         # The common zone letter
-        zone_letter = coerced_pulses[0].zone_letter
+        zone_letter = str(coerced_pulses.zone_letter[0])
         # The pulses we'll send to loc2D to compute
-        compute_pulses = []
-        for pulse in coerced_pulses:
-            pulse.location[2] = 0.0
-            compute_pulses.append(pulse.location)
-        compute_pulses = np.array(compute_pulses)
-        arrivals = np.array(arrivals)
-        best_index = 0
-        best_error = 10000
-        for i in range(len(arrivals)):
-            # The output from Loc2D
-            loc2D_out = self.loc.loc2D(compute_pulses, arrivals, self.speed)
-            for position_vector, discharge_time, algorithm in loc2D_out:
-                easting = position_vector[0]
-                northing = position_vector[1]
-                elevation = 0.0
-                mse_error = self.compute_mse(compute_pulses, (easting, northing, elevation), arrivals, discharge_time)
-                if mse_error < best_error:
-                    best_error = mse_error
-                    best_index = i
-            compute_pulses = np.roll(compute_pulses, 3)
-            arrivals = np.roll(arrivals, 1)
-        out = []
-        if best_error < 10000:
-            compute_pulses = np.roll(compute_pulses, 3 * best_index)
-            arrivals = np.roll(arrivals, best_index)
-            loc2D_out = self.loc.loc2D(compute_pulses, arrivals, self.speed)
-            for position_vector, discharge_time, algorithm in loc2D_out:
-                easting = position_vector[0]
-                northing = position_vector[1]
-                elevation = 0.0
-                mse_error = self.compute_mse(compute_pulses, (easting, northing, elevation), arrivals, discharge_time)
+        compute_pulses = coerced_pulses.locations
+        if not self.three_d:
+            compute_pulses[:, 2] = 0.0
+        if self.robust:
+            inliers, self.status = self.loc.ransac_inliers(compute_pulses, coerced_pulses.arrival_offset,
+                                                           self.speed)
+            if self.status != Status.Ok:
+                return out
+            if not inliers.all():
+                self.outliers = coerced_pulses.serial_number[~inliers].tolist()
+                coerced_pulses = coerced_pulses.select(inliers)
+                compute_pulses = compute_pulses[inliers]
+        # Arrival times as float seconds after the earliest arrival for the solvers
+        epoch = coerced_pulses.epoch
+        arrival_offsets = coerced_pulses.arrival_offset
+        # Solves with every sensor as the reference at once and keeps the reference whose best
+        # root has the smallest error
+        solved, algorithms = self.solve_references(coerced_pulses, compute_pulses, arrival_offsets, zone_number,
+                                                   zone_letter)
+        if self.wind is not None and (solved[4] == Status.Ok).any():
+            # Corrects the arrivals for the wind along the directions from the solution to the
+            # sensors, with the best still air reference first, and solves again with them, see
+            # location.loc2D_wind_batch
+            errors = np.where(np.isnan(solved[3]), np.inf, solved[3])
+            reference = solved[0][np.unravel_index(np.argmin(errors), errors.shape)[0]]
+            order = (reference + np.arange(len(arrival_offsets))) % len(arrival_offsets)
+            corrected = self.loc.loc2D_wind_batch(compute_pulses[order][np.newaxis],
+                                                  arrival_offsets[order][np.newaxis], self.speed, self.wind)[3]
+            arrival_offsets = np.empty_like(arrival_offsets)
+            arrival_offsets[order] = corrected[0]
+            solved, algorithms = self.solve_references(coerced_pulses, compute_pulses, arrival_offsets,
+                                                       zone_number, zone_letter)
+        references, positions, discharge_times, errors, status = solved
+        if (status == Status.SingularGeometry).all():
+            # The sensors lie on a line, either side of it fits the arrivals equally well
+            self.status = Status.SingularGeometry
+            return out
+        if not (status == Status.Ok).any():
+            # No reference gave real roots, search a grid around the sensors instead
+            return self.grid_fallback(coerced_pulses, compute_pulses, arrival_offsets, zone_number, zone_letter)
+        errors = np.where(np.isnan(errors), np.inf, errors)
+        best_index = np.unravel_index(np.argmin(errors), errors.shape)[0]
+        if errors[best_index].min() >= 10000:
+            self.status = Status.Inconsistent
+            return out
+        reference = references[best_index]
+        # With more than 3 sensors the best root seeds a least squares fit to every arrival
+        best_root = int(np.argmin(errors[best_index]))
+        # The coordinates solved for, a fixed elevation (see location.loc3D_batch) isn't refined
+        k = 3 if algorithms[0] == Algorithm.Reddi3DPositiveRoot else 2
+        refined = None
+        if len(coerced_pulses) > 3:
+            refined = self.loc.refine_batch(compute_pulses[np.newaxis], arrival_offsets[np.newaxis], self.speed,
+                                            positions[best_index, best_root, :k][np.newaxis],
+                                            discharge_times[best_index, best_root][np.newaxis])
+            positions[best_index, best_root, :k] = refined[0][0]
+            discharge_times[best_index, best_root] = refined[1][0]
+        for root, algorithm in enumerate(algorithms):
+            easting, northing = positions[best_index, root, :2]
+            elevation = float(positions[best_index, root, 2]) if positions.shape[-1] == 3 else 0.0
+            discharge_time = int(utc_time.add_seconds(epoch, discharge_times[best_index, root]))
+            try:
                 latlon = utm.to_latlon(easting, northing, zone_number, zone_letter)
-                out.append(location_result([latlon[0], latlon[1], elevation], discharge_time, mse_error,
-                                           algorithm, self.json_pulses[best_index]["serialNumber"]))
-        return out 
+            except OutOfRangeError:
+                # The other root of a well determined incident can land thousands of km away,
+                # outside what UTM can represent, it is no candidate location
+                continue
+            result = location_result([latlon[0], latlon[1], elevation], discharge_time, errors[best_index, root],
+                                     algorithm, str(coerced_pulses.serial_number[reference]))
+            if refined is not None and root == best_root:
+                result.residual = float(refined[2][0])
+                result.covariance = refined[3][0].tolist()
+            if self.draws > 0 and root == best_root:
+                result.ellipse = self.uncertainty(coerced_pulses, compute_pulses, arrival_offsets, reference,
+                                                  positions[best_index, root])
+            out.append(result)
+        self.check_determined(len(coerced_pulses), k + 1)
+        return out
+
+    """
+    Sets Status.Underdetermined for an incident located from no more sensors than the unknowns of
+    the solve (easting, northing, the elevation in three dimensions, and the discharge time): its
+    roots fit exactly whether or not they are right.
+    """
+    def check_determined(self, sensors, unknowns):
+        if sensors <= unknowns and self.status == Status.Ok:
+            self.status = Status.Underdetermined
+
+    """
+    Locates an incident that no reference of the closed form solve has a real root for with
+    grid_search.grid_locate, refining its best cell like the best root when there are more than 3
+    sensors. The result has no reference sensor.
+    """
+    def grid_fallback(self, coerced_pulses, compute_pulses, arrival_offsets, zone_number, zone_letter):
+        self.grid = grid_search.grid_locate(compute_pulses, arrival_offsets, self.speed)
+        if self.grid.error >= 10000:
+            self.status = Status.Inconsistent
+            return []
+        position, discharge_time = self.grid.position, self.grid.discharge_time
+        result = location_result(None, None, self.grid.error, Algorithm.GridSearch, None)
+        if len(coerced_pulses) > 3:
+            refined = self.loc.refine_batch(compute_pulses[np.newaxis], arrival_offsets[np.newaxis], self.speed,
+                                            position[np.newaxis], np.array([discharge_time]))
+            position, discharge_time = refined[0][0], refined[1][0]
+            result.residual = float(refined[2][0])
+            result.covariance = refined[3][0].tolist()
+        latlon = utm.to_latlon(position[0], position[1], zone_number, zone_letter)
+        result.geolocation = [latlon[0], latlon[1], 0.0]
+        result.discharge_time = int(utc_time.add_seconds(coerced_pulses.epoch, discharge_time))
+        self.check_determined(len(coerced_pulses), 3)
+        return [result]
+
+    """
+    The 95% confidence ellipse, as the dict kept in location_result.ellipse, of the solution at
+    position with the given reference sensor. The arrivals and sensor positions are perturbed
+    self.draws times by the errors of the pdop and clock error bound each sensor reported (see
+    location.error_budget) and re-solved in one location.monte_carlo_batch call. None when any
+    sensor didn't report both, its error is unknown.
+    """
+    def uncertainty(self, coerced_pulses, compute_pulses, arrival_offsets, reference, position):
+        order = (reference + np.arange(len(arrival_offsets))) % len(arrival_offsets)
+        arrival_sigma, position_sigma = error_budget(coerced_pulses.pdop[order], coerced_pulses.clock_error[order])
+        if not (np.isfinite(arrival_sigma).all() and np.isfinite(position_sigma).all()):
+            return None
+        covariance, solved = self.loc.monte_carlo_batch(compute_pulses[order][np.newaxis],
+                                                        arrival_offsets[order][np.newaxis], self.speed,
+                                                        position[np.newaxis], arrival_sigma, position_sigma,
+                                                        self.draws)
+        semi_major, semi_minor, orientation = confidence_ellipse(covariance[0])
+        return {"semi_major": float(semi_major), "semi_minor": float(semi_minor),
+                "orientation": float(orientation), "solved": float(solved[0])}
+
+    """
+    loc2D_references, or loc3D_references when locating in three dimensions and that has a
+    solution, for the given (coerced) pulses, their compute_pulses locations and arrival times.
+    Returns the solve and the pair of Algorithm its roots come from.
+    """
+    def solve_references(self, coerced_pulses, compute_pulses, arrival_offsets, zone_number, zone_letter):
+        if self.three_d:
+            *solved, resolved = self.loc.loc3D_references(compute_pulses, arrival_offsets, self.speed)
+            if (resolved & (solved[4] == Status.Ok)).any():
+                # References that didn't resolve the heights are left out for those that did
+                solved[3][~resolved] = np.nan
+                return tuple(solved), (Algorithm.Reddi3DPositiveRoot, Algorithm.Reddi3DNegativeRoot)
+            if (solved[4] == Status.Ok).any():
+                # Solved in two dimensions, at the mean height of the sensors
+                return tuple(solved), (Algorithm.Reddi2DPositiveRoot, Algorithm.Reddi2DNegativeRoot)
+        geometry = None
+        if self.registry is not None:
+            geometry = self.registry.geometry(coerced_pulses.serial_number, zone_number, zone_letter,
+                                              compute_pulses)
+        solved = self.loc.loc2D_references(compute_pulses, arrival_offsets, self.speed, geometry)
+        return solved, (Algorithm.Reddi2DPositiveRoot, Algorithm.Reddi2DNegativeRoot)
 
     """
     Since some of the sensor arrays can span multiple UTM zones, we want to make sure that all of
-    our calculations are done within the same UTM zone. This is done by first iterating over all
-    of the UTM locations and creating a dictionary whose keys are UTM zones and values are
-    individual locations. We then examine the dictionary and evaluate whether or not it has
-    multiple keys. If it doesn't, then all locations correspond to one UTM zone and we're done. If
-    it doesn't, then we coerce all applicable zones to the zone with the majority of the locations.
-    Similarly, we must ensure that our locations are all within the same zone designator (letter),
-    we replicate the same process as for UTM zones within the coercion process.
+    our calculations are done within the same UTM zone. If the pulses don't all correspond to one
+    UTM zone and designator (letter), we coerce them to the zone and designator with the majority
+    of the pulses, dropping any pulse more than one zone away. See pulse_batch.coerce_utm, which
+    compute_loc2D applies while loading through pulse_batch.from_json.
     """
     def coerce_utm(self, utm_before_coerce):
-        # The dictionary to keep track of zone counts
-        zone_dictionary = {}
-        # The dictionary to keep track of designator counts
-        designator_dictionary = {}
-        # Iterates over the dictionary and adds the location <--> zone pairs
-        for loc in utm_before_coerce:
-            zone = loc.zone_number
-            designator = loc.zone_letter
-            if zone not in zone_dictionary:
-                zone_dictionary[zone] = [loc]
-            else:
-                zone_dictionary[zone].append(loc)
-            if designator not in designator_dictionary:
-                designator_dictionary[designator] = [loc]
-            else:
-                designator_dictionary[designator].append(loc)
-        # If all of our locations correspond to the same zone number and letter
-        if len(zone_dictionary) == 1 and len(designator_dictionary) == 1:
-            return list(zone_dictionary.values())[0]
-        # Finds the UTM zone key(s) with the most values
-        max_zone_count = max(len(v) for v in zone_dictionary.values())
-        max_zones = [k for k, v in zone_dictionary.items() if len(v) == max_zone_count]
-        # If there are multiple max zones, it doesn't matter which we choose
-        max_zone = max_zones[0]
-        # Finds the designator key(s) with the most values
-        max_designator_count = max(len(v) for v in designator_dictionary.values())
-        max_designators = [k for k, v in designator_dictionary.items() if len(v) == max_designator_count]
-        # If there are multiple max designators, it doesn't matter which we choose
-        max_designator = max_designators[0]
-        coerced_locations = []
-        # Iterates through the dictionaries entries and coerces the necessary locations,
-        # ignoring those whose inherent zone are 2 or more apart from the computed max_zone value
-        # and stores and returns the resulting coerced locations
-        for zone in zone_dictionary.values():
-            for loc in zone:
-                # If this loc has the correct zone already, we just add it to the list and
-                # move on
-                if loc["zone_number"] == max_zone and loc["zone_letter"] == max_designator:
-                    coerced_locations.append(loc)
-                    continue
-                # If the current loc is 2 or more UTM zones away from the coerce zone, we skip
-                # this loc
-                elif loc["zone_number"] == max_zone - 2 or loc["zone_number"] == max_zone + 2:
-                    continue
-                # Otherwise, if this loc's zone is within +/- 1 of the max_zone, we coerce it
-                # and add it to the list
-                else:
-                    lat_lon = utm.to_latlon(loc["latitude"], loc["longitude"], loc["zone_number"], 
-                                            loc["zone_letter"])
-                    coerced_locations.append(location_pulse(loc["pulse_id"], loc["serial_number"], 
-                                             loc["arrival_time"], utm.from_latlon(lat_lon[0], 
-                                             lat_lon[1], max_zone, max_designator), 
-                                             loc["elevation"]))
-       
-        return coerced_locations
-
-    def compute_mse(self, compute_pulses, computed_location, arrival_times, discharge_time):
-        xyz_diff = compute_pulses - np.array(computed_location)
-        discharge_diffs = np.array([(a.replace(tzinfo=None)-parse(discharge_time)).total_seconds()
-                                    for a in arrival_times])
-        distance = np.sqrt(np.sum(np.square(xyz_diff), axis=1))
-        discharge_distance = np.array([t*self.speed for t in discharge_diffs])
-        diff_sum = np.square(discharge_distance-distance).sum()
-        return diff_sum/discharge_distance.shape[0]
+        return utm_before_coerce.coerce_utm()
 
 
 def main():
     args = parse_arguments()
     json_path = args.json_path
-    location_obj = find_location(json_path)
-    return json.dumps([x.__dict__ for x in location_obj.computed_locations],
+    location_obj = find_location(json_path, robust=args.robust, three_d=args.three_d, use_weather=args.weather,
+                                 draws=args.draws)
+    return json.dumps([x.as_dict() for x in location_obj.computed_locations],
                       sort_keys=True, indent=4)
 
 
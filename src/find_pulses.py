@@ -6,11 +6,14 @@ find_pulses.py: Creates .json file at json_filename containing the locations of
 
 Usage: This file should only be used as a script by pointing to a folder containing ShotSpotter 
        WAV files. arrivalTime is calculated from the user entered sample number and the sample 
-       rate read from the wav specification.
+       rate read from the wav specification. With --auto the impulse onset of each file is
+       detected by detect_pulses.py instead of being entered by the user, and with --tdoa those
+       onsets are then refined by cross correlating the sensors with tdoa.py. With --shots every
+       impulse of a burst is detected and located by multi_shot.py, one status and list of
+       locations per shot.
 """
 
 import argparse
-from datetime import datetime, timedelta
 import glob as gl
 import json
 import os
@@ -20,8 +23,13 @@ import uuid
 import subprocess
 import platform
 
+import detect_pulses
 from find_location import find_location
+from location import Status
+import multi_shot
 import smjx_reader
+import tdoa
+import utc_time
 
 
 json_filename = "wav_pulse_start.json"
@@ -32,6 +40,14 @@ def parse_arguments():
                                      "files, reads the smjx out of them and prepares file for "
                                      "user input.")
     parser.add_argument('wavs_path', type=pathlib.Path, help="path to folder")
+    parser.add_argument('--auto', action='store_true', help="detect the impulse onsets instead of "
+                        "prompting for them")
+    parser.add_argument('--tdoa', action='store_true', help="refine the detected onsets by cross "
+                        "correlating every pair of sensors, implies --auto")
+    parser.add_argument('--shots', action='store_true', help="detect and locate every shot of a burst "
+                        "rather than the first, implies --auto")
+    parser.add_argument('--weather', action='store_true', help="correct the speed of sound for the humidity "
+                        "and wind of the weather, as find_location.py --weather")
     args = parser.parse_args()
     return args
 
@@ -58,18 +74,20 @@ def manually_locate_pulses(smjxs):
                            "file: ".format(wavpath)).split(",")
         if user_input != [""]:
             pulse = {"serialNumber": smjx["serialNumber"]}
-            startTimeUTC = datetime.strptime(smjx["startTimeUTC"], "%Y-%m-%dT%H:%M:%S.%fZ")
+            startTimeUTC = utc_time.parse_utc_ns(smjx["startTimeUTC"])
             pulse["user_input"] = int(user_input[0])
             pulse_offset = pulse["user_input"]/sr
-            offset = timedelta(seconds=pulse_offset)
-            pulse["arrivalTime"] = (startTimeUTC+offset).strftime("%Y-%m-%dT%H:%M:%S.%fZ")
+            pulse["arrivalTime"] = utc_time.isoformat_utc_ns(utc_time.add_seconds(startTimeUTC, pulse_offset))
             pulse["location"] = smjx["geolocation"]
+            # Scepter sensors also report their GPS pdop and clock error bound (lambda)
+            pulse.update({name: smjx[name] for name in ("pdop", "lambda") if name in smjx})
             pulse["pulseId"] = str(uuid.uuid3(uuid.NAMESPACE_DNS, "{0}{1}".format(wavpath.name, 
                                    pulse["arrivalTime"])))
             pulse_sample["pulses"].append(pulse)
             pulse_sample["weather"]["temperature"] = smjx["weather"]["temperature"]
             pulse_sample["weather"]["windspeed"] = smjx["weather"]["speed"]
             pulse_sample["weather"]["winddir"] = smjx["weather"]["direction"]
+            pulse_sample["weather"]["humidity"] = smjx["weather"].get("relativeHumidity")
         with open(json_filename, "w") as f:
             f.write(json.dumps(pulse_sample, indent=4, sort_keys=True))
     return pulse_sample
@@ -82,9 +100,19 @@ def main():
         wavdata = []
         for wavpath in gl_wavs_path:
             wavdata.append((wavpath, smjx_reader.read_smjx_from_file(wavpath)))
-        manually_locate_pulses(wavdata)
-    loc_3d_obj = find_location(json_filename)
-    return json.dumps([x.__dict__ for x in loc_3d_obj.computed_locations], sort_keys=True,
+        if args.shots:
+            shots = multi_shot.detect_shots(wavdata, json_filename)
+            results, status = multi_shot.locate_shots(shots["shots"], use_weather=args.weather)
+            return json.dumps([{"status": Status(code).name, "locations": [x.as_dict() for x in shot]}
+                               for shot, code in zip(results, status.tolist())], sort_keys=True, indent=4)
+        if args.tdoa:
+            tdoa.tdoa_pulses(wavdata, json_filename)
+        elif args.auto:
+            detect_pulses.detect_pulses(wavdata, json_filename)
+        else:
+            manually_locate_pulses(wavdata)
+    loc_3d_obj = find_location(json_filename, use_weather=args.weather)
+    return json.dumps([x.as_dict() for x in loc_3d_obj.computed_locations], sort_keys=True,
                       indent=4)
 
 
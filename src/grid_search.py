@@ -0,0 +1,136 @@
+"""
+grid_search.py: Search grid locator, the fallback for incidents the closed form solvers in
+                location.py find no real root for. The TDOA residual of every cell of a square
+                grid around the sensor array is evaluated, and the grid is shrunk around the best
+                cell and evaluated again until its cells are finer than the resolution asked for.
+
+                The residual of a cell is the mean squared difference, in square meters, between
+                the distance from the cell to each sensor and the distance sound travels between
+                the discharge and that sensor's arrival, with the discharge time that fits the cell
+                best, so it is directly comparable to location.compute_mse. Cells are evaluated by
+                broadcasting grid rows x columns x sensors, a tile of rows at a time so that memory
+                stays bounded however large the grid, and tiles can be spread over worker
+                processes.
+
+Usage: Keep this file in your working directory and add:
+       import grid_search
+       result = grid_search.grid_locate(locations, arrivals, speed)
+"""
+
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+
+
+"""
+The minimum residual location found by grid_locate: position (easting, northing), discharge_time
+in the timebase of the arrivals, error the residual there in square meters, and heat_map the
+residual of every cell of the first, coarsest grid, one row per northing in northings and one
+column per easting in eastings.
+"""
+class grid_result:
+
+    def __init__(self, position, discharge_time, error, heat_map, eastings, northings):
+        self.position = position
+        self.discharge_time = discharge_time
+        self.error = error
+        self.heat_map = heat_map
+        self.eastings = eastings
+        self.northings = northings
+
+
+"""
+The row slices of a grid of rows x columns cells to evaluate at a time, each holding at most
+tile_cells cells (at least one row).
+"""
+def tiles(rows, columns, tile_cells):
+    step = max(1, tile_cells // max(1, columns))
+    for start in range(0, rows, step):
+        yield slice(start, min(start + step, rows))
+
+
+"""
+The (len(northings), len(eastings)) residuals of the cells at every easting / northing pair, and
+the discharge time, in seconds, that fits each cell best. locations are the (M, 2|3) sensor
+positions and arrivals their (M,) arrival times in seconds.
+"""
+def tile_residuals(locations, arrivals, speed, eastings, northings):
+    dx = eastings[np.newaxis, :, np.newaxis] - locations[:, 0]
+    dy = northings[:, np.newaxis, np.newaxis] - locations[:, 1]
+    # How far each sound traveled less how far the cell is from its sensor: speed times the
+    # discharge time for a perfect fit, whatever the discharge time is
+    lag = speed * arrivals - np.sqrt(dx * dx + dy * dy)
+    offset = lag.mean(axis=-1)
+    lag -= offset[..., np.newaxis]
+    return np.einsum("rcm,rcm->rc", lag, lag) / len(arrivals), offset / speed
+
+
+def evaluate_tile(arguments):
+    return tile_residuals(*arguments)
+
+
+"""
+Residuals and best fitting discharge times of the whole grid spanned by eastings and northings,
+evaluated a tile of at most tile_cells cells at a time (see tiles), mapped over executor (a
+concurrent.futures executor) when one is given.
+"""
+def grid_residuals(locations, arrivals, speed, eastings, northings, tile_cells=2**16, executor=None):
+    locations = np.asarray(locations, dtype=np.float64)
+    arrivals = np.asarray(arrivals, dtype=np.float64)
+    residuals = np.empty((len(northings), len(eastings)))
+    discharge_times = np.empty_like(residuals)
+    # Bounds the (rows, columns, sensors) arrays of a tile rather than just its cells
+    tile_cells = max(1, tile_cells // len(arrivals))
+    work = ((locations, arrivals, speed, eastings, northings[rows])
+            for rows in tiles(len(northings), len(eastings), tile_cells))
+    row_slices = tiles(len(northings), len(eastings), tile_cells)
+    evaluated = map(evaluate_tile, work) if executor is None else executor.map(evaluate_tile, work)
+    for rows, (residual, discharge_time) in zip(row_slices, evaluated):
+        residuals[rows], discharge_times[rows] = residual, discharge_time
+    return residuals, discharge_times
+
+
+"""
+Locates an incident of M >= 3 sensors at (M, 2|3) locations with (M,) arrival times in seconds by
+coarse to fine grid search. The first grid has cells x cells cells centered on the centroid of the
+sensors and reaching half_width meters either side of it, by default twice the distance of the
+farthest sensor from the centroid. Each following grid has the same number of cells, spanning two
+cells of the previous one either side of its best cell, until the cells are at most resolution
+meters apart or after levels grids. With workers > 1 the tiles of every grid are evaluated on
+that many processes, which only pays for grids of millions of cells. Returns a grid_result.
+"""
+def grid_locate(locations, arrivals, speed, half_width=None, cells=101, resolution=0.1, levels=10,
+                tile_cells=2**16, workers=0):
+    locations = np.asarray(locations, dtype=np.float64)[:, :2]
+    arrivals = np.asarray(arrivals, dtype=np.float64)
+    if len(arrivals) < 3:
+        raise ValueError("Insufficient number of pulses, 3 or more needed to compute a location.")
+    center = locations.mean(axis=0)
+    if half_width is None:
+        half_width = 2 * max(np.sqrt(np.sum((locations - center)**2, axis=1)).max(), 100.0)
+    if workers > 1:
+        with ProcessPoolExecutor(max_workers=workers) as pool:
+            return search(locations, arrivals, speed, center, half_width, cells, resolution, levels, tile_cells,
+                          pool)
+    return search(locations, arrivals, speed, center, half_width, cells, resolution, levels, tile_cells)
+
+
+"""
+The coarse to fine loop of grid_locate, evaluating tiles on executor when one is given.
+"""
+def search(locations, arrivals, speed, center, half_width, cells, resolution, levels, tile_cells, executor=None):
+    coarse = None
+    for _ in range(levels):
+        eastings = np.linspace(center[0] - half_width, center[0] + half_width, cells)
+        northings = np.linspace(center[1] - half_width, center[1] + half_width, cells)
+        residuals, discharge_times = grid_residuals(locations, arrivals, speed, eastings, northings, tile_cells,
+                                                    executor)
+        if coarse is None:
+            coarse = (residuals, eastings, northings)
+        row, column = np.unravel_index(np.argmin(residuals), residuals.shape)
+        center = np.array([eastings[column], northings[row]])
+        step = eastings[1] - eastings[0]
+        if step <= resolution:
+            break
+        half_width = 2 * step
+    return grid_result(center, float(discharge_times[row, column]), float(residuals[row, column]), *coarse)
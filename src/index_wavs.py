@@ -0,0 +1,184 @@
+"""
+index_wavs.py: Builds a columnar index of the smjx metadata of every ShotSpotter WAV file below a
+               folder, reading the files with a pool of worker processes. The index is a
+               compressed .npz file holding one array per column. Rerunning against an existing
+               index only reads the files that are new or whose modification time or size have
+               changed, and drops the files that no longer exist.
+
+Usage: This file should be used as a script by pointing to the root folder of a WAV archive:
+
+       python src/index_wavs.py "/path/to/ShotSpotter/wav/archive/" --index wav_index.npz
+
+       On import, load_index returns the columns of an index file as a dictionary of arrays.
+"""
+
+import argparse
+from concurrent.futures import ProcessPoolExecutor
+import logging
+import os
+import pathlib
+import sys
+import time
+import zlib
+
+import numpy as np
+
+import smjx_reader
+import utc_time
+
+
+logger = logging.getLogger("index_wavs")
+
+
+index_filename = "wav_index.npz"
+
+# Column name to dtype, the order columns are stored in
+COLUMNS = {"path": np.str_,
+           "mtime_ns": np.int64,
+           "size": np.int64,
+           "serial_number": np.str_,
+           "start_time_ns": np.int64,
+           "duration": np.float64,
+           "latitude": np.float64,
+           "longitude": np.float64,
+           "elevation": np.float64,
+           "temperature": np.float64,
+           "wind_speed": np.float64,
+           "wind_direction": np.float64,
+           "relative_humidity": np.float64,
+           "sample_rate": np.int32}
+
+
+def parse_arguments():
+    parser = argparse.ArgumentParser(description="Recursively indexes the smjx metadata of the "
+                                     "ShotSpotter .wav files in wavs_path.")
+    parser.add_argument('wavs_path', type=pathlib.Path, help="root folder of the WAV archive")
+    parser.add_argument('--index', type=pathlib.Path, default=pathlib.Path(index_filename),
+                        help="index file to create or update")
+    parser.add_argument('--workers', type=int, default=os.cpu_count(),
+                        help="number of worker processes reading files")
+    args = parser.parse_args()
+    return args
+
+
+"""
+Every .wav file below root with its modification time and size, found with os.scandir so each
+directory is listed once and the stat comes from the directory entry where the OS provides it.
+"""
+def find_wavs(root):
+    paths = []
+    mtimes = []
+    sizes = []
+    folders = [str(root)]
+    while folders:
+        with os.scandir(folders.pop()) as entries:
+            for entry in entries:
+                if entry.is_dir(follow_symlinks=False):
+                    folders.append(entry.path)
+                elif entry.name.lower().endswith(".wav") and entry.is_file():
+                    stat = entry.stat()
+                    paths.append(entry.path)
+                    mtimes.append(stat.st_mtime_ns)
+                    sizes.append(stat.st_size)
+    return paths, mtimes, sizes
+
+
+def number(value):
+    return np.nan if value is None else float(value)
+
+
+"""
+Reads one file's metadata as a tuple of the non stat columns, or None if it isn't a ShotSpotter
+WAV file: unreadable, with a corrupt compressed smjx chunk or missing a required field. Skipped
+files are logged, one bad file never stops the run. Runs in the worker processes.
+"""
+def read_wav_metadata(wavpath):
+    try:
+        sr, smjx = smjx_reader.read_smjx_from_file(wavpath)
+        geolocation = smjx.get("geolocation", {})
+        weather = smjx.get("weather", {})
+        return (smjx["serialNumber"],
+                utc_time.parse_utc_ns(smjx["startTimeUTC"]),
+                number(smjx.get("duration")),
+                number(geolocation.get("latitude")),
+                number(geolocation.get("longitude")),
+                number(geolocation.get("elevation")),
+                number(weather.get("temperature")),
+                number(weather.get("speed")),
+                number(weather.get("direction")),
+                number(weather.get("relativeHumidity")),
+                sr)
+    except (IOError, ValueError, KeyError, zlib.error) as e:
+        logger.warning("Skipping %s: %r", wavpath, e)
+        return None
+
+
+def load_index(index_path):
+    if not os.path.exists(index_path):
+        return {name: np.array([], dtype=dtype) for name, dtype in COLUMNS.items()}
+    with np.load(index_path, allow_pickle=False) as index:
+        return {name: index[name] for name in COLUMNS}
+
+
+def save_index(index_path, columns):
+    # np.savez appends .npz to names without it, write to the exact path instead
+    with open(index_path, "wb") as f:
+        np.savez_compressed(f, **columns)
+
+
+"""
+Creates or updates the index at index_path for the WAV files below root. Returns the new index
+columns and a dictionary of counts: files found, files read, files reused from the previous index
+and files that could not be read.
+"""
+def build_index(root, index_path, workers):
+    paths, mtimes, sizes = find_wavs(root)
+    previous = load_index(index_path)
+    previous_rows = {path: row for row, path in enumerate(previous["path"].tolist())}
+    reused = []
+    stale = []
+    for i, path in enumerate(paths):
+        row = previous_rows.get(path)
+        if row is not None and previous["mtime_ns"][row] == mtimes[i] and previous["size"][row] == sizes[i]:
+            reused.append((i, row))
+        else:
+            stale.append(i)
+    metadata = []
+    if stale:
+        stale_paths = [paths[i] for i in stale]
+        if workers > 1:
+            with ProcessPoolExecutor(max_workers=workers) as pool:
+                metadata = list(pool.map(read_wav_metadata, stale_paths,
+                                         chunksize=max(1, len(stale_paths) // (workers * 8))))
+        else:
+            metadata = [read_wav_metadata(path) for path in stale_paths]
+    read = [(i, row) for i, row in zip(stale, metadata) if row is not None]
+    # Stat columns come from the walk, the rest from the previous index or the files just read
+    order = np.array([i for i, _ in reused] + [i for i, _ in read], dtype=np.int64)
+    columns = {"path": np.array(paths, dtype=np.str_)[order],
+               "mtime_ns": np.array(mtimes, dtype=np.int64)[order],
+               "size": np.array(sizes, dtype=np.int64)[order]}
+    reused_rows = np.array([row for _, row in reused], dtype=np.int64)
+    read_columns = list(zip(*[row for _, row in read])) if read else [[] for _ in range(len(COLUMNS) - 3)]
+    for name, read_column in zip(list(COLUMNS)[3:], read_columns):
+        columns[name] = np.concatenate((previous[name][reused_rows].astype(COLUMNS[name]),
+                                        np.array(read_column, dtype=COLUMNS[name])))
+    save_index(index_path, columns)
+    counts = {"found": len(paths), "read": len(read), "reused": len(reused),
+              "unreadable": len(stale) - len(read)}
+    return columns, counts
+
+
+def main():
+    args = parse_arguments()
+    start = time.perf_counter()
+    _, counts = build_index(args.wavs_path, args.index, args.workers)
+    elapsed = time.perf_counter() - start
+    sys.stdout.write("{found} files found, {read} read, {reused} unchanged, {unreadable} unreadable\n".format(
+        **counts))
+    sys.stdout.write("{0:.0f} files/s with {1} workers\n".format(counts["found"] / elapsed, args.workers))
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
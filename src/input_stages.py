@@ -0,0 +1,250 @@
+"""
+input_stages.py: The benchmark.py stages of reading input: pulse json, UTM conversion and zone
+                 coercion, smjx parsing, the PCM views of recordings, indexing WAV files, pulse
+                 detection, TDOA and bursts of shots.
+
+Usage: Run through benchmark.py, for example:
+       python src/benchmark.py pcm --seconds 60 600
+"""
+
+import glob
+import os
+import pathlib
+import sys
+import tempfile
+import time
+import tracemalloc
+
+import numpy as np
+
+from cloud_pulse import cloud_pulse
+import conversion as utm
+import detect_pulses
+import index_wavs
+from location import Status, location
+import multi_shot
+from pulse_batch import pulse_batch
+import smjx_reader
+from synthetic import example_wavs, stretched_wav, synthetic_burst, synthetic_json_pulses, timed
+import tdoa
+import utc_time
+
+
+"""
+Time and memory to load pulses one cloud_pulse / location_pulse at a time against loading them
+all into a single pulse_batch.
+"""
+def bench_pulses(pulses, seed):
+    json_pulses = synthetic_json_pulses(pulses, seed)
+    # Per pulse objects are slow, so only a slice of the pulses goes through them
+    object_count = min(pulses, 20000)
+
+    def objects():
+        return [cloud_pulse(pulse).cloud_to_location() for pulse in json_pulses[:object_count]]
+
+    results = []
+    for name, func, count in (("per pulse objects", objects, object_count),
+                              ("pulse_batch", lambda: pulse_batch.from_json(json_pulses), pulses)):
+        tracemalloc.start()
+        elapsed, _ = timed(func, repeat=1)
+        _, peak = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+        results.append((name, count / elapsed, peak / count))
+    for name, rate, memory in results:
+        sys.stdout.write("{0:18s} {1:10.0f} pulses/s {2:10.0f} peak bytes/pulse\n".format(name, rate, memory))
+
+
+"""
+Converts points spread over the zones either side of Chicago (84 and 90 degrees west) to UTM and
+back, one point at a time against a single element-wise call.
+"""
+def bench_utm(points, seed):
+    rng = np.random.default_rng(seed)
+    latitude = rng.uniform(38.0, 44.0, points)
+    longitude = rng.uniform(-93.0, -81.0, points)
+    # The per point loop only gets a slice of the points, it is far too slow for all of them
+    loop_count = min(points, 20000)
+
+    def loop():
+        out = []
+        for lat, lon in zip(latitude[:loop_count].tolist(), longitude[:loop_count].tolist()):
+            easting, northing, zone_number, zone_letter = utm.from_latlon(lat, lon)
+            out.append(utm.to_latlon(easting, northing, zone_number, zone_letter))
+        return out
+
+    def vectorized():
+        easting, northing, zone_number, zone_letter = utm.from_latlon(latitude, longitude)
+        return utm.to_latlon(easting, northing, zone_number, zone_letter)
+
+    loop_time, loop_out = timed(loop, repeat=1)
+    vectorized_time, (lat_out, lon_out) = timed(vectorized)
+    difference = np.abs(np.array(loop_out) - np.stack((lat_out, lon_out), axis=1)[:loop_count]).max()
+    sys.stdout.write("per point loop: {0:12.0f} points/s round trip\n".format(loop_count / loop_time))
+    sys.stdout.write("array call:     {0:12.0f} points/s round trip\n".format(points / vectorized_time))
+    sys.stdout.write("max |loop - array| difference: {0:.3e} deg\n".format(difference))
+
+
+"""
+Per incident cost of loading pulses into a pulse_batch coerced to a common UTM zone, and of
+coerce_utm on an already projected batch, for sensor arrays inside a UTM zone (87.6 W) against
+arrays straddling the zone boundaries at 84 W and 90 W.
+"""
+def bench_coerce(incidents, sensors, seed):
+    rng = np.random.default_rng(seed)
+    for name, center in (("interior 87.6W", -87.6), ("boundary 84W", -84.0), ("boundary 90W", -90.0)):
+        incident_pulses = []
+        for _ in range(incidents):
+            pulses = synthetic_json_pulses(sensors, int(rng.integers(2**32)))
+            for pulse, longitude in zip(pulses, center + rng.uniform(-0.03, 0.03, sensors)):
+                pulse["location"]["longitude"] = longitude
+            incident_pulses.append(pulses)
+        load_time, batches = timed(lambda: [pulse_batch.from_json(pulses, common_zone=True)
+                                            for pulses in incident_pulses])
+        uncoerced = [pulse_batch.from_json(pulses) for pulses in incident_pulses]
+        coerce_time, _ = timed(lambda: [batch.coerce_utm() for batch in uncoerced])
+        kept = sum(len(batch) for batch in batches) / (incidents * sensors)
+        sys.stdout.write("{0:15s} load {1:7.1f} us/incident, coerce_utm {2:7.1f} us/incident "
+                         "({3:.0%} of pulses kept)\n".format(name, 1e6 * load_time / incidents,
+                                                             1e6 * coerce_time / incidents, kept))
+
+
+"""
+Writes copies of the ScepterTest example WAV with its audio stretched to each length and times
+reading the smjx metadata from them, against reading the whole file into memory first.
+"""
+def bench_smjx(lengths):
+    with tempfile.TemporaryDirectory() as directory:
+        for seconds in lengths:
+            wavpath, smj_name = stretched_wav(directory, seconds)
+
+            def whole_file():
+                chunk_names, _, chunks = smjx_reader.read_RIFF_chunks(smjx_reader.read_wav_into_binary(wavpath))
+                return smjx_reader.parse_smjx_chunk(chunks[chunk_names.index(smj_name)])
+
+            whole_time, _ = timed(whole_file)
+            header_time, _ = timed(smjx_reader.read_smjx_from_file, wavpath)
+            sys.stdout.write("{0:8.0f} s recording: whole file {1:9.3f} ms, chunk headers {2:7.3f} ms\n".format(
+                seconds, 1e3 * whole_time, 1e3 * header_time))
+
+
+"""
+Builds an archive of incident folders by hard linking the example WAV files over and over, then
+times a fresh index of it with each number of workers and an incremental rerun.
+"""
+def bench_index(files, workers):
+    examples = sorted(glob.glob(os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "examples",
+                                             "*", "*.wav")))
+    with tempfile.TemporaryDirectory() as directory:
+        for i in range(files):
+            folder = os.path.join(directory, "incident_{0:05d}".format(i // len(examples)))
+            os.makedirs(folder, exist_ok=True)
+            os.link(examples[i % len(examples)], os.path.join(folder, "{0:05d}.wav".format(i)))
+        index_path = os.path.join(directory, "index.npz")
+        for count in workers:
+            if os.path.exists(index_path):
+                os.remove(index_path)
+            start = time.perf_counter()
+            index_wavs.build_index(directory, index_path, count)
+            elapsed = time.perf_counter() - start
+            sys.stdout.write("{0} workers: {1:10.0f} files/s\n".format(count, files / elapsed))
+        start = time.perf_counter()
+        _, counts = index_wavs.build_index(directory, index_path, max(workers))
+        elapsed = time.perf_counter() - start
+        sys.stdout.write("incremental rerun: {0:10.0f} files/s ({1} unchanged)\n".format(
+            files / elapsed, counts["reused"]))
+
+
+"""
+Times taking window seconds of samples, as sound pressure, from the middle of copies of the
+ScepterTest example WAV stretched to each length: through smjx_reader.open_pcm, which maps the
+file and touches only the window, against reading the whole file into memory and viewing it with
+pcm_from_bytes.
+"""
+def bench_pcm(lengths, window):
+    with tempfile.TemporaryDirectory() as directory:
+        for seconds in lengths:
+            wavpath, _ = stretched_wav(directory, seconds)
+
+            def whole_file():
+                recording = smjx_reader.pcm_from_bytes(smjx_reader.read_wav_into_binary(wavpath))
+                start = recording.start_time + int(seconds / 2 * 1e9)
+                return recording.pressure(recording.window(start, start + int(window * 1e9)))
+
+            def mapped():
+                recording = smjx_reader.open_pcm(wavpath)
+                start = recording.start_time + int(seconds / 2 * 1e9)
+                return recording.pressure(recording.window(start, start + int(window * 1e9)))
+
+            whole_time, _ = timed(whole_file)
+            mapped_time, samples = timed(mapped)
+            sys.stdout.write("{0:8.0f} s recording, {1:.0f} ms window ({2} samples): read whole {3:9.3f} ms, "
+                             "mapped {4:7.3f} ms\n".format(seconds, 1e3 * window, len(samples), 1e3 * whole_time,
+                                                          1e3 * mapped_time))
+
+
+"""
+Times onset detection for every sensor of an example incident, reading the PCM and detecting
+separately.
+"""
+def bench_detect(incident):
+    wavpaths = example_wavs(incident)
+    read_time, pcm = timed(lambda: [smjx_reader.read_pcm_from_file(wavpath) for wavpath in wavpaths])
+    signals = [samples[:, 0] for _, samples in pcm]
+    detect_time, onsets = timed(detect_pulses.detect_onsets, signals, pcm[0][0])
+    sys.stdout.write("{0} sensors, {1} samples each: read {2:.2f} ms, detect {3:.2f} ms\n".format(
+        len(signals), max(len(signal) for signal in signals), 1e3 * read_time, 1e3 * detect_time))
+    sys.stdout.write("onsets: {0}\n".format(np.round(onsets, 2).tolist()))
+
+
+"""
+Times each stage of tdoa.tdoa_pulses for one example incident: reading the PCM, detecting the coarse
+onsets and the cross correlation refinement, which is also timed with the sensors duplicated to
+show how the pairwise cost grows.
+"""
+def bench_tdoa(incident):
+    wavpaths = [pathlib.Path(wavpath) for wavpath in example_wavs(incident)]
+    smjxs = [(wavpath, smjx_reader.read_smjx_from_file(wavpath)) for wavpath in wavpaths]
+    read_time, (signals, sr) = timed(detect_pulses.read_signals, smjxs)
+    detect_time, onsets = timed(detect_pulses.detect_onsets, signals, sr)
+    smjx_list = [smjx for _, (_, smjx) in smjxs]
+    start_times = np.array([utc_time.parse_utc_ns(smjx["startTimeUTC"]) for smjx in smjx_list])
+    offsets = utc_time.seconds_since(start_times, start_times.min())
+    positions = tdoa.sensor_positions([smjx["geolocation"]["latitude"] for smjx in smjx_list],
+                                      [smjx["geolocation"]["longitude"] for smjx in smjx_list])
+    speed = location().compute_speed(smjx_list[0]["weather"]["temperature"])
+    sys.stdout.write("{0} sensors: read {1:.2f} ms, detect {2:.2f} ms\n".format(len(signals), 1e3 * read_time,
+                                                                              1e3 * detect_time))
+    for copies in (1, 2, 4):
+        refine_time, (refined, _, _) = timed(tdoa.refine_onsets, signals * copies, sr, np.tile(offsets, copies),
+                                             np.tile(positions, (copies, 1)), speed, np.tile(onsets, copies))
+        m = len(signals) * copies
+        sys.stdout.write("{0:3d} sensors, {1:4d} pairs: refine {2:.2f} ms\n".format(m, m * (m - 1) // 2,
+                                                                                1e3 * refine_time))
+        if copies == 1:
+            sys.stdout.write("refinement (samples): {0}\n".format(np.round(refined - onsets, 2).tolist()))
+
+
+"""
+Detects, groups and locates every shot of synthetic bursts of each number of shots, timing the
+stages of multi_shot separately, and reports how many rounds were found, how many were heard by
+too few sensors to be checked, and how far the located shots land from the source.
+"""
+def bench_shots(shot_counts, sensors, interval, seed):
+    for shots in shot_counts:
+        smjxs, signals, arrivals, source = synthetic_burst(shots, sensors, interval, seed)
+        sr = smjxs[0][1][0]
+        detect_time, onsets = timed(detect_pulses.detect_all_onsets, signals, sr)
+        positions = tdoa.sensor_positions([smjx["geolocation"]["latitude"] for _, (_, smjx) in smjxs],
+                                          [smjx["geolocation"]["longitude"] for _, (_, smjx) in smjxs])
+        speed = location().compute_speed(20.0)
+        group_time, grouped = timed(multi_shot.group_shots, [onset / sr for onset in onsets], positions, speed)
+        samples = [detect_pulses.pulse_sample_from_onsets(smjxs, shot * sr) for shot in grouped]
+        locate_time, (results, status) = timed(multi_shot.locate_shots, samples)
+        found = [result[0] for result in results if result]
+        eastings = [utm.from_latlon(result.geolocation[0], result.geolocation[1], 16, "T")[:2] for result in found]
+        misses = np.linalg.norm(np.array(eastings).reshape(-1, 2) - source, axis=1)
+        sys.stdout.write("{0:3d} rounds: {1:3d} grouped, {2:3d} located, {3:3d} underdetermined (median miss {4:6.2f} m)"
+                         "  detect {5:7.2f} ms  group {6:6.2f} ms  locate {7:7.2f} ms\n".format(
+                             shots, len(grouped), len(found), int(np.sum(status == Status.Underdetermined)),
+                             np.median(misses) if len(misses) else np.nan,
+                             1e3 * detect_time, 1e3 * group_time, 1e3 * locate_time))
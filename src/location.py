@@ -7,106 +7,804 @@ location.py: Rewritten Loc2D algorithm using multilateration in python.
              times, and the speed of sound. Computing a location if one is possible.
 """
 
-from datetime import datetime
-from enum import Enum
-import logging
+from enum import Enum, IntEnum
+import functools
+import itertools
 
 import numpy as np
 
+import diagnostics
+
 
 class Algorithm(str, Enum):
     Reddi2DPositiveRoot = "Reddi2DPositiveRoot"
     Reddi2DNegativeRoot = "Reddi2DNegativeRoot"
+    Reddi3DPositiveRoot = "Reddi3DPositiveRoot"
+    Reddi3DNegativeRoot = "Reddi3DNegativeRoot"
+    # The fallback of find_location when no closed form root exists, see grid_search.py
+    GridSearch = "GridSearch"
+
+
+"""
+Why a solve did or didn't produce roots. The batched solvers return one per incident in an int8
+status array, compare it against these values (status == Status.Ok) rather than catching anything.
+The failures match the reasons counted in diagnostics.py.
+"""
+class Status(IntEnum):
+    Ok = 0
+    TooFewPulses = 1
+    SingularGeometry = 2
+    NoQuadratic = 3
+    NegativeRadicand = 4
+    # Real roots were found but none of them agrees with the arrival times (find_location only)
+    Inconsistent = 5
+    # Located from only as many sensors as unknowns (3 in two dimensions, 4 in three), so every root
+    # fits the arrivals exactly and its self consistent error checks nothing (find_location only)
+    Underdetermined = 6
+
+
+"""
+What loc2D returns: its list of (position, discharge time, Algorithm) roots, empty when the solve
+failed, along with the Status saying why. Being a list, callers that only iterate the roots need
+no special case for failures.
+"""
+class loc2D_result(list):
+
+    def __init__(self, status=Status.Ok, roots=()):
+        super().__init__(roots)
+        self.status = status
+
+    """
+    One loc2D_result per incident of the (positions, discharge_times, status) arrays returned by
+    loc2D_batch, with discharge times in the same timebase as the arrivals given to it.
+    """
+    @staticmethod
+    def from_batch(positions, discharge_times, status):
+        algorithms = (Algorithm.Reddi2DPositiveRoot, Algorithm.Reddi2DNegativeRoot)
+        return [loc2D_result(Status(code), [(vectors[root].tolist(), float(times[root]), algorithms[root])
+                                            for root in range(2)] if code == Status.Ok else ())
+                for vectors, times, code in zip(positions, discharge_times, status.tolist())]
+
+
+"""
+Whether each of a stack of (..., K, 2) A matrices has full column rank, judged from the determinant
+of its 2x2 normal matrix relative to that matrix's scale. ata, that normal matrix, may be passed
+when it has already been computed.
+"""
+def full_column_rank(a, ata=None):
+    if ata is None:
+        ata = np.einsum("...ij,...ik->...jk", a, a)
+    det = ata[..., 0, 0] * ata[..., 1, 1] - ata[..., 0, 1] * ata[..., 1, 0]
+    return np.abs(det) > 1e-12 * (ata[..., 0, 0] + ata[..., 1, 1])**2
+
+
+"""
+The parts of loc2D that depend only on where the sensors are, for one sensor set and reference:
+the reference position, rSquared and pinv(A), the pseudo-inverse of A. locations are ordered as
+loc2D takes them, reference first. The pseudo-inverse and rSquared may be passed in when they have
+already been computed, as reference_geometry.prepared does.
+"""
+class prepared_geometry:
+
+    def __init__(self, locations, pinv=None, r_squared=None, full_rank=None):
+        locations = np.asarray(locations, dtype=np.float64)
+        self.reference = locations[0, :2].tolist()
+        if pinv is None:
+            a = locations[1:, :2] - locations[0, :2]
+            r_squared = np.einsum("ij,ij->i", a, a)
+            pinv = np.linalg.pinv(a)
+            full_rank = bool(full_column_rank(a))
+        self.pinv = pinv
+        self.r_squared = r_squared
+        # False when the sensors are (nearly) collinear and pinv(A) only gives a least norm answer
+        self.full_rank = full_rank
+
+
+"""
+The parts of loc2D that depend only on where the sensors are, for an incident of M sensors solved
+with each of them in turn as the reference (see location.loc2D_references). Reusable for any
+arrival times heard by the same sensors, sensor_registry keeps them between incidents.
+"""
+class reference_geometry:
+
+    def __init__(self, locations):
+        self.locations = np.asarray(locations, dtype=np.float64)
+        m = len(self.locations)
+        if m < 3:
+            raise ValueError("Insufficient number of pulses, 3 or more needed to compute a location.")
+        # References in the order of the old rotation loop, and the sensor order for each of them
+        self.references = (-np.arange(m)) % m
+        self.order = (self.references[:, np.newaxis] + np.arange(m)) % m
+        ordered = self.locations[self.order, :2]
+        self.reference_locations = ordered[:, 0]
+        # loc2D's A matrix and rSquared vector for every reference, and the pseudo-inverse of each A
+        a = ordered[:, 1:] - ordered[:, :1]
+        self.r_squared = np.einsum("nij,nij->ni", a, a)
+        self.pinv = np.linalg.pinv(a)
+        self.full_rank = full_column_rank(a)
+        # (M, M) horizontal distances between every pair of sensors
+        offsets = self.locations[:, np.newaxis, :2] - self.locations[np.newaxis, :, :2]
+        self.baselines = np.sqrt(np.einsum("ijk,ijk->ij", offsets, offsets))
+
+    """
+    The prepared_geometry for the incident solved with references[row] as the reference, to be used
+    with the sensors reordered as locations[order[row]].
+    """
+    def prepared(self, row):
+        return prepared_geometry(self.locations[self.order[row]], self.pinv[row], self.r_squared[row],
+                                 bool(self.full_rank[row]))
+
+
+"""
+The (east, north) velocity in m/s of the air for a wind of speed m/s blowing from direction degrees
+clockwise from north, as weather reports give it. Grid north of UTM is taken as true north, they
+differ by under 3 degrees within a zone. Both may be arrays, the result has a trailing axis of 2.
+"""
+def wind_vector(speed, direction):
+    bearing = np.radians(np.asarray(direction, dtype=np.float64))
+    speed = np.asarray(speed, dtype=np.float64)
+    return np.stack((-speed * np.sin(bearing), -speed * np.cos(bearing)), axis=-1)
+
+
+"""
+The (M,) arrival time and (M,) position standard deviations, in seconds and in meters along each
+horizontal axis, of sensors with the given pdop (position dilution of precision of their GPS fix)
+and clock_error (the bound on their clock error in seconds, the Scepter "lambda"). The arrival time
+error is the picking_error of the pulse detector together with a clock error uniform within the
+bound. The position error is pdop times the range_error of a GPS satellite, spread over the three
+axes. Sensors missing either value get nan for it: the picking error alone would understate the
+error by orders of magnitude, and no ellipse is better than an overconfident one.
+"""
+def error_budget(pdop, clock_error, picking_error=1e-4, range_error=3.0):
+    clock_error = np.asarray(clock_error, dtype=np.float64)
+    pdop = np.asarray(pdop, dtype=np.float64)
+    arrival_sigma = np.sqrt(picking_error**2 + clock_error**2 / 3)
+    return arrival_sigma, pdop * range_error / np.sqrt(3)
+
+
+"""
+The confidence ellipse holding probability of a 2D normal position error of (..., 2, 2) easting /
+northing covariance. Returns the semi-major and semi-minor axes in meters and the bearing of the
+major axis in degrees clockwise from north, within [0, 180), each of the leading (...) shape. nan
+covariances give nan ellipses.
+"""
+def confidence_ellipse(covariance, probability=0.95):
+    covariance = np.asarray(covariance, dtype=np.float64)
+    # The chi-squared quantile of 2 degrees of freedom has this closed form
+    scale = -2 * np.log(1 - probability)
+    finite = np.isfinite(covariance).all(axis=(-2, -1))
+    eigenvalues, eigenvectors = np.linalg.eigh(np.where(finite[..., np.newaxis, np.newaxis], covariance, 0.0))
+    axes = np.sqrt(scale * np.maximum(eigenvalues, 0.0))
+    major = eigenvectors[..., :, 1]
+    bearing = np.degrees(np.arctan2(major[..., 0], major[..., 1])) % 180
+    return (np.where(finite, axes[..., 1], np.nan), np.where(finite, axes[..., 0], np.nan),
+            np.where(finite, bearing, np.nan))
+
+
+"""
+The sensor subsets location.ransac_inliers solves: every combination of size of m sensors when
+there are at most max_subsets of them, otherwise max_subsets random ones (duplicates dropped).
+Returns a (K, size) array of sensor indices, read only as it is cached for repeat sensor counts.
+"""
+@functools.lru_cache(maxsize=256)
+def sensor_subsets(m, size, max_subsets, seed=0):
+    combinations = list(itertools.islice(itertools.combinations(range(m), size), max_subsets + 1))
+    if len(combinations) <= max_subsets:
+        subsets = np.array(combinations, dtype=np.intp).reshape(-1, size)
+    else:
+        rng = np.random.default_rng(seed)
+        subsets = np.unique(np.sort(np.argsort(rng.random((max_subsets, m)), axis=1)[:, :size], axis=1), axis=0)
+    subsets.flags.writeable = False
+    return subsets
 
 
 class location:
 
-    def compute_speed(self, temp):
-        kelvin = temp + 273.15
+    """
+    Speed of sound in air at temp degrees Celsius. With humidity, the relative humidity in percent,
+    the water vapour in the air (its mole fraction at standard pressure, from the Magnus formula
+    for the saturation vapour pressure) makes sound slightly faster, by about 0.2% at 20 C and 50%.
+    Both may be arrays, a None or nan humidity is taken as dry air.
+    """
+    def compute_speed(self, temp, humidity=None):
+        kelvin = np.asarray(temp, dtype=np.float64) + 273.15
         speed = 20.03 * np.sqrt(kelvin)
-        return speed
-
-    """
-    The main algorithm for computing a location. Takes in two corresponding arrays, one with
-    numpy arrays containing the x, y, and z positions of the pulses, and another with corresponding
-    arrival times of those pulses, and as a third parameter, takes in the speed of sound.
-    Given a valid array of sensor data, the algorithm outputs a list of 0, 1, or 2 locations.
-    0 locations will be output when there are no real roots in the solution, meaning the input data
-    could not produce a viable solution. 1 or 2 locations will be output for viable solutions
-    depending on the number of sensors reporting. For 4 or more there should only be 1 possible
-    solution.
-
-    The error logging will instinctively append to a file called error.log unless the user passes
-    in a specific log file name. 
-    """
-    def loc2D(self, locations, arrivals, speed, log_name="error.log"):
-        # The error log file to write to given faulty input or unwanted behavior when computing
-        # potential locations
-        logging.basicConfig(filename=log_name, level=logging.ERROR, filemode="a")
-        # We need at least 3 pulses to compute a location, if there are fewer than 3 we throw an
-        # error and return.
+        if humidity is not None:
+            humidity = np.nan_to_num(np.asarray(humidity, dtype=np.float64))
+            saturation = 6.112 * np.exp(17.62 * (kelvin - 273.15) / (kelvin - 273.15 + 243.12))
+            vapour = humidity / 100 * saturation / 1013.25
+            # Water vapour lowers the molar mass of the air more than it lowers its heat capacity ratio
+            speed = speed * np.sqrt(1 + 0.32 * vapour)
+        return speed if speed.ndim else float(speed)
+
+    """
+    The main algorithm for computing a location. Takes in two corresponding arrays, one with numpy
+    arrays containing the x, y, and z positions of the pulses, and another with corresponding
+    arrival times of those pulses in seconds from any common epoch (see utc_time.py), and as a third
+    parameter, takes in the speed of sound. Discharge times are output in that same timebase. Given
+    a valid array of sensor data, the algorithm outputs a loc2D_result list of 0 or 2 locations. 0
+    locations will be output, with the Status of the failure, when there are fewer than 3 pulses,
+    the sensors are (nearly) collinear or there are no real roots in the solution, meaning the input
+    data could not produce a viable solution. For 4 or more sensors only one of the 2 locations is
+    normally consistent with every arrival (see compute_mse).
+
+    Solves that fail are counted by reason in diagnostics.py, which replaced the error.log this used
+    to configure and append to on every call.
+
+    A prepared_geometry built for these locations (see prepare_geometry) may be passed to skip
+    everything that depends only on the sensor positions, leaving two small matrix vector products
+    and the quadratic to solve per incident.
+    """
+    def loc2D(self, locations, arrivals, speed, geometry=None):
+        # We need at least 3 pulses to compute a location, if there are fewer than 3 we record why
+        # and return.
         if len(locations) < 3:
-            error_string = "Insufficient number of pulses, 3 or more needed to compute a location. Error occurred at "\
-                           "time: {0}".format(datetime.now())
-            logging.error(error_string)
-            # Using -1 as an error code to indicate to any outside callers that this instance could
-            # not be solved for a location. 
-            return -1
-        output = []
+            diagnostics.record(diagnostics.TOO_FEW_PULSES, pulses=len(locations))
+            return loc2D_result(Status.TooFewPulses)
+        output = loc2D_result()
+        if geometry is None:
+            geometry = self.prepare_geometry(locations)
+            if geometry is None:
+                return loc2D_result(Status.SingularGeometry)
+        if not geometry.full_rank:
+            # pinv(A) would only give the least norm answer of many along the line of the sensors
+            diagnostics.record(diagnostics.SINGULAR_GEOMETRY, reference=geometry.reference)
+            return loc2D_result(Status.SingularGeometry)
         # Loc2D routine, translated from Murphey's Java code:
-        m = len(locations) - 1
-        rSquared = np.zeros(shape=(m, 1))
-        a = np.zeros(shape=(m, 2))
-        d = np.zeros(shape=(m, 1))
-        w = np.zeros(shape=(m, 1))
-        for i in range(m):
-            tempVector = locations[i+1] - locations[0]
-            rSquared[i][0] = ((tempVector[0]**2) + (tempVector[1]**2))
-            a[i][0] = tempVector[0]
-            a[i][1] = tempVector[1]
-            d[i][0] = speed * (arrivals[i+1] - arrivals[0]).total_seconds()
-            w[i][0] = float(rSquared[i][0] - (d[i][0] * d[i][0])) / 2
-        A = a 
-        D = d
-        W = w 
-        B = None
-        try:
-            B = np.linalg.pinv(A)
-        except Exception as e:
-            logging.error("Tried to invert matrix: {0} but received the following error:\n {1}".format(A, e))
-        if type(B) is np.ndarray:
-            C = B.dot(D) 
-            Y = B.dot(W) 
-            Ctran = C.T
-            Ytran = Y.T
-            c = (C[0, 0], C[1, 0])
-            y = (Y[0, 0], Y[1, 0])
-            qA = (Ctran.dot(C))[0, 0] - 1
-            if qA != 0:
-                qB = float(((Ctran.dot(Y)) + (Ytran.dot(C)))[0, 0])
-                qC = float((Ytran.dot(Y))[0, 0])
-                radicand = float(qB * qB - 4 * qA * qC)
-                root = 0.0
-                if radicand > 0:
-                    root = radicand**(1/2)
-                elif radicand < 0:
-                    return output
-                if qB >= 0:
-                    qQ = -0.5 * (qB + root)
-                    posVector = [i * (float(qC) / qQ) for i in c]
-                    negVector = [i * (float(qQ) / qA) for i in c]
-                else:
-                    qQ = -0.5 * (qB - root)
-                    posVector = [i * (float(qQ) / qA) for i in c]
-                    negVector = [i * (float(qC) / qQ) for i in c]
-                posVector = [sum(x) for x in zip(posVector, y)]
-                posDischargeTime = datetime.utcfromtimestamp(
-                    arrivals[0].timestamp() - (np.linalg.norm(posVector)/speed)).strftime('%Y-%m-%d %H:%M:%S.%f')
-                negVector = [sum(x) for x in zip(negVector, y)]
-                negDischargeTime = datetime.utcfromtimestamp(
-                    arrivals[0].timestamp() - (np.linalg.norm(negVector)/speed)).strftime('%Y-%m-%d %H:%M:%S.%f')
-                posVector = [sum(x) for x in zip(posVector, locations[0])]
-                negVector = [sum(x) for x in zip(negVector, locations[0])]
-                output.append((posVector, posDischargeTime, Algorithm.Reddi2DPositiveRoot))
-                output.append((negVector, negDischargeTime, Algorithm.Reddi2DNegativeRoot))
+        arrivals = np.asarray(arrivals, dtype=np.float64)
+        d = speed * (arrivals[1:] - arrivals[0])
+        w = (geometry.r_squared - d * d) / 2
+        c = geometry.pinv.dot(d)
+        y = geometry.pinv.dot(w)
+        qA = c.dot(c) - 1
+        if qA != 0:
+            qB = float(2 * c.dot(y))
+            qC = float(y.dot(y))
+            radicand = float(qB * qB - 4 * qA * qC)
+            root = 0.0
+            if radicand > 0:
+                root = radicand**(1/2)
+            elif radicand < 0:
+                diagnostics.record(diagnostics.NEGATIVE_RADICAND, radicand=radicand)
+                return loc2D_result(Status.NegativeRadicand)
+            if qB >= 0:
+                qQ = -0.5 * (qB + root)
+                posVector = c * (qC / qQ)
+                negVector = c * (qQ / qA)
+            else:
+                qQ = -0.5 * (qB - root)
+                posVector = c * (qQ / qA)
+                negVector = c * (qC / qQ)
+            posVector = posVector + y
+            posDischargeTime = arrivals[0] - (np.linalg.norm(posVector)/speed)
+            negVector = negVector + y
+            negDischargeTime = arrivals[0] - (np.linalg.norm(negVector)/speed)
+            posVector = [sum(x) for x in zip(posVector.tolist(), geometry.reference)]
+            negVector = [sum(x) for x in zip(negVector.tolist(), geometry.reference)]
+            output.append((posVector, posDischargeTime, Algorithm.Reddi2DPositiveRoot))
+            output.append((negVector, negDischargeTime, Algorithm.Reddi2DNegativeRoot))
+        else:
+            diagnostics.record(diagnostics.NO_QUADRATIC)
+            output.status = Status.NoQuadratic
         return output
+
+    """
+    Builds the prepared_geometry of loc2D for locations, with locations[0] as the reference. Records
+    a singular_geometry failure and returns None if the pseudo-inverse of A can't be computed.
+    """
+    def prepare_geometry(self, locations):
+        try:
+            return prepared_geometry(locations)
+        except np.linalg.LinAlgError as e:
+            diagnostics.record(diagnostics.SINGULAR_GEOMETRY, error=str(e))
+            return None
+
+    """
+    Vectorized loc2D over a stack of N incidents that each have M reporting sensors. locations is an
+    (N, M, 2) or (N, M, 3) array of sensor UTM positions (any third column is ignored) and arrivals
+    is an (N, M) array of arrival times in seconds from any common epoch. Sensor 0 of every incident
+    is used as its reference. speed is either a scalar or one value per incident.
+
+    Returns a tuple (positions, discharge_times, status). positions is an (N, 2, 2) array holding
+    the easting / northing of the positive root followed by the negative root, discharge_times is an
+    (N, 2) array of the matching discharge times in the same timebase as arrivals, and status is an
+    (N,) int8 array of each incident's Status. Rows whose status isn't Status.Ok hold nan, bad
+    incidents never raise. Incidents of fewer than 3 sensors are all Status.TooFewPulses, and those
+    whose sensors are (nearly) collinear Status.SingularGeometry, as in loc3D_batch. With record
+    False failures aren't counted in diagnostics, for the perturbed draws of monte_carlo_batch.
+    """
+    def loc2D_batch(self, locations, arrivals, speed, record=True):
+        locations = np.asarray(locations, dtype=np.float64)
+        arrivals = np.asarray(arrivals, dtype=np.float64)
+        if arrivals.ndim != 2 or locations.shape[:2] != arrivals.shape:
+            raise ValueError("locations must be (N, M, 2|3) and arrivals (N, M), got {0} and {1}".format(
+                locations.shape, arrivals.shape))
+        if arrivals.shape[1] < 3:
+            return self.too_few_pulses(arrivals)
+        speed = np.broadcast_to(np.asarray(speed, dtype=np.float64), arrivals.shape[:1])
+        # The same a / d / w terms as loc2D, built for every incident at once
+        a = locations[:, 1:, :2] - locations[:, :1, :2]
+        d = speed[:, np.newaxis] * (arrivals[:, 1:] - arrivals[:, :1])
+        w = (np.einsum("nij,nij->ni", a, a) - d * d) / 2
+        # C = pinv(A).D and Y = pinv(A).W through the 2x2 normal equations. This is the
+        # pseudo-inverse whenever A has full column rank, rows where it doesn't have no solution.
+        ata = np.einsum("nij,nik->njk", a, a)
+        atd = np.einsum("nij,ni->nj", a, d)
+        atw = np.einsum("nij,ni->nj", a, w)
+        det = ata[:, 0, 0] * ata[:, 1, 1] - ata[:, 0, 1] * ata[:, 1, 0]
+        full_rank = full_column_rank(a, ata)
+        safe_det = np.where(full_rank, det, 1.0)
+        inverse = np.empty_like(ata)
+        inverse[:, 0, 0] = ata[:, 1, 1] / safe_det
+        inverse[:, 1, 1] = ata[:, 0, 0] / safe_det
+        inverse[:, 0, 1] = -ata[:, 0, 1] / safe_det
+        inverse[:, 1, 0] = -ata[:, 1, 0] / safe_det
+        C = np.einsum("njk,nk->nj", inverse, atd)
+        Y = np.einsum("njk,nk->nj", inverse, atw)
+        if full_rank.all():
+            return self.reddi_roots(C, Y, arrivals[:, 0], locations[:, 0, :2], speed, record)
+        if record:
+            diagnostics.record(diagnostics.SINGULAR_GEOMETRY, np.count_nonzero(~full_rank))
+        # Zeroed so that the quadratic of the singular rows neither fails nor is counted
+        C[~full_rank] = 0.0
+        Y[~full_rank] = 0.0
+        return self.singular_rows(self.reddi_roots(C, Y, arrivals[:, 0], locations[:, 0, :2], speed, record),
+                                  full_rank)
+
+    """
+    Marks the rows of a (positions, discharge_times, status) solve where full_rank is False as
+    Status.SingularGeometry, with nan roots. Returns the same tuple.
+    """
+    def singular_rows(self, solved, full_rank):
+        positions, discharge_times, status = solved
+        positions[~full_rank] = np.nan
+        discharge_times[~full_rank] = np.nan
+        status[~full_rank] = Status.SingularGeometry
+        return positions, discharge_times, status
+
+    """
+    loc2D_batch in three dimensions, using the elevation column rather than ignoring it, for
+    sensors at different heights (high-rise districts). locations is (N, M, 3) and arrivals (N, M),
+    and every incident needs at least 4 sensors. The positions returned are (N, 2, 3) easting /
+    northing / elevation, otherwise the output is loc2D_batch's, with a fourth (N,) boolean array
+    of the incidents whose heights were resolved.
+
+    The heights of an incident can't be resolved when its sensors lie in one plane (including every
+    array of equal elevations), when the three dimensional solve has no real root, or when the
+    standard error of the solved height (see height_error) is larger than the spread of the sensor
+    heights, so that the height of the sensors would be no worse a guess. Those incidents are solved
+    in two dimensions by loc2D_batch instead and placed at height, a scalar or (N,) elevation, or by
+    default the mean elevation of their sensors.
+    """
+    def loc3D_batch(self, locations, arrivals, speed, height=None):
+        locations = np.asarray(locations, dtype=np.float64)
+        arrivals = np.asarray(arrivals, dtype=np.float64)
+        if arrivals.ndim != 2 or locations.shape != arrivals.shape + (3,):
+            raise ValueError("locations must be (N, M, 3) and arrivals (N, M), got {0} and {1}".format(
+                locations.shape, arrivals.shape))
+        if arrivals.shape[1] < 4:
+            return self.too_few_pulses(arrivals, 3) + (np.zeros(arrivals.shape[0], dtype=bool),)
+        speed = np.broadcast_to(np.asarray(speed, dtype=np.float64), arrivals.shape[:1])
+        a = locations[:, 1:] - locations[:, :1]
+        d = speed[:, np.newaxis] * (arrivals[:, 1:] - arrivals[:, :1])
+        w = (np.einsum("nij,nij->ni", a, a) - d * d) / 2
+        # C and Y through the 3x3 normal equations, for the incidents where A has full column rank
+        ata = np.einsum("nij,nik->njk", a, a)
+        full_rank = np.abs(np.linalg.det(ata)) > 1e-12 * np.einsum("nii->n", ata)**3
+        positions = np.full(arrivals.shape[:1] + (2, 3), np.nan)
+        discharge_times = np.full(arrivals.shape[:1] + (2,), np.nan)
+        status = np.full(arrivals.shape[:1], Status.SingularGeometry, dtype=np.int8)
+        if full_rank.any():
+            a, d, w = a[full_rank], d[full_rank], w[full_rank]
+            rhs = np.stack((np.einsum("nij,ni->nj", a, d), np.einsum("nij,ni->nj", a, w)), axis=2)
+            solved = np.linalg.solve(ata[full_rank], rhs)
+            positions[full_rank], discharge_times[full_rank], status[full_rank] = self.reddi_roots(
+                solved[:, :, 0], solved[:, :, 1], arrivals[full_rank, 0], locations[full_rank, 0], speed[full_rank],
+                record=False)
+        resolved = status == Status.Ok
+        if resolved.any():
+            spread = np.std(locations[resolved, :, 2], axis=1)
+            resolved[resolved] = ~(self.height_error(locations[resolved], arrivals[resolved], speed[resolved],
+                                                     positions[resolved], discharge_times[resolved]) > spread)
+        if resolved.all():
+            return positions, discharge_times, status, resolved
+        # Failures are only counted for the two dimensional solve the unresolved incidents end with
+        flat = ~resolved
+        flat_positions, discharge_times[flat], status[flat] = self.loc2D_batch(locations[flat], arrivals[flat],
+                                                                               speed[flat])
+        if height is None:
+            height = np.mean(locations[:, :, 2], axis=1)
+        height = np.broadcast_to(np.asarray(height, dtype=np.float64), arrivals.shape[:1])[flat]
+        positions[flat, :, :2] = flat_positions
+        positions[flat, :, 2] = np.where(np.isnan(flat_positions[..., 0]), np.nan, height[:, np.newaxis])
+        return positions, discharge_times, status, resolved
+
+    """
+    The standard error, in meters, of the height of N incidents solved by loc3D_batch, estimated
+    from how far their best root (see best_roots) misses the (N, M) arrivals at (N, M, 3) locations:
+    the vertical entry of the least squares covariance of the fit, as refine_batch estimates it. It
+    is 0 for incidents with no more than 4 sensors, which are fitted exactly and leave nothing to
+    estimate it from, and inf where the fit doesn't pin the height down.
+    """
+    def height_error(self, locations, arrivals, speed, positions, discharge_times):
+        n, m = arrivals.shape
+        if m <= 4:
+            return np.zeros(n)
+        best, best_times = self.best_roots(locations, arrivals, positions, discharge_times, speed)
+        residual, jacobian = self.residuals(locations, arrivals, speed,
+                                            np.concatenate((best, best_times[:, np.newaxis]), axis=1))
+        jtj = np.einsum("nmi,nmj->nij", jacobian, jacobian)
+        error = np.full(n, np.inf)
+        # Scaled so that the discharge time is in meters, like the position, before judging the rank
+        scale = np.array([1.0, 1.0, 1.0, 1.0 / speed.mean()])
+        scaled = jtj * scale[:, np.newaxis] * scale
+        determined = np.abs(np.linalg.det(scaled)) > 1e-12 * np.einsum("nii->n", scaled)**4
+        unit = np.broadcast_to(np.array([0.0, 0.0, 1.0, 0.0])[:, np.newaxis], (np.count_nonzero(determined), 4, 1))
+        variance = np.linalg.solve(jtj[determined], unit)[:, 2, 0] \
+            * np.einsum("nm,nm->n", residual[determined], residual[determined]) / (m - 4)
+        error[determined] = np.sqrt(np.maximum(variance, 0.0))
+        return error
+
+    """
+    The final step shared by loc2D_batch, loc3D_batch and loc2D_prepared. Given the (N, 2|3)
+    products C = pinv(A).D and Y = pinv(A).W of N incidents, the (N,) arrival times and (N, 2|3)
+    positions of their reference sensors and the (N,) speeds of sound, solves the quadratic in the
+    range to the reference sensor with the numerically stable form of the quadratic formula exactly
+    as loc2D does. Returns the same (positions, discharge_times, status) tuple as loc2D_batch,
+    counting failures in diagnostics when record.
+    """
+    def reddi_roots(self, C, Y, reference_arrivals, reference_locations, speed, record=True):
+        qA = np.einsum("nj,nj->n", C, C) - 1
+        qB = 2 * np.einsum("nj,nj->n", C, Y)
+        qC = np.einsum("nj,nj->n", Y, Y)
+        radicand = qB * qB - 4 * qA * qC
+        valid = (qA != 0) & (radicand >= 0)
+        status = np.full(valid.shape, Status.Ok, dtype=np.int8)
+        if not valid.all():
+            status[radicand < 0] = Status.NegativeRadicand
+            status[qA == 0] = Status.NoQuadratic
+        if not valid.all() and record:
+            diagnostics.record(diagnostics.NO_QUADRATIC, np.count_nonzero(status == Status.NoQuadratic))
+            diagnostics.record(diagnostics.NEGATIVE_RADICAND, np.count_nonzero(status == Status.NegativeRadicand))
+        root = np.sqrt(np.where(valid, radicand, 0.0))
+        with np.errstate(divide="ignore", invalid="ignore"):
+            qQ = np.where(qB >= 0, -0.5 * (qB + root), -0.5 * (qB - root))
+            small = qC / qQ
+            large = qQ / qA
+        pos_scale = np.where(qB >= 0, small, large)
+        neg_scale = np.where(qB >= 0, large, small)
+        relative = C[:, np.newaxis, :] * np.stack((pos_scale, neg_scale), axis=1)[:, :, np.newaxis] \
+            + Y[:, np.newaxis, :]
+        discharge_times = reference_arrivals[:, np.newaxis] \
+            - np.sqrt(np.einsum("nrj,nrj->nr", relative, relative)) / speed[:, np.newaxis]
+        positions = relative + reference_locations[:, np.newaxis, :]
+        positions[~valid] = np.nan
+        discharge_times[~valid] = np.nan
+        return positions, discharge_times, status
+
+    """
+    The all nan (positions, discharge_times, status) of loc2D_batch, or of loc3D_batch with
+    dimensions 3, for a stack of incidents with too few sensors each.
+    """
+    def too_few_pulses(self, arrivals, dimensions=2):
+        n = arrivals.shape[0]
+        diagnostics.record(diagnostics.TOO_FEW_PULSES, n, pulses=arrivals.shape[1])
+        return (np.full((n, 2, dimensions), np.nan), np.full((n, 2), np.nan),
+                np.full(n, Status.TooFewPulses, dtype=np.int8))
+
+    """
+    The root of each of N incidents that best fits all of its arrivals (the smaller compute_mse),
+    from the (N, 2, 2|3) positions and (N, 2) discharge_times of loc2D_batch or loc3D_batch, for
+    sensors at (N, M, 2|3) locations. Returns the (N, 2|3) positions and (N,) discharge times, nan
+    where neither root was found.
+    """
+    def best_roots(self, locations, arrivals, positions, discharge_times, speed):
+        k = positions.shape[-1]
+        speed = np.broadcast_to(np.asarray(speed, dtype=np.float64), arrivals.shape[:1])
+        offsets = positions[:, :, np.newaxis, :] - np.asarray(locations)[:, np.newaxis, :, :k]
+        distance = np.sqrt(np.einsum("nrmj,nrmj->nrm", offsets, offsets))
+        errors = np.mean(np.square(speed[:, np.newaxis, np.newaxis]
+                                   * (arrivals[:, np.newaxis, :] - discharge_times[..., np.newaxis]) - distance),
+                         axis=-1)
+        best = np.argmin(np.where(np.isnan(errors), np.inf, errors), axis=1)
+        rows = np.arange(len(best))
+        return positions[rows, best], discharge_times[rows, best]
+
+    """
+    The arrival times N incidents would have had in still air, given wind, the (2,) or (N, 2)
+    (east, north) air velocity (see wind_vector), and each incident's current solution, (N, 2|3)
+    positions and (N,) discharge_times. Sound heading from the source to a sensor moves at speed
+    plus the wind's component in that direction, so sensors downwind hear it early. Scaling each
+    travel time by that effective speed over speed gives arrivals the still air solvers can be
+    rerun with. Incidents without a solution (nan) keep their arrivals.
+    """
+    def still_air_arrivals(self, locations, arrivals, speed, wind, positions, discharge_times):
+        speed = np.broadcast_to(np.asarray(speed, dtype=np.float64), arrivals.shape[:1])
+        wind = np.broadcast_to(np.asarray(wind, dtype=np.float64), arrivals.shape[:1] + (2,))
+        offsets = np.asarray(locations)[..., :2] - positions[:, np.newaxis, :2]
+        distance = np.maximum(np.sqrt(np.einsum("nmj,nmj->nm", offsets, offsets)), 1e-9)
+        along = np.einsum("nmj,nj->nm", offsets, wind) / distance
+        travel = arrivals - discharge_times[:, np.newaxis]
+        corrected = discharge_times[:, np.newaxis] + travel * (1 + along / speed[:, np.newaxis])
+        return np.where(np.isfinite(corrected), corrected, arrivals)
+
+    """
+    loc2D_batch corrected for wind: each incident is solved in still air, its arrivals corrected
+    for the wind along the directions from that solution to every sensor (still_air_arrivals) and
+    solved again, iterations times. Wind speeds are small next to the speed of sound, so the
+    solution settles within a couple of iterations. Returns loc2D_batch's tuple for the corrected
+    arrivals, which are returned as a fourth element.
+    """
+    def loc2D_wind_batch(self, locations, arrivals, speed, wind, iterations=2):
+        locations = np.asarray(locations, dtype=np.float64)
+        arrivals = np.asarray(arrivals, dtype=np.float64)
+        corrected = arrivals
+        positions, discharge_times, status = self.loc2D_batch(locations, arrivals, speed)
+        for _ in range(iterations):
+            best, best_times = self.best_roots(locations, corrected, positions, discharge_times, speed)
+            corrected = self.still_air_arrivals(locations, arrivals, speed, wind, best, best_times)
+            positions, discharge_times, status = self.loc2D_batch(locations, corrected, speed)
+        return positions, discharge_times, status, corrected
+
+    """
+    loc2D_batch for arrival times at sensors whose geometry was prepared ahead of time, skipping
+    everything that depends only on the sensor positions (building A and its pseudo-inverse).
+    geometry is a reference_geometry for M sensors and arrivals the (M,) arrival times in seconds,
+    the incident is solved with each sensor in turn as the reference in geometry.order. Returns the
+    (M, 2, 2) positions, (M, 2) discharge_times and (M,) status arrays of loc2D_batch, references
+    whose sensors are (nearly) collinear being Status.SingularGeometry.
+    """
+    def loc2D_prepared(self, geometry, arrivals, speed):
+        ordered = np.asarray(arrivals, dtype=np.float64)[geometry.order]
+        speed = np.broadcast_to(np.asarray(speed, dtype=np.float64), ordered.shape[:1])
+        d = speed[:, np.newaxis] * (ordered[:, 1:] - ordered[:, :1])
+        w = (geometry.r_squared - d * d) / 2
+        C = np.einsum("njk,nk->nj", geometry.pinv, d)
+        Y = np.einsum("njk,nk->nj", geometry.pinv, w)
+        solved = self.reddi_roots(C, Y, ordered[:, 0], geometry.reference_locations, speed)
+        if geometry.full_rank.all():
+            return solved
+        diagnostics.record(diagnostics.SINGULAR_GEOMETRY, np.count_nonzero(~geometry.full_rank))
+        return self.singular_rows(solved, geometry.full_rank)
+
+    """
+    Solves a single incident with each of its M sensors in turn as the reference, all in one
+    loc2D_batch call. locations is an (M, 2|3) array and arrivals an (M,) array of arrival times in
+    seconds. References are visited in the order the old rotation loop used (0, M-1, M-2, ..., 1)
+    so that ties resolve to the same sensor.
+
+    Returns (references, positions, discharge_times, errors, status) where references holds the
+    sensor index used as reference for each of the M solves, positions, discharge_times and status
+    are the (M, 2, 2), (M, 2) and (M,) outputs of loc2D_batch and errors is the (M, 2) mean squared
+    error of each root against every arrival (nan where status isn't Status.Ok). A
+    reference_geometry prepared for these locations (see sensor_registry) skips the geometry work.
+    """
+    def loc2D_references(self, locations, arrivals, speed, geometry=None):
+        locations = np.asarray(locations, dtype=np.float64)
+        arrivals = np.asarray(arrivals, dtype=np.float64)
+        if geometry is not None:
+            references = geometry.references
+            positions, discharge_times, status = self.loc2D_prepared(geometry, arrivals, speed)
+        else:
+            m = arrivals.shape[0]
+            references = (-np.arange(m)) % m
+            order = (references[:, np.newaxis] + np.arange(m)) % m
+            positions, discharge_times, status = self.loc2D_batch(locations[order], arrivals[order], speed)
+        errors = self.compute_mse(locations, arrivals, positions, discharge_times, speed)
+        return references, positions, discharge_times, errors, status
+
+    """
+    loc2D_references for a stack of N incidents of M sensors each in a single loc2D_batch call of
+    N x M rows, as for many incidents heard by the same sensors. locations is (M, 2|3), shared
+    by every incident, or (N, M, 2|3), and arrivals is (N, M). Returns the (M,) references and the
+    (N, M, 2, 2) positions, (N, M, 2) discharge_times and errors and (N, M) status of every incident
+    with every reference, in the order of loc2D_references.
+    """
+    def loc2D_references_batch(self, locations, arrivals, speed):
+        arrivals = np.asarray(arrivals, dtype=np.float64)
+        n, m = arrivals.shape
+        locations = np.broadcast_to(np.asarray(locations, dtype=np.float64)[..., :2], (n, m, 2))
+        speed = np.broadcast_to(np.asarray(speed, dtype=np.float64), (n,))
+        references = (-np.arange(m)) % m
+        order = (references[:, np.newaxis] + np.arange(m)) % m
+        positions, discharge_times, status = self.loc2D_batch(locations[:, order].reshape(n * m, m, 2),
+                                                              arrivals[:, order].reshape(n * m, m),
+                                                              np.repeat(speed, m))
+        positions = positions.reshape(n, m, 2, 2)
+        discharge_times = discharge_times.reshape(n, m, 2)
+        offsets = positions[:, :, :, np.newaxis, :] - locations[:, np.newaxis, np.newaxis]
+        distance = np.sqrt(np.einsum("nrkmj,nrkmj->nrkm", offsets, offsets))
+        discharge_distance = speed[:, np.newaxis, np.newaxis, np.newaxis] \
+            * (arrivals[:, np.newaxis, np.newaxis] - discharge_times[..., np.newaxis])
+        errors = np.mean(np.square(discharge_distance - distance), axis=-1)
+        return references, positions, discharge_times, errors, status.reshape(n, m)
+
+    """
+    loc2D_references with loc3D_batch, for a single incident of M >= 4 sensors at (M, 3)
+    locations. positions are (M, 2, 3) and errors are measured in three dimensions. The (M,)
+    boolean array of the references whose solve resolved the heights is returned as a sixth
+    element, the others were solved in two dimensions at height (see loc3D_batch).
+    """
+    def loc3D_references(self, locations, arrivals, speed, height=None):
+        locations = np.asarray(locations, dtype=np.float64)
+        arrivals = np.asarray(arrivals, dtype=np.float64)
+        m = arrivals.shape[0]
+        references = (-np.arange(m)) % m
+        order = (references[:, np.newaxis] + np.arange(m)) % m
+        positions, discharge_times, status, resolved = self.loc3D_batch(locations[order], arrivals[order], speed,
+                                                                        height)
+        errors = self.compute_mse(locations, arrivals, positions, discharge_times, speed)
+        return references, positions, discharge_times, errors, status, resolved
+
+    """
+    Finds the sensors of a single incident whose arrivals agree with each other, so that one echo
+    or otherwise corrupted arrival can be left out of the solve. Solves subsets of subset_size of
+    the M sensors (see sensor_subsets, at most max_subsets of them) in a single loc2D_batch call and
+    scores both roots of every subset against all M arrivals by their truncated squared residuals
+    (MSAC): residuals beyond threshold meters count as threshold. The sensors within threshold of
+    the best root are the inliers.
+
+    Returns the (M,) boolean inlier mask and a Status, Status.Inconsistent when no root is agreed on
+    by at least subset_size sensors. Incidents with no more than subset_size sensors have nothing to
+    check a solve against, all their sensors are returned as inliers.
+    """
+    def ransac_inliers(self, locations, arrivals, speed, subset_size=4, max_subsets=500, threshold=10.0,
+                       seed=0):
+        locations = np.asarray(locations, dtype=np.float64)
+        arrivals = np.asarray(arrivals, dtype=np.float64)
+        m = arrivals.shape[0]
+        if m <= subset_size:
+            return np.ones(m, dtype=bool), Status.Ok
+        subsets = sensor_subsets(m, subset_size, max_subsets, seed)
+        positions, discharge_times, status = self.loc2D_batch(locations[subsets], arrivals[subsets], speed)
+        # (K, 2, M) residual of every root against every sensor, in meters
+        offsets = positions[:, :, np.newaxis, :] - locations[:, :2]
+        distance = np.sqrt(np.einsum("krmj,krmj->krm", offsets, offsets))
+        residual = np.abs(speed * (arrivals - discharge_times[..., np.newaxis]) - distance)
+        cost = np.sum(np.minimum(residual, threshold)**2, axis=-1)
+        cost[status != Status.Ok] = np.inf
+        best = np.unravel_index(np.argmin(cost), cost.shape)
+        inliers = residual[best] < threshold
+        if np.count_nonzero(inliers) < subset_size:
+            return inliers, Status.Inconsistent
+        return inliers, Status.Ok
+
+    """
+    Levenberg-Marquardt refinement of N incidents over (easting, northing, discharge time), seeded
+    with closed form roots, using every arrival rather than the 3 a root is pinned to. locations
+    is (N, M, 2|3), arrivals (N, M) in seconds, positions the (N, 2) seed positions and
+    discharge_times their (N,) discharge times. (N, 3) positions, as loc3D_batch gives, are refined
+    over the elevation as well. The residual of each sensor is the distance sound travels from the
+    discharge to its arrival less its distance from the position, in meters, and is differentiated
+    analytically. Incidents take their steps together and drop out as their steps fall below
+    tolerance meters, for at most iterations steps.
+
+    Returns (positions, discharge_times, errors, covariance). errors is the (N,) mean squared
+    residual in square meters, comparable to compute_mse, and covariance the (N, 3, 3), or
+    (N, 4, 4), covariance of the position followed by the discharge time in meters and seconds
+    estimated from the residuals. It is nan for incidents with no more sensors than unknowns, which
+    are fitted exactly, and for fits too far from the sensors to pin the position down. Rows with a
+    nan seed stay nan.
+    """
+    def refine_batch(self, locations, arrivals, speed, positions, discharge_times, iterations=10,
+                     tolerance=1e-4):
+        arrivals = np.asarray(arrivals, dtype=np.float64)
+        n, m = arrivals.shape
+        positions = np.asarray(positions, dtype=np.float64).reshape(n, -1)
+        k = positions.shape[1]
+        locations = np.asarray(locations, dtype=np.float64)[..., :k]
+        speed = np.broadcast_to(np.asarray(speed, dtype=np.float64), (n,))
+        params = np.concatenate((positions, np.asarray(discharge_times, dtype=np.float64).reshape(n, 1)), axis=1)
+        errors = np.full(n, np.nan)
+        covariance = np.full((n, k + 1, k + 1), np.nan)
+        seeded = np.isfinite(params).all(axis=1)
+        if not seeded.all():
+            refined = self.refine_batch(locations[seeded], arrivals[seeded], speed[seeded], params[seeded, :k],
+                                        params[seeded, k], iterations, tolerance)
+            params[seeded, :k], params[seeded, k], errors[seeded], covariance[seeded] = refined
+            return params[:, :k], params[:, k], errors, covariance
+        residual, jacobian = self.residuals(locations, arrivals, speed, params)
+        cost = np.einsum("nm,nm->n", residual, residual)
+        damping = np.full(n, 1e-3)
+        diagonal = (np.arange(k + 1), np.arange(k + 1))
+        # Incidents still converging, the others are left alone
+        active = np.arange(n)
+        for _ in range(iterations):
+            jtj = np.einsum("nmi,nmj->nij", jacobian[active], jacobian[active])
+            jtr = np.einsum("nmi,nm->ni", jacobian[active], residual[active])
+            jtj[:, diagonal[0], diagonal[1]] *= 1 + damping[active, np.newaxis]
+            step = np.linalg.solve(jtj, -jtr[:, :, np.newaxis])[:, :, 0]
+            trial = params[active] + step
+            trial_residual, trial_jacobian = self.residuals(locations[active], arrivals[active], speed[active],
+                                                            trial)
+            trial_cost = np.einsum("nm,nm->n", trial_residual, trial_residual)
+            better = trial_cost < cost[active]
+            improved = active[better]
+            params[improved] = trial[better]
+            residual[improved] = trial_residual[better]
+            jacobian[improved] = trial_jacobian[better]
+            cost[improved] = trial_cost[better]
+            damping[active] = np.where(better, damping[active] / 10, damping[active] * 10)
+            # Steps in meters, the discharge time moved as far as sound travels in it
+            moved = np.maximum(np.abs(step[:, :k]).max(axis=1), np.abs(step[:, k]) * speed[active])
+            active = active[~better | (moved > tolerance)]
+            if len(active) == 0:
+                break
+        errors = cost / m
+        if m > k + 1:
+            jtj = np.einsum("nmi,nmj->nij", jacobian, jacobian)
+            # A fit that ran off far from the sensors sees them all in one direction, its position
+            # is undetermined and its covariance left nan
+            determined = np.linalg.cond(jtj) < 1e12
+            covariance[determined] = np.linalg.inv(jtj[determined]) \
+                * (cost[determined] / (m - k - 1))[:, np.newaxis, np.newaxis]
+        return params[:, :k], params[:, k], errors, covariance
+
+    """
+    Monte Carlo uncertainty of N located incidents. Each incident's (M, 2|3) sensor locations and
+    (M,) arrivals are perturbed draws times by normal errors of the (N, M) arrival_sigma seconds and
+    position_sigma meters per horizontal axis of error_budget, and every draw of every incident is
+    re-solved in a single loc2D_batch call, sensor 0 being the reference as there. The root of a
+    draw nearest the incident's (N, 2|3) position is its solution.
+
+    Returns (covariance, solved). covariance is the (N, 2, 2) easting / northing covariance of the
+    solved draws, see confidence_ellipse, nan for incidents with fewer than 3 solved draws, and
+    solved the (N,) fraction of draws with real roots. Failing draws aren't counted in diagnostics.
+    """
+    def monte_carlo_batch(self, locations, arrivals, speed, positions, arrival_sigma, position_sigma, draws=1000,
+                          seed=0):
+        arrivals = np.asarray(arrivals, dtype=np.float64)
+        n, m = arrivals.shape
+        locations = np.asarray(locations, dtype=np.float64)[..., :2]
+        positions = np.asarray(positions, dtype=np.float64).reshape(n, -1)[:, :2]
+        speed = np.broadcast_to(np.asarray(speed, dtype=np.float64), (n,))
+        arrival_sigma = np.broadcast_to(np.asarray(arrival_sigma, dtype=np.float64), (n, m))
+        position_sigma = np.broadcast_to(np.asarray(position_sigma, dtype=np.float64), (n, m))
+        rng = np.random.default_rng(seed)
+        drawn_arrivals = arrivals[:, np.newaxis] + rng.standard_normal((n, draws, m)) * arrival_sigma[:, np.newaxis]
+        drawn_locations = locations[:, np.newaxis] \
+            + rng.standard_normal((n, draws, m, 2)) * position_sigma[:, np.newaxis, :, np.newaxis]
+        roots, _, status = self.loc2D_batch(drawn_locations.reshape(n * draws, m, 2),
+                                            drawn_arrivals.reshape(n * draws, m), np.repeat(speed, draws),
+                                            record=False)
+        roots = roots.reshape(n, draws, 2, 2)
+        offsets = roots - positions[:, np.newaxis, np.newaxis]
+        distance = np.einsum("ndrj,ndrj->ndr", offsets, offsets)
+        nearest = np.argmin(np.where(np.isnan(distance), np.inf, distance), axis=2)
+        drawn = np.take_along_axis(roots, nearest[:, :, np.newaxis, np.newaxis], axis=2)[:, :, 0]
+        ok = status.reshape(n, draws) == Status.Ok
+        counts = np.count_nonzero(ok, axis=1)
+        drawn = np.where(ok[..., np.newaxis], drawn, 0.0)
+        mean = drawn.sum(axis=1) / np.maximum(counts, 1)[:, np.newaxis]
+        centered = np.where(ok[..., np.newaxis], drawn - mean[:, np.newaxis], 0.0)
+        with np.errstate(divide="ignore", invalid="ignore"):
+            covariance = np.einsum("ndi,ndj->nij", centered, centered) / (counts - 1)[:, np.newaxis, np.newaxis]
+        covariance[counts < 3] = np.nan
+        return covariance, counts / draws
+
+    """
+    The (N, M) residuals, in meters, of N incidents at params (position then discharge time) and
+    their (N, M, K + 1) Jacobian with respect to params, for K dimensional locations.
+    """
+    def residuals(self, locations, arrivals, speed, params):
+        k = locations.shape[-1]
+        offsets = params[:, np.newaxis, :k] - locations
+        # A source sitting exactly on a sensor has no direction to it, its derivative is taken as 0
+        distance = np.maximum(np.sqrt(np.einsum("nmj,nmj->nm", offsets, offsets)), 1e-9)
+        residual = speed[:, np.newaxis] * (arrivals - params[:, k:]) - distance
+        jacobian = np.empty(offsets.shape[:2] + (k + 1,))
+        jacobian[..., :k] = -offsets / distance[..., np.newaxis]
+        jacobian[..., k] = -speed[:, np.newaxis]
+        return residual, jacobian
+
+    """
+    Mean squared difference, in square meters, between the distance from each candidate position to
+    every sensor and the distance sound travels between the candidate's discharge time and that
+    sensor's arrival time. positions has shape (..., 2), or (..., 3) to include the elevation, and
+    discharge_times the matching (...) shape, the result has that same (...) shape.
+    """
+    def compute_mse(self, locations, arrivals, positions, discharge_times, speed):
+        offsets = positions[..., np.newaxis, :] - locations[:, :positions.shape[-1]]
+        distance = np.sqrt(np.sum(np.square(offsets), axis=-1))
+        discharge_distance = speed * (arrivals - discharge_times[..., np.newaxis])
+        return np.mean(np.square(discharge_distance - distance), axis=-1)
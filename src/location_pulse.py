@@ -2,23 +2,47 @@
 Zac Plett 07/24/2018 - ShotSpotter
 
 location_pulse.py: This class is fed the converted cloud_pulse object data and this class is
-                   used for location finding computations.
+                   used for location finding computations. It is a view onto one row of a
+                   pulse_batch, which holds the actual data.
 
 Usage: Keep this file in your working directory and add:
        from location_pulse import location_pulse
 """
 
+import uuid
+
 import numpy as np
 
 
 class location_pulse:
     
-    def __init__(self, pulse_id, serial_number, arrival_time, utm_location, elevation):
-        # Sets class variables given the input fields
-        self.pulse_id = pulse_id
-        self.serial_number = serial_number
-        self.arrival_time = arrival_time
-        self.location = np.array([utm_location[0], utm_location[1], elevation])
-        self.zone_number = utm_location[2]
-        self.zone_letter = utm_location[3]
-        
\ No newline at end of file
+    def __init__(self, batch, index):
+        # The pulse_batch and the row within it that this pulse reads from
+        self.batch = batch
+        self.index = index
+
+    @property
+    def pulse_id(self):
+        return uuid.UUID(bytes=bytes(self.batch.pulse_id[self.index]))
+
+    @property
+    def serial_number(self):
+        return str(self.batch.serial_number[self.index])
+
+    # Integer nanoseconds since the Unix epoch
+    @property
+    def arrival_time(self):
+        return int(self.batch.arrival_time[self.index])
+
+    @property
+    def location(self):
+        return np.array([self.batch.easting[self.index], self.batch.northing[self.index],
+                         self.batch.elevation[self.index]])
+
+    @property
+    def zone_number(self):
+        return int(self.batch.zone_number[self.index])
+
+    @property
+    def zone_letter(self):
+        return str(self.batch.zone_letter[self.index])
@@ -0,0 +1,229 @@
+"""
+location_service.py: Resident location service. Where find_location.py pays for interpreter start
+                     up, imports and reading a json file on every location, this keeps one process
+                     running that reads find_pulses.py style pulse json requests, one json object
+                     per line, from stdin or from clients of a local socket. Requests are solved
+                     concurrently on a pool of worker processes, each of which keeps numpy imported
+                     and a sensor_registry of the sensor geometry it has computed between requests,
+                     and one json line is streamed back per request as soon as it is solved.
+
+                     Request:  {"id": 1, "pulses": [...], "weather": {...}, "robust": false}
+                     Response: {"id": 1, "status": "Ok", "locations": [...]}
+                               or  {"id": 1, "error": "..."}
+
+                     status names the location.Status of the solve and locations is empty unless
+                     it is Ok, error is for requests that can't be read or that raised while being
+                     solved, every request gets a response line either way. locations holds the
+                     location_result dictionaries sorted by self consistent error exactly as
+                     find_location.py prints them. Responses on one stream may come back in a
+                     different order from the requests, id is echoed to match them. With robust
+                     (optional) sensors disagreeing with the rest are left out, as by
+                     find_location.py --robust, and listed in the response's outliers.
+
+Usage: This file should be used as a script:
+
+       python src/location_service.py                         (requests on stdin, results on stdout)
+       python src/location_service.py --socket /tmp/loc.sock  (unix domain socket)
+       python src/location_service.py --port 8765             (TCP on 127.0.0.1)
+"""
+
+import argparse
+import asyncio
+from concurrent.futures import ProcessPoolExecutor
+import json
+import os
+import signal
+import sys
+
+import diagnostics
+from find_location import find_location
+from sensor_registry import sensor_registry
+
+
+# Longest request line accepted, large enough for incidents with hundreds of pulses
+line_limit = 2**24
+
+# The sensor geometry cached by this process, one per worker process
+registry = None
+
+
+def parse_arguments():
+    parser = argparse.ArgumentParser(description="Serves locations for find_pulses.py style pulse "
+                                     "json, one request per line, over stdin or a local socket.")
+    parser.add_argument('--socket', help="path of a unix domain socket to listen on")
+    parser.add_argument('--port', type=int, help="TCP port to listen on at 127.0.0.1")
+    parser.add_argument('--workers', type=int, default=os.cpu_count(),
+                        help="number of worker processes solving requests, 0 solves in the service "
+                        "process itself")
+    parser.add_argument('--diagnostics-log', help="file every failed solve is recorded in, by default "
+                        "failures are only counted")
+    parser.add_argument('--max-pending', type=int, default=256,
+                        help="most requests being solved at once before the service stops reading")
+    args = parser.parse_args()
+    return args
+
+
+def init_worker(diagnostics_log=None):
+    global registry
+    registry = sensor_registry()
+    diagnostics.configure(log_name=diagnostics_log)
+
+
+"""
+The error response of a request that raised e.
+"""
+def error_response(e):
+    return {"error": "{0}: {1}".format(type(e).__name__, e)}
+
+
+"""
+Solves one parsed request. Runs in the worker processes. Any exception, a malformed request or a
+failure inside find_location (np.linalg.LinAlgError, FloatingPointError, ...), becomes the error
+response of that request alone.
+"""
+def locate(request):
+    try:
+        result = find_location(request, registry=registry, robust=bool(request.get("robust", False)))
+    except Exception as e:
+        return error_response(e)
+    response = {"status": result.status.name, "locations": [x.as_dict() for x in result.computed_locations]}
+    if result.robust:
+        response["outliers"] = result.outliers
+    return response
+
+
+class location_service:
+
+    def __init__(self, workers, max_pending, diagnostics_log=None):
+        self.executor = None
+        if workers > 0:
+            self.executor = ProcessPoolExecutor(max_workers=workers, initializer=init_worker,
+                                                initargs=(diagnostics_log,))
+        else:
+            init_worker(diagnostics_log)
+        self.max_pending = max_pending
+
+    """
+    The response line for one request line.
+    """
+    async def solve(self, line):
+        try:
+            request = json.loads(line)
+        except ValueError as e:
+            return json.dumps({"id": None, "error": "ValueError: {0}".format(e)}, sort_keys=True)
+        request_id = request.get("id") if isinstance(request, dict) else None
+        if not isinstance(request, dict):
+            response = {"error": "TypeError: request must be a json object"}
+        elif self.executor is None:
+            response = locate(request)
+        else:
+            try:
+                response = await asyncio.get_running_loop().run_in_executor(self.executor, locate, request)
+            except Exception as e:
+                # The worker itself failed, as when it is killed (BrokenProcessPool)
+                response = error_response(e)
+        response["id"] = request_id
+        return json.dumps(response, sort_keys=True)
+
+    """
+    Answers every request line read from reader until it closes, passing each response line to the
+    write coroutine. At most max_pending requests of a stream are solved at once.
+    """
+    async def serve_stream(self, reader, write):
+        pending = asyncio.Semaphore(self.max_pending)
+        tasks = set()
+
+        async def respond(line):
+            try:
+                await write(await self.solve(line) + "\n")
+            finally:
+                pending.release()
+
+        while True:
+            line = await reader.readline()
+            if not line:
+                break
+            if not line.strip():
+                continue
+            await pending.acquire()
+            task = asyncio.ensure_future(respond(line))
+            tasks.add(task)
+            task.add_done_callback(tasks.discard)
+        if tasks:
+            await asyncio.gather(*tasks)
+
+    """
+    stdin is read on a thread rather than through an asyncio pipe so that redirected files work,
+    as well as consoles where asyncio has no pipe support.
+    """
+    async def serve_stdin(self):
+        loop = asyncio.get_running_loop()
+
+        class stdin_reader:
+            async def readline(self):
+                return await loop.run_in_executor(None, sys.stdin.buffer.readline)
+
+        async def write(text):
+            sys.stdout.write(text)
+            sys.stdout.flush()
+
+        await self.serve_stream(stdin_reader(), write)
+
+    async def serve_client(self, reader, writer):
+        async def write(text):
+            writer.write(text.encode())
+            await writer.drain()
+
+        try:
+            await self.serve_stream(reader, write)
+        except ConnectionError:
+            pass
+        finally:
+            writer.close()
+
+    async def serve_socket(self, path=None, port=None):
+        if path is not None:
+            server = await asyncio.start_unix_server(self.serve_client, path=path, limit=line_limit)
+        else:
+            server = await asyncio.start_server(self.serve_client, host="127.0.0.1", port=port,
+                                                limit=line_limit)
+        async with server:
+            await server.serve_forever()
+
+    """
+    Runs one of the serve coroutines until it finishes or the process receives SIGTERM, which
+    stops the service as cleanly as Ctrl+C does (where the platform lets asyncio handle signals).
+    """
+    async def run(self, serve):
+        task = asyncio.ensure_future(serve)
+        try:
+            asyncio.get_running_loop().add_signal_handler(signal.SIGTERM, task.cancel)
+        except NotImplementedError:
+            pass
+        try:
+            await task
+        except asyncio.CancelledError:
+            pass
+
+    def close(self):
+        if self.executor is not None:
+            self.executor.shutdown()
+
+
+def main():
+    args = parse_arguments()
+    service = location_service(args.workers, args.max_pending, args.diagnostics_log)
+    try:
+        if args.socket is not None or args.port is not None:
+            asyncio.run(service.run(service.serve_socket(args.socket, args.port)))
+        else:
+            asyncio.run(service.run(service.serve_stdin()))
+    except KeyboardInterrupt:
+        pass
+    finally:
+        service.close()
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
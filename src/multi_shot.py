@@ -0,0 +1,127 @@
+"""
+multi_shot.py: Locates every shot of a burst rather than one shot at a time. Every impulse in each
+               sensor's recording is detected with detect_pulses.detect_all_onsets, the impulses
+               are matched across sensors into one group per shot and every shot is located with
+               find_location, exactly as a single shot is.
+
+               Shots of a burst come from (nearly) the same place, so the time difference of
+               arrival between two sensors is (nearly) the same for every shot. Each sensor's
+               impulses are matched to those of the reference sensor, the one that heard the most,
+               by the lag that the most pairs of impulses agree on within tolerance, among the lags
+               the distance between the two sensors allows. Both sensors' impulses are sorted, so
+               the pairs within that lag are found with a binary search for each impulse rather
+               than by differencing every impulse against every other.
+
+Usage: Keep this file in your working directory and add:
+       import multi_shot
+       shots = multi_shot.detect_shots(smjxs)
+       results = multi_shot.locate_shots(shots["shots"])
+       or run find_pulses.py with --shots.
+"""
+
+import json
+
+import numpy as np
+
+import detect_pulses
+from find_location import find_location
+from location import location
+from sensor_registry import sensor_registry
+import tdoa
+import utc_time
+
+
+"""
+Groups the impulses of M sensors into shots. arrivals holds one ascending array of arrival times per
+sensor, in seconds after a common epoch, positions the (M, 2) easting / northing of the sensors and
+speed the speed of sound. Returns an (S, M) array of the arrival of every shot at every sensor, nan
+where a sensor didn't hear it, with one shot per impulse of the reference sensor in time order.
+tolerance, in seconds, is how far a shot's lag between two sensors may stray from the lag of the
+burst, by the shooter moving or by onset errors; shots closer together than twice it can be
+confused. The lag is voted on by at most voters reference impulses spread over the burst, so the
+work grows linearly with the number of shots: voters times the impulses within the lag bound of
+each, then one binary search per shot to match them.
+"""
+def group_shots(arrivals, positions, speed, tolerance=0.01, voters=64):
+    arrivals = [np.asarray(times, dtype=np.float64) for times in arrivals]
+    positions = np.asarray(positions, dtype=np.float64)
+    reference = int(np.argmax([len(times) for times in arrivals]))
+    anchor = arrivals[reference]
+    grouped = np.full((len(anchor), len(arrivals)), np.nan)
+    grouped[:, reference] = anchor
+    voting = np.unique(np.linspace(0, len(anchor) - 1, min(len(anchor), voters)).astype(np.int64))
+    for sensor, times in enumerate(arrivals):
+        if sensor == reference or len(times) == 0 or len(anchor) == 0:
+            continue
+        bound = np.linalg.norm(positions[sensor] - positions[reference]) / speed + tolerance
+        # The impulses of this sensor within bound of each voting impulse, a run of the sorted times
+        first = np.searchsorted(times, anchor[voting] - bound, side="left")
+        counts = np.searchsorted(times, anchor[voting] + bound, side="right") - first
+        if counts.sum() == 0:
+            continue
+        pairs = np.arange(counts.sum()) + np.repeat(first - (np.cumsum(counts) - counts), counts)
+        anchors = np.repeat(voting, counts)
+        lags = times[pairs] - anchor[anchors]
+        order = np.argsort(lags, kind="stable")
+        lags, anchors = lags[order], anchors[order]
+        # The lag with the most other lags within tolerance of it, and the median of those. A tie,
+        # as when this sensor heard one impulse and the reference heard it and its echo, goes to
+        # the lag pairing the earliest reference impulse: direct sound arrives before its echoes.
+        votes = np.searchsorted(lags, lags + tolerance, side="right") - np.searchsorted(lags, lags - tolerance)
+        tied = np.flatnonzero(votes == votes.max())
+        best = lags[tied[np.argmin(anchors[tied])]]
+        lag = np.median(lags[np.abs(lags - best) <= tolerance])
+        # The impulse of this sensor nearest to where each reference impulse predicts it
+        predicted = anchor + lag
+        after = np.minimum(np.searchsorted(times, predicted), len(times) - 1)
+        before = np.maximum(after - 1, 0)
+        nearest = np.where(np.abs(times[before] - predicted) <= np.abs(times[after] - predicted), before, after)
+        miss = np.abs(times[nearest] - predicted)
+        matched = np.flatnonzero(miss <= tolerance)
+        # An impulse matched to two shots only belongs to the one it is nearer to
+        matched = matched[np.argsort(miss[matched], kind="stable")]
+        _, first = np.unique(nearest[matched], return_index=True)
+        matched = matched[first]
+        grouped[matched, sensor] = times[nearest[matched]]
+    return grouped
+
+
+"""
+Reads the PCM of every WAV file in smjxs, a list of (wavpath, (sample_rate, smjx)) as built by
+find_pulses.main, detects every impulse of each, groups them into shots and returns {"shots": [...]}
+holding a find_pulses.py style pulse_sample (see detect_pulses.pulse_sample_from_onsets) for each
+shot in time order. Shots heard by fewer than 3 sensors are dropped, they can't be located.
+"""
+def detect_shots(smjxs, json_filename=None, tolerance=0.01, **detect_args):
+    shots = {"shots": []}
+    if smjxs:
+        signals, sr = detect_pulses.read_signals(smjxs)
+        smjx_list = [smjx for _, (_, smjx) in smjxs]
+        start_times = np.array([utc_time.parse_utc_ns(smjx["startTimeUTC"]) for smjx in smjx_list])
+        offsets = utc_time.seconds_since(start_times, start_times.min())
+        positions = tdoa.sensor_positions([smjx["geolocation"]["latitude"] for smjx in smjx_list],
+                                          [smjx["geolocation"]["longitude"] for smjx in smjx_list])
+        speed = location().compute_speed(np.mean([smjx["weather"]["temperature"] for smjx in smjx_list]))
+        onsets = detect_pulses.detect_all_onsets(signals, sr, **detect_args)
+        grouped = group_shots([offset + onset / sr for offset, onset in zip(offsets, onsets)], positions, speed,
+                              tolerance)
+        for shot in grouped[np.count_nonzero(~np.isnan(grouped), axis=1) >= 3]:
+            shots["shots"].append(detect_pulses.pulse_sample_from_onsets(smjxs, (shot - offsets) * sr))
+    if json_filename is not None:
+        with open(json_filename, "w") as f:
+            f.write(json.dumps(shots, indent=4, sort_keys=True))
+    return shots
+
+
+"""
+Locates every shot of a list of find_pulses.py style pulse_samples, such as the "shots" of
+detect_shots, with the same find_location as a single shot, passed find_location_args (robust,
+three_d, use_weather, draws). Returns the list of find_location.computed_locations of every shot and
+the (S,) Status of every shot. The shots share a sensor_registry, registry when given, so the
+geometry of sensors that hear several shots is only prepared once.
+"""
+def locate_shots(pulse_samples, registry=None, **find_location_args):
+    registry = sensor_registry() if registry is None else registry
+    located = [find_location(sample, registry=registry, **find_location_args) for sample in pulse_samples]
+    return ([shot.computed_locations for shot in located],
+            np.array([shot.status for shot in located], dtype=np.int8))
@@ -0,0 +1,188 @@
+"""
+pulse_batch.py: Column oriented store for many pulses. Every field is one contiguous numpy array
+                so that incidents, or whole archives of pulses, can be loaded, projected to UTM and
+                handed to the solvers without creating a Python object per pulse. cloud_pulse and
+                location_pulse remain available as thin views onto a single row.
+
+Usage: Keep this file in your working directory and add:
+       from pulse_batch import pulse_batch
+"""
+
+import numpy as np
+
+import conversion as utm
+from location_pulse import location_pulse
+import utc_time
+
+
+class pulse_batch:
+
+    """
+    Takes equal length sequences for each field. pulse_id is the 16 raw bytes of each pulse's
+    UUID and arrival_time is integer nanoseconds since the Unix epoch. If the UTM columns are not
+    given they are computed from latitude and longitude in each pulse's own zone. pdop is the
+    position dilution of precision of each sensor's GPS fix and clock_error the bound on its clock
+    error in seconds (the Scepter "lambda"), nan where a sensor doesn't report one.
+    """
+    def __init__(self, serial_number, pulse_id, latitude, longitude, elevation, arrival_time,
+                 easting=None, northing=None, zone_number=None, zone_letter=None, pdop=None, clock_error=None):
+        self.serial_number = np.asarray(serial_number, dtype=np.str_)
+        self.pulse_id = np.asarray(pulse_id, dtype="S16")
+        self.latitude = np.asarray(latitude, dtype=np.float64)
+        self.longitude = np.asarray(longitude, dtype=np.float64)
+        self.elevation = np.asarray(elevation, dtype=np.float64)
+        self.arrival_time = np.asarray(arrival_time, dtype=np.int64)
+        if easting is None:
+            easting, northing, zone_number, zone_letter = self.project(self.latitude, self.longitude)
+        self.easting = np.asarray(easting, dtype=np.float64)
+        self.northing = np.asarray(northing, dtype=np.float64)
+        self.zone_number = np.asarray(zone_number, dtype=np.int16)
+        self.zone_letter = np.asarray(zone_letter, dtype="U1")
+        self.pdop = self.error_column(pdop)
+        self.clock_error = self.error_column(clock_error)
+        # Arrival times as float seconds after the earliest arrival, the timebase of the solvers
+        self.epoch = int(self.arrival_time.min()) if len(self.arrival_time) else 0
+        self.arrival_offset = utc_time.seconds_since(self.arrival_time, self.epoch)
+
+    """
+    Builds a batch from the "pulses" list of a find_pulses.py style json, reading each field
+    straight into its column. With common_zone the pulses are coerced to their majority UTM zone as
+    they are projected (see coerce_utm), so a batch spanning zones costs no more to load than one
+    inside a single zone. A sensor_registry may be passed with common_zone to reuse the zones and
+    projections of sensors seen in earlier batches. The optional "pdop" and "lambda" of a pulse are
+    read from its location (the smjx geolocation) or from the pulse itself.
+    """
+    @classmethod
+    def from_json(cls, json_pulses, common_zone=False, registry=None):
+        errors = (np.array([cls.error_field(pulse, "pdop") for pulse in json_pulses], dtype=np.float64),
+                  np.array([cls.error_field(pulse, "lambda") for pulse in json_pulses], dtype=np.float64))
+        columns = (np.array([pulse["serialNumber"] for pulse in json_pulses], dtype=np.str_),
+                   np.array([bytes.fromhex(pulse["pulseId"].replace("-", "")) for pulse in json_pulses],
+                            dtype="S16"),
+                   np.array([pulse["location"]["latitude"] for pulse in json_pulses], dtype=np.float64),
+                   np.array([pulse["location"]["longitude"] for pulse in json_pulses], dtype=np.float64),
+                   np.array([pulse["location"]["elevation"] for pulse in json_pulses], dtype=np.float64),
+                   utc_time.parse_utc_ns_array([pulse["arrivalTime"] for pulse in json_pulses]))
+        if not common_zone or len(json_pulses) == 0:
+            return cls(*columns, pdop=errors[0], clock_error=errors[1])
+        latitude, longitude = columns[2], columns[3]
+        if registry is not None:
+            subset = registry.project(columns[0], latitude, longitude, columns[4])
+            if subset.keep is not None:
+                columns = tuple(column[subset.keep] for column in columns)
+                errors = tuple(column[subset.keep] for column in errors)
+            # Copied so that changes to the batch can't reach the registry
+            return cls(*columns, subset.easting.copy(), subset.northing.copy(),
+                       np.full(len(subset.easting), subset.zone_number, dtype=np.int16),
+                       np.full(len(subset.easting), subset.zone_letter, dtype="U1"), *errors)
+        zone_number, zone_letter, keep = cls.majority_zone(utm.latlon_to_zone_number(latitude, longitude),
+                                                           utm.latitude_to_zone_letter(latitude))
+        if keep is not None:
+            columns = tuple(column[keep] for column in columns)
+            errors = tuple(column[keep] for column in errors)
+            latitude, longitude = columns[2], columns[3]
+        return cls(*columns, *cls.project(latitude, longitude, zone_number, zone_letter), *errors)
+
+    """
+    The float value of an optional per sensor error field of a json pulse, looked for in its
+    location and then in the pulse itself, nan when neither has it.
+    """
+    @staticmethod
+    def error_field(pulse, name):
+        value = pulse["location"].get(name, pulse.get(name))
+        return np.nan if value is None else float(value)
+
+    """
+    An optional per sensor error column as float64, all nan when not given.
+    """
+    def error_column(self, column):
+        if column is None:
+            return np.full(len(self.arrival_time), np.nan)
+        return np.asarray(column, dtype=np.float64)
+
+    """
+    Converts latitude / longitude columns to UTM in a single call, each point in its own zone
+    unless a zone number and letter are forced.
+    """
+    @staticmethod
+    def project(latitude, longitude, force_zone_number=None, force_zone_letter=None):
+        if len(latitude) == 0:
+            return np.empty(0), np.empty(0), np.empty(0, dtype=np.int16), np.empty(0, dtype="U1")
+        easting, northing, zone_number, zone_letter = utm.from_latlon(latitude, longitude, force_zone_number,
+                                                                      force_zone_letter)
+        zone_number = np.array(np.broadcast_to(zone_number, easting.shape))
+        zone_letter = np.array(np.broadcast_to(zone_letter, easting.shape))
+        return easting, northing, zone_number, zone_letter
+
+    """
+    A new batch holding only the selected rows, index may be a boolean mask or integer indices.
+    """
+    def select(self, index):
+        return pulse_batch(self.serial_number[index], self.pulse_id[index], self.latitude[index],
+                           self.longitude[index], self.elevation[index], self.arrival_time[index],
+                           self.easting[index], self.northing[index], self.zone_number[index],
+                           self.zone_letter[index], self.pdop[index], self.clock_error[index])
+
+    """
+    The majority zone number and majority zone letter of the given zone columns, each found with
+    a single bincount with ties going to the lowest zone number / letter, and the mask of pulses
+    to keep. Pulses whose own zone is more than one zone away from the majority zone (counting
+    across the 60 / 1 wrap) are excluded: a sensor that far from the rest of the array can't
+    belong to the same incident, and UTM distortion grows quickly outside a zone. Pulses in a
+    neighbouring zone, or with a different zone letter, are kept. The mask is None when every
+    pulse is already in one zone.
+    """
+    @staticmethod
+    def majority_zone(zone_number, zone_letter):
+        zone_counts = np.bincount(zone_number, minlength=61)
+        letter_counts = np.bincount(zone_letter.view(np.uint32) - ord("A"), minlength=26)
+        max_zone = int(np.argmax(zone_counts))
+        max_letter = chr(ord("A") + int(np.argmax(letter_counts)))
+        if np.count_nonzero(zone_counts) == 1:
+            return max_zone, max_letter, None
+        zone_distance = np.abs(zone_number.astype(np.int64) - max_zone)
+        return max_zone, max_letter, np.minimum(zone_distance, 60 - zone_distance) <= 1
+
+    """
+    Coerces every pulse into the majority UTM zone and letter, dropping the pulses more than one
+    zone away (see majority_zone). The pulses not already in the majority zone are reprojected
+    from their stored lat / lon in one array call. A batch already in a single zone and letter is
+    returned as is.
+    """
+    def coerce_utm(self):
+        if len(self) == 0:
+            return self
+        max_zone, max_letter, keep = self.majority_zone(self.zone_number, self.zone_letter)
+        off_zone = (self.zone_number != max_zone) | (self.zone_letter != max_letter)
+        if not off_zone.any():
+            return self
+        if keep is None:
+            keep = np.ones(len(self), dtype=bool)
+        # select copies the columns, so only the off zone rows need updating in place
+        coerced = self.select(keep)
+        off_zone = off_zone[keep]
+        # Every off zone pulse may have been dropped
+        if off_zone.any():
+            coerced.easting[off_zone], coerced.northing[off_zone], _, _ = utm.from_latlon(
+                coerced.latitude[off_zone], coerced.longitude[off_zone], max_zone, max_letter)
+        coerced.zone_number[:] = max_zone
+        coerced.zone_letter[:] = max_letter
+        return coerced
+
+    """
+    The (N, 3) array of easting, northing and elevation used by the solvers.
+    """
+    @property
+    def locations(self):
+        return np.stack((self.easting, self.northing, self.elevation), axis=1)
+
+    def __len__(self):
+        return len(self.arrival_time)
+
+    """
+    Integer indexing returns a location_pulse view of that row, anything else a new batch.
+    """
+    def __getitem__(self, index):
+        if isinstance(index, (int, np.integer)):
+            return location_pulse(self, int(index))
+        return self.select(index)
@@ -0,0 +1,187 @@
+"""
+sensor_registry.py: Registry of the fixed sensors seen by a long running process, keyed by serial
+                    number, so that repeat incidents don't redo any geometry work. It remembers
+
+                    - each sensor's geolocation, its own UTM zone and its UTM coordinates in
+                      every zone it has been projected into,
+                    - for each subset of sensors that reported an incident, the majority zone
+                      coercion of the subset (which sensors are kept, and their coordinates),
+                    - for each coerced subset, the reference_geometry used by
+                      location.loc2D_references: the pseudo-inverse of every reference relative
+                      geometry matrix, rSquared and the pairwise baselines.
+
+                    All three are evicted least recently used first. When a sensor reports a
+                    geolocation different from the one registered (it was moved or resurveyed),
+                    everything computed from the old position is dropped. Hit, miss, invalidation
+                    and eviction counts are kept in counters.
+
+Usage: Keep this file in your working directory and add:
+       from sensor_registry import sensor_registry
+       then pass one instance to every find_location (or pulse_batch.from_json) call.
+"""
+
+from collections import OrderedDict
+
+import numpy as np
+
+import conversion as utm
+from location import reference_geometry
+from pulse_batch import pulse_batch
+
+
+"""
+What the registry knows about one sensor: the geolocation it was registered with, its own UTM zone
+and its (easting, northing) in each (zone number, zone letter) it has been projected into.
+"""
+class registered_sensor:
+
+    def __init__(self, geolocation):
+        self.geolocation = geolocation
+        self.zone = None
+        self.projections = {}
+
+
+"""
+The majority zone coercion of one subset of sensors: the zone, the mask of sensors kept (None when
+all are) and the easting / northing of the kept sensors in that zone.
+"""
+class coerced_subset:
+
+    def __init__(self, zone_number, zone_letter, keep, easting, northing):
+        self.zone_number = zone_number
+        self.zone_letter = zone_letter
+        self.keep = keep
+        self.easting = easting
+        self.northing = northing
+
+
+class sensor_registry:
+
+    """
+    Keeps at most max_sensors sensors, max_subsets coerced subsets and max_geometries reference
+    geometries.
+    """
+    def __init__(self, max_sensors=100000, max_subsets=10000, max_geometries=10000):
+        self.max_sensors = max_sensors
+        self.max_subsets = max_subsets
+        self.max_geometries = max_geometries
+        self.sensors = OrderedDict()
+        self.subsets = OrderedDict()
+        self.geometries = OrderedDict()
+        # Serial number to the keys of the subsets and geometries that include that sensor
+        self.dependents = {}
+        self.counters = dict.fromkeys(("sensor_hits", "sensor_misses", "projection_hits", "projection_misses",
+                                       "subset_hits", "subset_misses", "geometry_hits", "geometry_misses",
+                                       "invalidations", "evictions"), 0)
+
+    """
+    The registered_sensor for serial_number, registering it if it is new and starting afresh if it
+    reports a different geolocation than before.
+    """
+    def sensor(self, serial_number, geolocation):
+        sensor = self.sensors.get(serial_number)
+        if sensor is not None and sensor.geolocation == geolocation:
+            self.sensors.move_to_end(serial_number)
+            self.counters["sensor_hits"] += 1
+            return sensor
+        if sensor is not None:
+            self.counters["invalidations"] += 1
+            self.forget(serial_number)
+        else:
+            self.counters["sensor_misses"] += 1
+        sensor = registered_sensor(geolocation)
+        self.sensors[serial_number] = sensor
+        while len(self.sensors) > self.max_sensors:
+            self.counters["evictions"] += 1
+            self.forget(next(iter(self.sensors)))
+        return sensor
+
+    """
+    Drops a sensor and every subset and geometry computed from its position.
+    """
+    def forget(self, serial_number):
+        self.sensors.pop(serial_number, None)
+        for key in self.dependents.pop(serial_number, ()):
+            self.subsets.pop(key, None)
+            self.geometries.pop(key, None)
+            for other in key[0]:
+                self.dependents.get(other, set()).discard(key)
+
+    """
+    Stores value under key in one of the least recently used caches, indexing it under each of the
+    key's serial numbers, and evicts the oldest entries beyond limit.
+    """
+    def remember(self, cache, key, value, limit):
+        cache[key] = value
+        for serial_number in key[0]:
+            self.dependents.setdefault(serial_number, set()).add(key)
+        while len(cache) > limit:
+            self.counters["evictions"] += 1
+            old_key, _ = cache.popitem(last=False)
+            for serial_number in old_key[0]:
+                self.dependents.get(serial_number, set()).discard(old_key)
+
+    """
+    The UTM coordinates of the given sensors coerced to their majority zone, as
+    pulse_batch.from_json(common_zone=True) computes them. Returns a coerced_subset, which is
+    cached for the exact same sequence of serial numbers, and each sensor's projection is cached
+    per zone for other subsets it appears in.
+    """
+    def project(self, serial_number, latitude, longitude, elevation):
+        serials = tuple(serial_number.tolist())
+        geolocations = list(zip(latitude.tolist(), longitude.tolist(), elevation.tolist()))
+        sensors = [self.sensor(serial, geolocation) for serial, geolocation in zip(serials, geolocations)]
+        key = (serials,)
+        subset = self.subsets.get(key)
+        if subset is not None:
+            self.subsets.move_to_end(key)
+            self.counters["subset_hits"] += 1
+            return subset
+        self.counters["subset_misses"] += 1
+        unzoned = [i for i, sensor in enumerate(sensors) if sensor.zone is None]
+        if unzoned:
+            zone_numbers = utm.latlon_to_zone_number(latitude[unzoned], longitude[unzoned])
+            zone_letters = utm.latitude_to_zone_letter(latitude[unzoned])
+            for i, zone_number, zone_letter in zip(unzoned, zone_numbers.tolist(), zone_letters.tolist()):
+                sensors[i].zone = (zone_number, zone_letter)
+        zone_number, zone_letter, keep = pulse_batch.majority_zone(
+            np.array([sensor.zone[0] for sensor in sensors]), np.array([sensor.zone[1] for sensor in sensors],
+                                                                       dtype="U1"))
+        kept = range(len(sensors)) if keep is None else np.flatnonzero(keep).tolist()
+        zone = (zone_number, zone_letter)
+        unprojected = [i for i in kept if zone not in sensors[i].projections]
+        self.counters["projection_hits"] += len(kept) - len(unprojected)
+        self.counters["projection_misses"] += len(unprojected)
+        if unprojected:
+            easting, northing, _, _ = utm.from_latlon(latitude[unprojected], longitude[unprojected], zone_number,
+                                                      zone_letter)
+            for i, e, n in zip(unprojected, easting.tolist(), northing.tolist()):
+                sensors[i].projections[zone] = (e, n)
+        projected = np.array([sensors[i].projections[zone] for i in kept], dtype=np.float64).reshape(-1, 2)
+        subset = coerced_subset(zone_number, zone_letter, keep, projected[:, 0], projected[:, 1])
+        self.remember(self.subsets, key, subset, self.max_subsets)
+        return subset
+
+    """
+    The reference_geometry of the given (already registered and coerced) sensors at locations in
+    the given zone, built on the first call for that sequence of serial numbers and zone.
+    """
+    def geometry(self, serial_number, zone_number, zone_letter, locations):
+        key = (tuple(serial_number.tolist()), zone_number, zone_letter)
+        geometry = self.geometries.get(key)
+        if geometry is not None:
+            self.geometries.move_to_end(key)
+            self.counters["geometry_hits"] += 1
+            return geometry
+        self.counters["geometry_misses"] += 1
+        geometry = reference_geometry(locations)
+        self.remember(self.geometries, key, geometry, self.max_geometries)
+        return geometry
+
+    """
+    The counters along with the number of sensors, subsets and geometries currently held.
+    """
+    def stats(self):
+        stats = dict(self.counters)
+        stats.update(sensors=len(self.sensors), subsets=len(self.subsets), geometries=len(self.geometries))
+        return stats
@@ -0,0 +1,192 @@
+"""
+service_stages.py: The benchmark.py stages of serving locations: find_location.py against the
+                   location service, the sensor registry over a fleet of sensors and the pulse
+                   associator on a city wide feed.
+
+Usage: Run through benchmark.py, for example:
+       python src/benchmark.py associate --sensors 400
+"""
+
+import asyncio
+import json
+import os
+import socket
+import subprocess
+import sys
+import tempfile
+import time
+
+import numpy as np
+
+from associator import pulse_associator
+from find_location import find_location
+from location import location
+from pulse_batch import pulse_batch
+from sensor_registry import sensor_registry
+from synthetic import example_requests, fleet_requests, synthetic_feed, timed
+
+
+def report_latency(name, latencies, elapsed):
+    p50, p99 = 1e3 * np.percentile(latencies, [50, 99])
+    sys.stdout.write("{0:30s} p50 {1:8.2f} ms   p99 {2:8.2f} ms   {3:8.1f} locations/s\n".format(
+        name, p50, p99, len(latencies) / elapsed))
+
+
+"""
+The current path: write the pulse json to a file and run find_location.py on it, once per location.
+"""
+def bench_cli(requests, runs):
+    script = os.path.join(os.path.dirname(os.path.abspath(__file__)), "find_location.py")
+    latencies = []
+    with tempfile.TemporaryDirectory() as directory:
+        start = time.perf_counter()
+        for i in range(runs):
+            began = time.perf_counter()
+            json_path = os.path.join(directory, "{0}.json".format(i))
+            with open(json_path, "w") as f:
+                json.dump(requests[i % len(requests)], f)
+            subprocess.run([sys.executable, script, json_path], stdout=subprocess.DEVNULL,
+                           stderr=subprocess.DEVNULL)
+            latencies.append(time.perf_counter() - began)
+        elapsed = time.perf_counter() - start
+    report_latency("find_location.py", latencies, elapsed)
+
+
+"""
+Sends total requests to the service listening on port from the given number of concurrent
+clients, each waiting for the response to one request before sending the next. Returns the
+latency of every request and the elapsed time.
+"""
+async def replay(port, requests, total, clients):
+    latencies = []
+
+    async def client(count):
+        reader, writer = await asyncio.open_connection("127.0.0.1", port, limit=2**24)
+        for i in range(count):
+            line = json.dumps(dict(requests[i % len(requests)], id=i)) + "\n"
+            began = time.perf_counter()
+            writer.write(line.encode())
+            await writer.drain()
+            response = json.loads(await reader.readline())
+            if "error" in response:
+                raise RuntimeError(response["error"])
+            latencies.append(time.perf_counter() - began)
+        writer.close()
+
+    start = time.perf_counter()
+    await asyncio.gather(*(client(total // clients) for _ in range(clients)))
+    return latencies, time.perf_counter() - start
+
+
+def start_service(workers):
+    with socket.socket() as probe:
+        probe.bind(("127.0.0.1", 0))
+        port = probe.getsockname()[1]
+    script = os.path.join(os.path.dirname(os.path.abspath(__file__)), "location_service.py")
+    process = subprocess.Popen([sys.executable, script, "--port", str(port), "--workers", str(workers)])
+    deadline = time.perf_counter() + 30
+    while True:
+        try:
+            socket.create_connection(("127.0.0.1", port)).close()
+            return process, port
+        except ConnectionError:
+            if time.perf_counter() > deadline or process.poll() is not None:
+                process.kill()
+                raise
+            time.sleep(0.05)
+
+
+"""
+Load generator: replays the example incidents through find_location.py one process per location,
+then through a resident location_service.py with each worker count and number of concurrent
+clients, reporting p50 / p99 latency and throughput.
+"""
+def bench_service(cli_runs, total, clients, workers):
+    requests = example_requests()
+    bench_cli(requests, cli_runs)
+    for count in workers:
+        process, port = start_service(count)
+        try:
+            # One untimed pass so every worker has imported everything and filled its cache
+            asyncio.run(replay(port, requests, max(count, 1) * len(requests), max(count, 1)))
+            for concurrency in clients:
+                latencies, elapsed = asyncio.run(replay(port, requests, total, concurrency))
+                report_latency("service, {0} workers, {1} clients".format(count, concurrency), latencies,
+                               elapsed)
+        finally:
+            process.terminate()
+            process.wait()
+
+
+"""
+Locates the same stream of fleet incidents without a registry, with a fresh registry and again
+with the now warm registry, then times the geometry dependent solve on its own.
+"""
+def bench_registry(incidents, fleet, subsets, sensors, seed):
+    requests = fleet_requests(incidents, fleet, subsets, sensors, seed)
+    registry = sensor_registry()
+
+    def locate_all(registry=None):
+        return [find_location(request, registry=registry).computed_locations for request in requests]
+
+    plain_time, plain = timed(locate_all, repeat=1)
+    cold_time, _ = timed(locate_all, registry, repeat=1)
+    warm_time, warm = timed(locate_all, registry, repeat=1)
+    differences = [abs(a.self_consistent_error - b.self_consistent_error) for x, y in zip(plain, warm)
+                   for a, b in zip(x, y)]
+    for name, elapsed in (("no registry", plain_time), ("cold registry", cold_time), ("warm registry", warm_time)):
+        sys.stdout.write("{0:14s} {1:10.0f} incidents/s\n".format(name, incidents / elapsed))
+    sys.stdout.write("largest error difference: {0:.3g}\n".format(max(differences, default=0.0)))
+    sys.stdout.write("{0}\n".format(registry.stats()))
+    batch = pulse_batch.from_json(requests[0]["pulses"], common_zone=True)
+    locations = batch.locations
+    locations[:, 2] = 0.0
+    geometry = registry.geometry(batch.serial_number, int(batch.zone_number[0]), str(batch.zone_letter[0]),
+                                 locations)
+    loc = location()
+    speed = loc.compute_speed(20.0)
+    runs = 2000
+    unprepared, _ = timed(lambda: [loc.loc2D_references(locations, batch.arrival_offset, speed)
+                                   for _ in range(runs)])
+    prepared, _ = timed(lambda: [loc.loc2D_references(locations, batch.arrival_offset, speed, geometry)
+                                 for _ in range(runs)])
+    sys.stdout.write("loc2D_references: {0:.1f} us, with cached geometry {1:.1f} us\n".format(
+        1e6 * unprepared / runs, 1e6 * prepared / runs))
+
+
+"""
+Feeds a synthetic city wide feed through pulse_associator, reporting pulses per second grouping
+alone and grouping and locating, how many of the incidents heard by 3 or more sensors came out as
+a candidate with exactly their own pulses and how fragmented the rest are: split over several
+candidates, or sharing one with the pulses of another incident.
+"""
+def bench_associate(sensors, size, incidents, rate, radius, false_pulses, seed):
+    pulses, weather, truth = synthetic_feed(sensors, size, incidents, rate, radius, false_pulses, seed)
+    for locate in (False, True):
+        associator = pulse_associator(weather, radius=radius, locate=locate)
+        start = time.perf_counter()
+        closed = [incident for pulse in pulses for incident in associator.add(pulse)] + associator.flush()
+        elapsed = time.perf_counter() - start
+        sys.stdout.write("{0:9s} {1} pulses from {2} sensors: {3:9.0f} pulses/s, {4} candidate incidents, {5} too "
+                         "small, {6} pulses moved\n".format("locate" if locate else "associate", len(pulses), sensors,
+                                                           len(pulses) / elapsed, len(closed),
+                                                           associator.counters["dropped"], associator.counters["moved"]))
+    pulse_row = {pulse["pulseId"]: row for row, pulse in enumerate(pulses)}
+    heard = np.bincount(truth[truth >= 0], minlength=incidents)
+    # The incidents heard by 3 or more sensors that some candidate holds all and only the pulses of,
+    # each counted once however many candidates hold them, and the number of candidates holding
+    # pulses of each incident
+    exact = set()
+    pieces = np.zeros(incidents, dtype=np.int64)
+    mixed = 0
+    for incident in closed:
+        owners = truth[[pulse_row[pulse["pulseId"]] for pulse in incident.pulses]]
+        if len(owners) >= 3 and owners[0] >= 0 and (owners == owners[0]).all() and len(owners) == heard[owners[0]]:
+            exact.add(int(owners[0]))
+        shots = np.unique(owners[owners >= 0])
+        pieces[shots] += 1
+        mixed += len(shots) > 1
+    sys.stdout.write("{0} of the {1} incidents heard by 3 or more sensors grouped exactly, {2} split over several "
+                     "candidates, {3} candidates mixing incidents\n".format(
+                         len(exact), np.count_nonzero(heard >= 3), np.count_nonzero((heard >= 3) & (pieces > 1)),
+                         mixed))
@@ -1,10 +1,17 @@
 """
 Scott Lamkin 09/13/2022 - ShotSpotter
 
-smjx_reader.py: Module to read "smjx" metadata chunk and sample rate from ShotSpotter WAV files.
+smjx_reader.py: Module to read "smjx" metadata chunk, sample rate and PCM samples from ShotSpotter
+                WAV files. open_pcm maps the samples of the "data" chunk straight from the file
+                (pcm_from_bytes for a file already in memory) without reading or copying them, so
+                that the few milliseconds around an event can be sliced out of a long recording by
+                UTC time.
 
 Usage: On import, read_smjx_from_file method passes the sample_rate for usage with find_pulses.py.
        As a script point to a ShotSpotter WAV file.
+
+       recording = smjx_reader.open_pcm(wavpath)
+       samples = recording.window("2022-09-21T06:52:02.100Z", "2022-09-21T06:52:02.150Z")
 """
 
 import os
@@ -14,6 +21,22 @@ import json
 import pathlib
 import zlib
 
+import numpy as np
+
+import utc_time
+
+
+# The numpy type of one sample for each (audio format, bits per sample) of a "fmt " chunk, integer
+# PCM (format 1) and IEEE float (format 3)
+pcm_formats = {(1, 8): "u1", (1, 16): "<i2", (1, 32): "<i4", (3, 32): "<f4", (3, 64): "<f8"}
+
+# Integer PCM sample sizes numpy has no type for, by bits per sample: the numpy type they are
+# widened to and the number of bytes they are packed in (see widen_samples)
+packed_formats = {24: ("<i4", 3)}
+
+# The "fmt " audio format of WAVE_FORMAT_EXTENSIBLE files, whose real format is their sub format
+extensible_format = 0xFFFE
+
 
 def parse_arguments():
     parser = argparse.ArgumentParser(description='path to wave file')
@@ -32,35 +55,86 @@ def read_wav_into_binary(wavpath):
 def read_RIFF_chunks(bindata):
     if (bindata[:4] != b'RIFF') or (bindata[8:12] != b'WAVE'):
         raise IOError
-    all_chunks = read_all_chunks(bindata[12:])
+    all_chunks = read_all_chunks(memoryview(bindata)[12:])
     return all_chunks
 
 
+"""
+Walks the chunks of bindata, the chunk list that follows the RIFF / WAVE header (as passed by
+read_RIFF_chunks), by offset. Chunks are returned as memoryview slices of bindata so no audio data
+is copied.
+"""
 def read_all_chunks(bindata):
+    view = memoryview(bindata)
     chunk_names = []
     chunk_lengths = []
     chunks = []
-    remainder = 0
-    while True:
-        bindata, remainder, chunk_name, chunk_length, chunk = read_next_chunk(bindata, remainder)
-        if chunk_length <= 1:
-            break
+
+    def read_header(offset):
+        return bytes(view[offset:offset+8])
+
+    for chunk_name, offset, chunk_length in walk_chunks(read_header, 0, len(view)):
         chunk_names.append(chunk_name)
         chunk_lengths.append(chunk_length)
-        chunks.append(chunk)
+        chunks.append(view[offset:offset+chunk_length])
     return chunk_names, chunk_lengths, chunks
 
 
-def read_next_chunk(bindata, remainder):
-    chunk_name = bindata[:4]
-    chunk_length = int.from_bytes(bindata[4:8], byteorder="little")
-    if remainder > 0:
-        bindata = bindata[1:]
-        remainder = 0
-    chunk = bindata[8:8+chunk_length]
-    if chunk_length % 2 == 1:
-        remainder = 1
-    return bindata[8+chunk_length:], remainder, chunk_name, chunk_length, chunk
+"""
+Lazily yields (chunk_name, offset, chunk_length) for every chunk after the RIFF / WAVE header,
+where offset is the position of the chunk's data. source is either a seekable binary file, which
+is read header by header with seeks over the chunk data, or an in memory bytes-like object.
+"""
+def iter_chunk_headers(source):
+    if hasattr(source, "seek"):
+        source.seek(0, os.SEEK_END)
+        size = source.tell()
+        source.seek(0)
+        header = source.read(12)
+
+        def read_header(offset):
+            source.seek(offset)
+            return source.read(8)
+    else:
+        size = len(source)
+        header = bytes(source[:12])
+
+        def read_header(offset):
+            return bytes(source[offset:offset+8])
+    if (header[:4] != b'RIFF') or (header[8:12] != b'WAVE'):
+        raise IOError
+    yield from walk_chunks(read_header, 12, size)
+
+
+"""
+Yields (chunk_name, offset, chunk_length) for the chunks from offset to size, reading each 8 byte
+chunk header with read_header(offset). Odd length chunks are followed by a pad byte. A chunk whose
+declared length runs past size (as in recordings that were cut short) is truncated to what is
+actually there, and a partial header at the end is ignored.
+"""
+def walk_chunks(read_header, offset, size):
+    while offset + 8 <= size:
+        chunk_header = read_header(offset)
+        chunk_name = chunk_header[:4]
+        chunk_length = int.from_bytes(chunk_header[4:8], byteorder="little")
+        offset += 8
+        chunk_length = min(chunk_length, size - offset)
+        yield chunk_name, offset, chunk_length
+        offset += chunk_length + (chunk_length % 2)
+
+
+"""
+Index of chunk name to (offset, length) of the chunk's data for the WAV file at wavpath, read
+from the chunk headers alone. If a chunk name repeats the first is kept.
+"""
+def read_chunk_index(wavpath):
+    if not os.path.exists(wavpath):
+        raise IOError
+    with open(wavpath, 'rb') as f:
+        index = {}
+        for chunk_name, offset, chunk_length in iter_chunk_headers(f):
+            index.setdefault(chunk_name, (offset, chunk_length))
+        return index
 
 
 def parse_smjx_chunk(smjx_chunk):
@@ -72,12 +146,214 @@ def read_sr(fmt__chunk):
     return int.from_bytes(fmt__chunk[4:8], byteorder="little")
 
 
+"""
+The fields of a "fmt " chunk that describe the PCM layout of the "data" chunk. For
+WAVE_FORMAT_EXTENSIBLE files audio_format is the format of the sub format GUID.
+"""
+def read_fmt(fmt__chunk):
+    audio_format = int.from_bytes(fmt__chunk[0:2], byteorder="little")
+    if audio_format == extensible_format and len(fmt__chunk) >= 26:
+        audio_format = int.from_bytes(fmt__chunk[24:26], byteorder="little")
+    return {"audio_format": audio_format,
+            "channels": int.from_bytes(fmt__chunk[2:4], byteorder="little"),
+            "sample_rate": int.from_bytes(fmt__chunk[4:8], byteorder="little"),
+            "block_align": int.from_bytes(fmt__chunk[12:14], byteorder="little"),
+            "bits_per_sample": int.from_bytes(fmt__chunk[14:16], byteorder="little")}
+
+
+"""
+The numpy dtype of one frame of the "data" chunk described by fmt (see read_fmt): a record of
+block_align bytes whose "samples" field holds one sample per channel, so that frames padded
+beyond their samples are still viewed without copying. Packed samples (24 bit) are held as their
+bytes, one row of them per channel.
+"""
+def frame_dtype(fmt):
+    sample = pcm_formats.get((fmt["audio_format"], fmt["bits_per_sample"]))
+    shape = (fmt["channels"],)
+    if sample is None and fmt["audio_format"] == 1 and fmt["bits_per_sample"] in packed_formats:
+        sample = "u1"
+        shape = (fmt["channels"], packed_formats[fmt["bits_per_sample"]][1])
+    if sample is None or fmt["channels"] < 1 or fmt["block_align"] < np.dtype((sample, shape)).itemsize:
+        raise ValueError("Unsupported WAV format {0}".format(fmt))
+    return np.dtype({"names": ["samples"], "formats": [(sample, shape)], "offsets": [0],
+                     "itemsize": fmt["block_align"]})
+
+
+"""
+The (frames, channels) samples of a view of frames of frame_dtype(fmt). Packed samples are widened
+into a new array of the next numpy type, in its most significant bytes so that full scale is the
+same as for that type, everything else is returned as a view.
+"""
+def frame_samples(frames, fmt):
+    samples = frames["samples"]
+    if samples.ndim == 2:
+        return samples
+    return widen_samples(samples, packed_formats[fmt["bits_per_sample"]][0])
+
+
+def widen_samples(packed, wide):
+    wide = np.dtype(wide)
+    widened = np.zeros(packed.shape[:2] + (wide.itemsize,), dtype=np.uint8)
+    widened[..., wide.itemsize - packed.shape[2]:] = packed
+    return widened.view(wide)[..., 0]
+
+
+"""
+The PCM samples of one ShotSpotter WAV file as a read only (frames, channels) view onto the file or
+buffer they are stored in, with what is needed to address them by UTC time and scale them to sound
+pressure. Made by open_pcm or pcm_from_bytes.
+
+start_time is the smjx startTimeUTC of the first frame in integer nanoseconds since the Unix epoch,
+transducers the smjx transducer of each channel (None for a channel no transducer reports) and
+full_scale the fullScale of each channel, taken to be the sound pressure level in dB re 20 uPa of a
+full scale sample (nan when not reported).
+"""
+class pcm_recording:
+
+    def __init__(self, samples, fmt, smjx):
+        self.samples = samples
+        self.fmt = fmt
+        self.sample_rate = fmt["sample_rate"]
+        self.smjx = smjx
+        self.start_time = utc_time.parse_utc_ns(smjx["startTimeUTC"])
+        self.transducers = [None] * fmt["channels"]
+        for transducer in smjx.get("transducers", []):
+            if 0 <= transducer.get("channel", -1) < fmt["channels"]:
+                self.transducers[transducer["channel"]] = transducer
+        self.full_scale = np.array([np.nan if transducer is None else transducer.get("fullScale", np.nan)
+                                    for transducer in self.transducers], dtype=np.float64)
+
+    def __len__(self):
+        return len(self.samples)
+
+    """
+    The frame, as a float, at a UTC time given as integer nanoseconds since the Unix epoch or as an
+    ISO 8601 string.
+    """
+    def frame(self, time):
+        if isinstance(time, str):
+            time = utc_time.parse_utc_ns(time)
+        return utc_time.seconds_since(np.int64(time), self.start_time) * self.sample_rate
+
+    """
+    The (frames, channels) view of the samples from UTC time start up to end (see frame for the
+    forms they may take), clipped to the recording, without copying. A window entirely outside the
+    recording is empty.
+    """
+    def window(self, start, end):
+        first = min(max(int(np.floor(self.frame(start))), 0), len(self.samples))
+        last = min(max(int(np.ceil(self.frame(end))), first), len(self.samples))
+        return self.samples[first:last]
+
+    """
+    Samples (all of them, or a window of them) as sound pressure in pascals, using the full_scale of
+    every channel. Unlike window this makes a new float array.
+    """
+    def pressure(self, samples=None):
+        samples = self.samples if samples is None else samples
+        if samples.dtype.kind == "f":
+            normalized = np.asarray(samples, dtype=np.float64)
+        elif samples.dtype.kind == "u":
+            half = 2.0**(8 * samples.dtype.itemsize - 1)
+            normalized = (samples.astype(np.float64) - half) / half
+        else:
+            normalized = samples / 2.0**(8 * samples.dtype.itemsize - 1)
+        return normalized * (20e-6 * 10**(self.full_scale / 20))
+
+
+"""
+Maps the "data" chunk of the ShotSpotter WAV file at wavpath as a pcm_recording without reading the
+samples: they are paged in from the file as they are touched. Only the chunk headers, the "fmt "
+chunk and the smj* chunk are read.
+"""
+def open_pcm(wavpath):
+    index = read_chunk_index(wavpath)
+    if b'fmt ' not in index or b'data' not in index:
+        raise ValueError("No fmt or data chunk found in {0}".format(wavpath))
+    smjx_name = next((name for name in index if name.startswith(b'smj')), None)
+    if smjx_name is None:
+        raise ValueError("No smjx chunk found in {0}".format(wavpath))
+    with open(wavpath, 'rb') as f:
+        f.seek(index[b'fmt '][0])
+        fmt = read_fmt(f.read(index[b'fmt '][1]))
+        f.seek(index[smjx_name][0])
+        smjx = parse_smjx_chunk(f.read(index[smjx_name][1]))
+    return pcm_recording(map_samples(wavpath, index[b'data'], fmt), fmt, smjx)
+
+
+"""
+The read only (frames, channels) memory map of the samples of the "data" chunk at (offset, length)
+in the WAV file at wavpath, laid out as fmt (see read_fmt) describes. 24 bit samples have no numpy
+type to map them as, they are read whole and widened to int32 (see frame_samples).
+"""
+def map_samples(wavpath, data, fmt):
+    dtype = frame_dtype(fmt)
+    offset, length = data
+    frames = length // dtype.itemsize
+    if frames == 0:
+        # A zero length memory map can't be made
+        return frame_samples(np.empty(0, dtype=dtype), fmt)
+    return frame_samples(np.memmap(wavpath, dtype=dtype, mode="r", offset=offset, shape=(frames,)), fmt)
+
+
+"""
+The pcm_recording of a ShotSpotter WAV file already in memory (bytes, bytearray, mmap or memoryview
+of the whole file), viewing its samples in place.
+"""
+def pcm_from_bytes(bindata):
+    chunk_names, _, chunks = read_RIFF_chunks(bindata)
+    chunk_map = {}
+    for chunk_name, chunk in zip(chunk_names, chunks):
+        chunk_map.setdefault(b'smjx' if chunk_name.startswith(b'smj') else chunk_name, chunk)
+    if b'fmt ' not in chunk_map or b'data' not in chunk_map or b'smjx' not in chunk_map:
+        raise ValueError("No fmt, data or smjx chunk found")
+    fmt = read_fmt(bytes(chunk_map[b'fmt ']))
+    dtype = frame_dtype(fmt)
+    data = chunk_map[b'data']
+    samples = frame_samples(np.frombuffer(data, dtype=dtype, count=len(data) // dtype.itemsize), fmt)
+    return pcm_recording(samples, fmt, parse_smjx_chunk(chunk_map[b'smjx']))
+
+
+"""
+The sample rate and the PCM samples of the "data" chunk of a WAV file, with or without an smjx
+chunk, as a read only (frames, channels) memory map of their native type (see map_samples). Only
+the chunk headers and the "fmt " chunk are read, samples are paged in from the file as they are
+touched.
+"""
+def read_pcm_from_file(wavpath):
+    index = read_chunk_index(wavpath)
+    if b'fmt ' not in index or b'data' not in index:
+        raise ValueError("No fmt or data chunk found in {0}".format(wavpath))
+    with open(wavpath, 'rb') as f:
+        f.seek(index[b'fmt '][0])
+        fmt = read_fmt(f.read(index[b'fmt '][1]))
+    return fmt["sample_rate"], map_samples(wavpath, index[b'data'], fmt)
+
+
+"""
+Reads the sample rate and smjx dictionary of a ShotSpotter WAV file. Only the chunk headers, the
+"fmt " chunk and the smj* chunk are read from disk, so the time taken does not depend on the length
+of the recording.
+"""
 def read_smjx_from_file(wavpath):
-    chunk_names, _, chunk_data = read_RIFF_chunks(read_wav_into_binary(wavpath))
-    smjx_index = [b'smj' in chunk_name for chunk_name in chunk_names].index(True)
-    fmt__index = chunk_names.index(b'fmt ')
-    smjx_dict = parse_smjx_chunk(chunk_data[smjx_index])
-    sr = read_sr(chunk_data[fmt__index])
+    if not os.path.exists(wavpath):
+        raise IOError
+    fmt__chunk = None
+    smjx_chunk = None
+    with open(wavpath, 'rb') as f:
+        for chunk_name, offset, chunk_length in iter_chunk_headers(f):
+            if chunk_name == b'fmt ' and fmt__chunk is None:
+                f.seek(offset)
+                fmt__chunk = f.read(chunk_length)
+            elif chunk_name.startswith(b'smj') and smjx_chunk is None:
+                f.seek(offset)
+                smjx_chunk = f.read(chunk_length)
+            if fmt__chunk is not None and smjx_chunk is not None:
+                break
+    if smjx_chunk is None or fmt__chunk is None:
+        raise ValueError("No smjx or fmt chunk found in {0}".format(wavpath))
+    smjx_dict = parse_smjx_chunk(smjx_chunk)
+    sr = read_sr(fmt__chunk)
     return sr, smjx_dict
 
 
@@ -0,0 +1,444 @@
+"""
+solver_stages.py: The benchmark.py stages of the solvers: loc2D against loc2D_batch, reference
+                  selection, prepared geometry, diagnostics, status codes, least squares
+                  refinement, RANSAC, three dimensions, wind, the grid search and the Monte Carlo
+                  confidence ellipse, each timed on synthetic incidents.
+
+Usage: Run through benchmark.py, for example:
+       python src/benchmark.py refine --incidents 2000
+"""
+
+from concurrent.futures import ProcessPoolExecutor
+from datetime import datetime
+import logging
+import os
+import sys
+import tempfile
+import tracemalloc
+
+import numpy as np
+
+import diagnostics
+import grid_search
+from location import (Status, confidence_ellipse, error_budget, loc2D_result, location, prepared_geometry,
+                      reference_geometry, sensor_subsets, wind_vector)
+from synthetic import advected_travel_times, synthetic_incidents, timed
+
+
+def bench_loc2D(incidents, sensors, seed):
+    loc = location()
+    positions, arrivals, _, speed = synthetic_incidents(incidents, sensors, seed)
+    # The scalar path only gets a slice of the incidents, it is far too slow for all of them
+    scalar_count = min(incidents, 1000)
+
+    def scalar():
+        return [loc.loc2D(positions[i], arrivals[i], speed) for i in range(scalar_count)]
+
+    scalar_time, scalar_out = timed(scalar, repeat=1)
+    batch_time, (batch_positions, _, status) = timed(loc.loc2D_batch, positions, arrivals, speed)
+    max_difference = 0.0
+    for i, out in enumerate(scalar_out):
+        if not out:
+            continue
+        scalar_positions = np.array([vector for vector, _, _ in out])
+        max_difference = max(max_difference, np.abs(scalar_positions - batch_positions[i]).max())
+    sys.stdout.write("loc2D scalar:  {0:12.0f} incidents/s ({1} incidents)\n".format(
+        scalar_count / scalar_time, scalar_count))
+    sys.stdout.write("loc2D batch:   {0:12.0f} incidents/s ({1} incidents, {2} solved)\n".format(
+        incidents / batch_time, incidents, int(np.count_nonzero(status == Status.Ok))))
+    sys.stdout.write("max |scalar - batch| root difference: {0:.3e} m\n".format(max_difference))
+
+
+"""
+Times reference selection for single incidents, comparing the old rotation of the reference
+sensor through M + 1 scalar loc2D calls against one loc2D_references call, and counts the
+incidents where the two pick a different winning root. Both use the current loc2D, the winners are
+checked against a frozen copy of the original loop in tests/test_references.py.
+"""
+def bench_references(incidents, sensors, noise, seed):
+    loc = location()
+    positions, arrivals, _, speed = synthetic_incidents(incidents, sensors, seed)
+    rng = np.random.default_rng(seed)
+    arrivals = arrivals + rng.normal(0, noise, size=arrivals.shape)
+
+    def rotation(i):
+        compute_pulses = positions[i]
+        times = arrivals[i]
+        best = (np.inf, None)
+        for _ in range(sensors):
+            for vector, discharge_time, _ in loc.loc2D(compute_pulses, times, speed):
+                error = loc.compute_mse(positions[i], arrivals[i], np.array(vector), np.array(discharge_time),
+                                        speed)
+                if error < best[0]:
+                    best = (error, vector)
+            compute_pulses = np.roll(compute_pulses, 3)
+            times = np.roll(times, 1)
+        # The winning reference was solved once more in the old implementation
+        loc.loc2D(compute_pulses, times, speed)
+        return best[1]
+
+    def batched(i):
+        _, roots, _, errors, _ = loc.loc2D_references(positions[i], arrivals[i], speed)
+        errors = np.where(np.isnan(errors), np.inf, errors)
+        return roots[np.unravel_index(np.argmin(errors), errors.shape)]
+
+    rotation_time, rotation_out = timed(lambda: [rotation(i) for i in range(incidents)], repeat=1)
+    batched_time, batched_out = timed(lambda: [batched(i) for i in range(incidents)])
+    different = sum(old is not None and np.abs(np.subtract(old, new)).max() > 1e-6
+                    for old, new in zip(rotation_out, batched_out))
+    sys.stdout.write("rotation loop:     {0:10.0f} incidents/s ({1} sensors)\n".format(
+        incidents / rotation_time, sensors))
+    sys.stdout.write("loc2D_references:  {0:10.0f} incidents/s ({1} sensors)\n".format(
+        incidents / batched_time, sensors))
+    sys.stdout.write("different winners: {0} of {1}\n".format(different, incidents))
+
+
+"""
+Solves incidents heard by one fixed cluster of sensors, as production clusters fire again and
+again, with loc2D and loc2D_references building the geometry every time against reusing geometry
+prepared once for the cluster.
+"""
+def bench_prepared(incidents, sensor_counts, seed):
+    loc = location()
+    for sensors in sensor_counts:
+        # One cluster of sensors hearing every incident, only the sources move
+        positions, _, _, speed = synthetic_incidents(1, sensors, seed)
+        cluster = positions[0]
+        _, _, sources, _ = synthetic_incidents(incidents, 1, seed + 1)
+        arrivals = np.linalg.norm(cluster[np.newaxis, :, :2] - sources[:, np.newaxis, :], axis=2) / speed
+        geometry = prepared_geometry(cluster)
+        references = reference_geometry(cluster)
+        unprepared, plain = timed(lambda: [loc.loc2D(cluster, arrivals[i], speed) for i in range(incidents)])
+        prepared, reused = timed(lambda: [loc.loc2D(cluster, arrivals[i], speed, geometry=geometry)
+                                          for i in range(incidents)])
+        difference = max(np.max(np.abs(np.subtract(a[0], b[0]))) for x, y in zip(plain, reused)
+                         for a, b in zip(x, y))
+        rotations, _ = timed(lambda: [loc.loc2D_references(cluster, arrivals[i], speed) for i in range(incidents)])
+        reused_rotations, _ = timed(lambda: [loc.loc2D_references(cluster, arrivals[i], speed, references)
+                                             for i in range(incidents)])
+        sys.stdout.write("{0:2d} sensors  loc2D {1:6.1f} us -> {2:6.1f} us   loc2D_references {3:6.1f} us -> "
+                         "{4:6.1f} us   max difference {5:.1e} m\n".format(
+                             sensors, 1e6 * unprepared / incidents, 1e6 * prepared / incidents,
+                             1e6 * rotations / incidents, 1e6 * reused_rotations / incidents, difference))
+
+
+"""
+The cost on the success path of the per call logging.basicConfig the old loc2D ran in front of
+every solve, which diagnostics removed: timed on its own over calls calls, and as the difference
+between loc2D with and without it, the two timed alternately rounds times over the incidents so
+that drift in the machine's speed hits both. Then times recording a failure the old way (a
+datetime formatted into a line appended to a log file) against diagnostics.record with and without
+records kept.
+"""
+def bench_diagnostics(incidents, sensors, seed, rounds=15, calls=200000):
+    positions, arrivals, _, speed = synthetic_incidents(incidents, sensors, seed)
+    loc = location()
+    root = logging.getLogger()
+    with tempfile.TemporaryDirectory() as directory:
+        log_name = os.path.join(directory, "error.log")
+
+        def solve():
+            return [loc.loc2D(positions[i], arrivals[i], speed) for i in range(incidents)]
+
+        def solve_configuring():
+            out = []
+            for i in range(incidents):
+                logging.basicConfig(filename=log_name, level=logging.ERROR, filemode="a")
+                out.append(loc.loc2D(positions[i], arrivals[i], speed))
+            return out
+
+        def configure_only():
+            for _ in range(calls):
+                logging.basicConfig(filename=log_name, level=logging.ERROR, filemode="a")
+
+        def log_failures():
+            for _ in range(incidents):
+                logging.basicConfig(filename=log_name, level=logging.ERROR, filemode="a")
+                logging.error("Insufficient number of pulses, 3 or more needed to compute a location. Error "
+                              "occurred at time: {0}".format(datetime.now()))
+
+        def record_failures():
+            for _ in range(incidents):
+                diagnostics.record(diagnostics.TOO_FEW_PULSES, pulses=2)
+
+        failures = sum(1 for output in solve() if not output)
+        plain, configuring = [], []
+        for _ in range(rounds):
+            plain.append(timed(solve, repeat=1)[0])
+            configuring.append(timed(solve_configuring, repeat=1)[0])
+        plain, configuring = 1e6 * np.array(plain) / incidents, 1e6 * np.array(configuring) / incidents
+        difference = np.percentile(configuring - plain, [25, 50, 75])
+        configure_time, _ = timed(configure_only, repeat=5)
+        logged_time, _ = timed(log_failures)
+        for handler in list(root.handlers):
+            root.removeHandler(handler)
+            handler.close()
+        counted_time, _ = timed(record_failures)
+        diagnostics.configure(keep_records=1000)
+        kept_time, _ = timed(record_failures)
+        diagnostics.configure()
+    sys.stdout.write("loc2D, {0} of {1} solves failing, median of {2} alternating rounds:\n".format(
+        failures, incidents, rounds))
+    sys.stdout.write("  with basicConfig per call {0:7.2f} us\n".format(np.median(configuring)))
+    sys.stdout.write("  diagnostics               {0:7.2f} us\n".format(np.median(plain)))
+    sys.stdout.write("  difference                {0:7.2f} us (interquartile {1:.2f} to {2:.2f} us)\n".format(
+        difference[1], difference[0], difference[2]))
+    sys.stdout.write("  basicConfig alone         {0:7.2f} us\n".format(1e6 * configure_time / calls))
+    sys.stdout.write("one failure:\n")
+    sys.stdout.write("  error.log line            {0:7.2f} us\n".format(1e6 * logged_time / incidents))
+    sys.stdout.write("  counted                   {0:7.2f} us\n".format(1e6 * counted_time / incidents))
+    sys.stdout.write("  counted and kept          {0:7.2f} us\n".format(1e6 * kept_time / incidents))
+
+
+"""
+Reprocesses incidents of which a share have arrival times no source could produce, the way batch
+jobs did before loc2D reported a status: solving one incident at a time and unwinding the stack
+with an exception for every bad one, against one loc2D_batch call returning a status array.
+"""
+def bench_status(incidents, sensors, bad_shares, seed):
+    loc = location()
+    positions, arrivals, _, speed = synthetic_incidents(incidents, sensors, seed)
+    rng = np.random.default_rng(seed)
+    # The scalar path only gets a slice of the incidents, it is far too slow for all of them
+    scalar_count = min(incidents, 2000)
+    for share in bad_shares:
+        times = arrivals.copy()
+        bad = rng.random(incidents) < share
+        times[bad] = rng.uniform(0, 30, size=(np.count_nonzero(bad), sensors))
+
+        def per_incident():
+            located = []
+            for i in range(scalar_count):
+                try:
+                    output = loc.loc2D(positions[i], times[i], speed)
+                    if not output:
+                        raise ValueError("incident {0} could not be located".format(i))
+                    located.append(output)
+                except ValueError:
+                    located.append(None)
+            return located
+
+        scalar_time, _ = timed(per_incident)
+        batch_time, (_, _, status) = timed(loc.loc2D_batch, positions, times, speed)
+        counts = np.bincount(status, minlength=len(Status))
+        sys.stdout.write("{0:4.0%} corrupted  per incident {1:9.0f} incidents/s   loc2D_batch {2:10.0f} incidents/s   "
+                         "{3}\n".format(share, scalar_count / scalar_time, incidents / batch_time,
+                                        ", ".join("{0} {1}".format(code.name, counts[code]) for code in Status
+                                                  if counts[code])))
+    diagnostics.reset()
+    # An incident heard by 2 sensors comes back with a status instead of a TypeError
+    two = loc.loc2D(positions[0, :2], arrivals[0, :2], speed)
+    _, _, two_status = loc.loc2D_batch(positions[:, :2], arrivals[:, :2], speed)
+    rows = loc2D_result.from_batch(*loc.loc2D_batch(positions[:3], arrivals[:3], speed))
+    sys.stdout.write("2 sensors: loc2D {0}, loc2D_batch {1} x {2}; first batch row {3} with {4} roots\n".format(
+        two.status.name, Status(two_status[0]).name, len(two_status), rows[0].status.name, len(rows[0])))
+
+
+"""
+Solves noisy incidents in closed form with loc2D_batch, seeds refine_batch with the root that best
+fits every arrival and compares the time per incident and the distance to the true source of both.
+"""
+def bench_refine(incidents, sensor_counts, noise, seed):
+    loc = location()
+    rng = np.random.default_rng(seed)
+    for sensors in sensor_counts:
+        positions, arrivals, sources, speed = synthetic_incidents(incidents, sensors, seed)
+        arrivals = arrivals + rng.normal(0, noise, size=arrivals.shape)
+        closed_time, (roots, discharge_times, _) = timed(loc.loc2D_batch, positions, arrivals, speed)
+        seeds, seed_times = loc.best_roots(positions, arrivals, roots, discharge_times, speed)
+        refine_time, (refined, _, residuals, covariance) = timed(loc.refine_batch, positions, arrivals, speed,
+                                                                 seeds, seed_times)
+        seed_miss = np.linalg.norm(seeds - sources, axis=1)
+        refined_miss = np.linalg.norm(refined - sources, axis=1)
+        sys.stdout.write("{0:2d} sensors  closed form {1:5.2f} us, median miss {2:7.3f} m   + refine {3:5.2f} us, "
+                         "median miss {4:7.3f} m, median residual {5:.1e} m2, median sigma {6:.3f} m\n".format(
+                             sensors, 1e6 * closed_time / incidents, np.nanmedian(seed_miss),
+                             1e6 * refine_time / incidents, np.nanmedian(refined_miss), np.nanmedian(residuals),
+                             np.nanmedian(np.sqrt(covariance[:, 0, 0] + covariance[:, 1, 1]))))
+
+
+"""
+The root of loc2D_references that best fits every arrival of one incident.
+"""
+def best_root(loc, positions, arrivals, speed):
+    _, roots, _, errors, _ = loc.loc2D_references(positions, arrivals, speed)
+    errors = np.where(np.isnan(errors), np.inf, errors)
+    return roots[np.unravel_index(np.argmin(errors), errors.shape)]
+
+
+"""
+Delays one arrival of every incident by an echo and compares locating with every sensor against
+locating with the inliers found by ransac_inliers, timing ransac_inliers per incident for each
+sensor count and cap on subsets.
+"""
+def bench_robust(incidents, sensor_counts, subset_caps, echo, seed):
+    loc = location()
+    rng = np.random.default_rng(seed)
+    for sensors in sensor_counts:
+        positions, arrivals, sources, speed = synthetic_incidents(incidents, sensors, seed)
+        arrivals = arrivals + rng.normal(0, 1e-4, size=arrivals.shape)
+        echoed = rng.integers(0, sensors, incidents)
+        arrivals[np.arange(incidents), echoed] += echo
+        plain = np.array([best_root(loc, positions[i], arrivals[i], speed) for i in range(incidents)])
+        plain_miss = np.linalg.norm(plain - sources, axis=1)
+        for cap in subset_caps:
+            subsets = len(sensor_subsets(sensors, 4, cap))
+            inlier_time, found = timed(lambda: [loc.ransac_inliers(positions[i], arrivals[i], speed, max_subsets=cap)
+                                                for i in range(incidents)])
+            robust = np.array([best_root(loc, positions[i][inliers], arrivals[i][inliers], speed)
+                               for i, (inliers, _) in enumerate(found)])
+            robust_miss = np.linalg.norm(robust - sources, axis=1)
+            rejected = sum(not inliers[echoed[i]] for i, (inliers, _) in enumerate(found))
+            sys.stdout.write("{0:2d} sensors  {1:4d} subsets  ransac_inliers {2:7.3f} ms   echo rejected {3:4d} of {4}"
+                             "   median miss {5:8.3f} m -> {6:6.3f} m\n".format(
+                                 sensors, subsets, 1e3 * inlier_time / incidents, rejected, incidents,
+                                 np.nanmedian(plain_miss), np.nanmedian(robust_miss)))
+
+
+def finite_median(values):
+    values = values[np.isfinite(values)]
+    return np.median(values) if len(values) else np.nan
+
+
+"""
+Sensors and sources spread over heights up to each of heights meters, as among high-rises, located
+by loc2D_batch with the elevations zeroed (as find_location does by default), placed at the mean
+height of the sensors, and by loc3D_batch. The misses are medians over every incident located, the
+vertical one of loc3D_batch including the incidents whose heights it couldn't resolve and placed
+at the mean height of the sensors too. With every height 0 the sensors lie in one plane and no
+heights are resolved.
+"""
+def bench_3d(incidents, sensors, heights, noise, seed):
+    loc = location()
+    rng = np.random.default_rng(seed)
+    for height in heights:
+        positions, _, sources, speed = synthetic_incidents(incidents, sensors, seed)
+        positions[:, :, 2] = rng.uniform(0, height, size=(incidents, sensors))
+        sources = np.concatenate((sources, rng.uniform(0, height, size=(incidents, 1))), axis=1)
+        arrivals = np.linalg.norm(positions - sources[:, np.newaxis, :], axis=2) / speed
+        arrivals = arrivals + rng.normal(0, noise, size=arrivals.shape)
+        flat = positions.copy()
+        flat[:, :, 2] = 0.0
+        flat_time, (flat_roots, flat_times, flat_status) = timed(loc.loc2D_batch, flat, arrivals, speed)
+        solid_time, (solid_roots, solid_times, solid_status, resolved) = timed(loc.loc3D_batch, positions, arrivals,
+                                                                              speed)
+        flat_best, _ = loc.best_roots(flat, arrivals, flat_roots, flat_times, speed)
+        solid_best, _ = loc.best_roots(positions, arrivals, solid_roots, solid_times, speed)
+        vertical = np.abs(solid_best[:, 2] - sources[:, 2])
+        sys.stdout.write("heights to {0:5.0f} m  loc2D_batch {1:5.2f} us, miss {2:7.3f} m horizontal {3:7.3f} m "
+                         "vertical   loc3D_batch {4:5.2f} us, miss {5:7.3f} m horizontal {6:7.3f} m vertical "
+                         "({7:7.3f} m where resolved), {8} of {9} located, {10} resolved\n".format(
+                             height, 1e6 * flat_time / incidents,
+                             finite_median(np.linalg.norm(flat_best - sources[:, :2], axis=1)),
+                             finite_median(np.abs(np.mean(positions[:, :, 2], axis=1) - sources[:, 2])
+                                           [flat_status == Status.Ok]),
+                             1e6 * solid_time / incidents,
+                             finite_median(np.linalg.norm(solid_best[:, :2] - sources[:, :2], axis=1)),
+                             finite_median(vertical), finite_median(vertical[resolved]),
+                             np.count_nonzero(solid_status == Status.Ok), incidents, np.count_nonzero(resolved)))
+
+
+"""
+Incidents heard through wind from random directions in warm humid air (see advected_travel_times),
+located with the temperature alone (as find_location does by default), with humidity and with wind
+and humidity (find_location --weather).
+"""
+def bench_wind(incidents, sensors, winds, temperature, humidity, seed):
+    loc = location()
+    rng = np.random.default_rng(seed)
+    positions, _, sources, _ = synthetic_incidents(incidents, sensors, seed)
+    dry = loc.compute_speed(temperature)
+    speed = loc.compute_speed(temperature, humidity)
+    offsets = positions[:, :, :2] - sources[:, np.newaxis, :]
+    for wind_speed in winds:
+        wind = wind_vector(np.full(incidents, wind_speed), rng.uniform(0, 360, incidents))
+        arrivals = advected_travel_times(offsets, np.full(incidents, speed), wind)
+        plain_time, plain = timed(loc.loc2D_batch, positions, arrivals, dry)
+        humid = loc.loc2D_batch(positions, arrivals, speed)
+        wind_time, corrected = timed(loc.loc2D_wind_batch, positions, arrivals, speed, wind)
+        misses = []
+        for roots, discharge_times, times, solve_speed in ((plain[0], plain[1], arrivals, dry),
+                                                           (humid[0], humid[1], arrivals, speed),
+                                                           (corrected[0], corrected[1], corrected[3], speed)):
+            best, _ = loc.best_roots(positions, times, roots, discharge_times, solve_speed)
+            misses.append(np.nanmedian(np.linalg.norm(best - sources, axis=1)))
+        sys.stdout.write("wind {0:4.1f} m/s  temperature only {1:5.2f} us, miss {2:7.3f} m   + humidity miss {3:7.3f} m"
+                         "   + wind {4:5.2f} us, miss {5:7.3f} m\n".format(
+                             wind_speed, 1e6 * plain_time / incidents, misses[0], misses[1],
+                             1e6 * wind_time / incidents, misses[2]))
+
+
+"""
+Evaluates square grids of each size in cells per side around one synthetic incident, a tile of
+tile_cells at a time on each number of workers and, for comparison, as a single tile, reporting
+grid cells per second and the peak memory traced in this process, which includes the residuals
+and discharge times of the whole grid that are returned. Then locates noisy 3 sensor
+incidents that loc2D_batch finds no root for with grid_locate.
+"""
+def bench_grid(cell_counts, sensors, tile_cells, worker_counts, incidents, seed):
+    positions, arrivals, sources, speed = synthetic_incidents(1, sensors, seed)
+    for cells in cell_counts:
+        eastings = np.linspace(sources[0, 0] - 3000, sources[0, 0] + 3000, cells)
+        northings = np.linspace(sources[0, 1] - 3000, sources[0, 1] + 3000, cells)
+        runs = [("{0} workers".format(workers) if workers > 1 else "inline", tile_cells, workers)
+                for workers in worker_counts]
+        if cells * cells * sensors <= 2**27:
+            runs.append(("one tile", cells * cells * sensors, 0))
+        for name, tile, workers in runs:
+            executor = ProcessPoolExecutor(max_workers=workers) if workers > 1 else None
+            if executor is not None:
+                # Starts the workers before timing
+                list(executor.map(abs, range(workers)))
+            tracemalloc.start()
+            elapsed, _ = timed(grid_search.grid_residuals, positions[0], arrivals[0], speed, eastings, northings,
+                               tile, executor, repeat=1)
+            _, peak = tracemalloc.get_traced_memory()
+            tracemalloc.stop()
+            if executor is not None:
+                executor.shutdown()
+            sys.stdout.write("{0:5d} x {0:<5d} grid  {1:>9s}  {2:12.0f} cells/s   peak {3:8.1f} MB\n".format(
+                cells, name, cells * cells / elapsed, peak / 2**20))
+    loc = location()
+    rng = np.random.default_rng(seed)
+    positions, arrivals, sources, speed = synthetic_incidents(incidents * 20, 3, seed)
+    arrivals = arrivals + rng.normal(0, 2e-3, size=arrivals.shape)
+    _, _, status = loc.loc2D_batch(positions, arrivals, speed)
+    failed = np.flatnonzero(status != Status.Ok)[:incidents]
+    elapsed, found = timed(lambda: [grid_search.grid_locate(positions[i], arrivals[i], speed) for i in failed],
+                           repeat=1)
+    misses = [np.linalg.norm(result.position - sources[i]) for i, result in zip(failed, found)]
+    sys.stdout.write("grid_locate on {0} incidents without a real root: {1:.2f} ms each, median miss {2:.1f} m\n".format(
+        len(failed), 1e3 * elapsed / max(1, len(failed)), np.median(misses) if misses else np.nan))
+
+
+"""
+Gives synthetic incidents one draw of the arrival and position errors of the given pdop and clock
+error bound, locates them and times location.monte_carlo_batch on them, batch incidents of draws
+each per call, reporting incidents per second. Also reports the median ellipse and the share of
+incidents whose 95% ellipse holds the true source, which should be close to 95%.
+"""
+def bench_uncertainty(incidents, sensors, draws, batches, pdop, clock_error, seed):
+    loc = location()
+    rng = np.random.default_rng(seed)
+    positions, arrivals, sources, speed = synthetic_incidents(incidents, sensors, seed)
+    arrival_sigma, position_sigma = error_budget(np.full(sensors, pdop), np.full(sensors, clock_error))
+    arrivals = arrivals + rng.standard_normal(arrivals.shape) * arrival_sigma
+    measured = positions.copy()
+    measured[:, :, :2] += rng.standard_normal(positions[:, :, :2].shape) * position_sigma[:, np.newaxis]
+    roots, discharge_times, _ = loc.loc2D_batch(measured, arrivals, speed)
+    located, _ = loc.best_roots(measured, arrivals, roots, discharge_times, speed)
+    for batch in batches:
+        elapsed, (covariance, solved) = timed(
+            lambda: [np.concatenate(parts) for parts in zip(*(
+                loc.monte_carlo_batch(measured[i:i + batch], arrivals[i:i + batch], speed, located[i:i + batch],
+                                      arrival_sigma, position_sigma, draws, seed)
+                for i in range(0, incidents, batch)))], repeat=1)
+        sys.stdout.write("{0:4d} incidents per call  {1:9.1f} incidents/s at {2} draws\n".format(
+            batch, incidents / elapsed, draws))
+    semi_major, semi_minor, _ = confidence_ellipse(covariance)
+    miss = (sources - located)[:, :, np.newaxis]
+    finite = np.isfinite(covariance).all(axis=(1, 2)) & np.isfinite(miss).all(axis=(1, 2))
+    distance = (np.linalg.solve(covariance[finite], miss[finite])[:, :, 0] * miss[finite, :, 0]).sum(axis=1)
+    sys.stdout.write("median ellipse {0:.2f} x {1:.2f} m, {2:.1%} of draws solved, source inside {3:.1%} of "
+                     "{4} ellipses\n".format(np.nanmedian(semi_major), np.nanmedian(semi_minor), np.mean(solved),
+                                             np.mean(distance <= -2 * np.log(0.05)), np.count_nonzero(finite)))
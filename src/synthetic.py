@@ -0,0 +1,240 @@
+"""
+synthetic.py: The inputs benchmark.py times the pipeline on, shared by its stage modules: synthetic
+              incidents of sensors scattered around a source on a UTM grid, as arrays, as
+              find_pulses.py style json or as location service requests, feeds of pulses for the
+              associator, bursts of shots and longer recordings built from the examples, and the
+              example incidents themselves. Also the timer every stage uses.
+
+Usage: Keep this file in your working directory and add:
+       from synthetic import synthetic_incidents, timed
+"""
+
+import glob
+import os
+import pathlib
+import time
+import uuid
+
+import numpy as np
+
+import conversion as utm
+import detect_pulses
+from location import location
+import smjx_reader
+import utc_time
+
+
+def timed(func, *args, repeat=3):
+    best = np.inf
+    result = None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = func(*args)
+        best = min(best, time.perf_counter() - start)
+    return best, result
+
+
+"""
+Places sensors uniformly in a square around the origin of a UTM grid cell in Chicago and a source
+somewhere inside the array, then computes arrival times in seconds from the source's discharge with
+the location.compute_speed of temp, noiseless unless noise gives the standard deviation of normal
+errors to add in seconds. Returns (N, M, 3) sensor positions, (N, M) arrival times, (N, 2) source
+positions and the speed of sound used.
+"""
+def synthetic_incidents(incidents, sensors, seed=0, spread=1500.0, temp=20.0, noise=0.0):
+    rng = np.random.default_rng(seed)
+    origin = np.array([447000.0, 4627000.0, 0.0])
+    positions = origin + rng.uniform(-spread, spread, size=(incidents, sensors, 3)) * [1, 1, 0]
+    sources = origin[:2] + rng.uniform(-spread / 2, spread / 2, size=(incidents, 2))
+    speed = location().compute_speed(temp)
+    distances = np.linalg.norm(positions[:, :, :2] - sources[:, np.newaxis, :], axis=2)
+    arrivals = distances / speed
+    if noise > 0:
+        arrivals += rng.normal(0, noise, size=arrivals.shape)
+    return positions, arrivals, sources, speed
+
+
+"""
+find_pulses.py style requests ({"pulses": [...], "weather": {...}}) for synthetic_incidents, the
+(N, M, 3) positions in UTM zone 16T and (N, M) arrivals in seconds after 2022-09-21 06:52 UTC.
+"""
+def incident_requests(positions, arrivals, temp=20.0, seed=0):
+    rng = np.random.default_rng(seed)
+    n, m = arrivals.shape
+    latitude, longitude = utm.to_latlon(positions[:, :, 0].ravel(), positions[:, :, 1].ravel(), 16, "T")
+    latitude, longitude = latitude.reshape(n, m).tolist(), longitude.reshape(n, m).tolist()
+    epoch = utc_time.parse_utc_ns("2022-09-21T06:52:00.000Z")
+    arrival_times = utc_time.add_seconds(epoch, arrivals).tolist()
+    return [{"pulses": [{"serialNumber": "SCP-00-BNG-{0:04d}".format(sensor),
+                         "pulseId": str(uuid.UUID(bytes=rng.bytes(16))),
+                         "arrivalTime": utc_time.isoformat_utc_ns(arrival_times[i][sensor]),
+                         "location": {"latitude": latitude[i][sensor], "longitude": longitude[i][sensor],
+                                      "elevation": float(positions[i, sensor, 2])}}
+                        for sensor in range(m)],
+             "weather": {"temperature": temp}}
+            for i in range(n)]
+
+
+"""
+find_pulses.py style json pulses scattered over Chicago with arrivals within a few seconds.
+"""
+def synthetic_json_pulses(pulses, seed=0):
+    rng = np.random.default_rng(seed)
+    latitude = rng.uniform(41.65, 41.95, pulses)
+    longitude = rng.uniform(-87.80, -87.55, pulses)
+    arrival_times = utc_time.parse_utc_ns("2022-09-21T06:52:00.000Z") + rng.integers(0, 5 * 10**9, pulses)
+    return [{"serialNumber": "SCP-00-BNG-{0:04d}".format(i % 10000),
+             "pulseId": str(uuid.UUID(bytes=rng.bytes(16))),
+             "arrivalTime": utc_time.isoformat_utc_ns(arrival_times[i]),
+             "location": {"latitude": latitude[i], "longitude": longitude[i], "elevation": 190.0}}
+            for i in range(pulses)]
+
+
+"""
+find_pulses.py style requests for incidents heard by subsets of a fixed fleet of sensors spread over
+Chicago, each incident picking one of a limited number of subsets as real deployments do.
+"""
+def fleet_requests(incidents, fleet, subsets, sensors, seed=0, temp=20.0):
+    rng = np.random.default_rng(seed)
+    latitude = rng.uniform(41.65, 41.95, fleet)
+    longitude = rng.uniform(-87.80, -87.55, fleet)
+    easting, northing, _, _ = utm.from_latlon(latitude, longitude, 16, "T")
+    # Each subset is the sensors nearest to one of them, the neighbourhood that hears a shot
+    centers = rng.choice(fleet, subsets, replace=False)
+    groups = [np.argsort(np.hypot(easting - easting[center], northing - northing[center]))[:sensors]
+              for center in centers]
+    speed = location().compute_speed(temp)
+    epoch = utc_time.parse_utc_ns("2022-09-21T06:52:00.000Z")
+    requests = []
+    for i in range(incidents):
+        group = groups[rng.integers(subsets)]
+        source = np.array([easting[group].mean(), northing[group].mean()]) + rng.uniform(-300, 300, 2)
+        distances = np.hypot(easting[group] - source[0], northing[group] - source[1])
+        arrival_times = utc_time.add_seconds(epoch, distances / speed)
+        requests.append({"pulses": [{"serialNumber": "SCP-00-BNG-{0:04d}".format(sensor),
+                                     "pulseId": str(uuid.UUID(bytes=rng.bytes(16))),
+                                     "arrivalTime": utc_time.isoformat_utc_ns(arrival_time),
+                                     "location": {"latitude": latitude[sensor], "longitude": longitude[sensor],
+                                                  "elevation": 190.0}}
+                                    for sensor, arrival_time in zip(group.tolist(), arrival_times.tolist())],
+                         "weather": {"temperature": temp}})
+    return requests
+
+
+"""
+Travel times from sources to sensors through air moving at wind, in which the wavefront is a
+sphere growing at speed whose centre drifts with the wind: the time t with |offset - wind t| =
+speed t. This is the exact solution for a uniform wind, independent of the first order correction
+along each direction that location.still_air_arrivals makes.
+"""
+def advected_travel_times(offsets, speed, wind):
+    a = speed ** 2 - np.einsum("nj,nj->n", wind, wind)
+    along = np.einsum("nmj,nj->nm", offsets, wind)
+    squared = np.einsum("nmj,nmj->nm", offsets, offsets)
+    return (-along + np.sqrt(along ** 2 + a[:, np.newaxis] * squared)) / a[:, np.newaxis]
+
+
+"""
+A burst of shots rounds 0.8 to 1.2 times interval seconds apart from a source inside a synthetic
+array of sensors. Returns the smjxs (list of (wavpath, (sample_rate, smjx))) that
+multi_shot.detect_shots would read, with no WAV files behind them, the PCM of every sensor, the
+(shots, sensors) arrival times in seconds after the start of the recordings and the source position.
+"""
+def synthetic_burst(shots, sensors, interval, seed=0, sr=12000):
+    rng = np.random.default_rng(seed)
+    positions, arrivals, sources, speed = synthetic_incidents(1, sensors, seed)
+    fired = np.cumsum(rng.uniform(0.8, 1.2, shots) * interval)
+    arrivals = fired[:, np.newaxis] + arrivals[0]
+    length = int((arrivals.max() + 1.0) * sr)
+    signals = rng.normal(0, 0.01, size=(sensors, length))
+    # Every round an exponentially decaying 5 ms burst of noise, and an echo of it at each sensor
+    decay = np.exp(-np.arange(int(0.005 * sr)) / (0.001 * sr))
+    for sensor in range(sensors):
+        echo = rng.uniform(0.008, 0.015)
+        for arrival in arrivals[:, sensor]:
+            for delay, gain in ((0.0, 1.0), (echo, 0.3)):
+                start = int(round((arrival + delay) * sr))
+                signals[sensor, start:start + len(decay)] += gain * decay * rng.normal(0, 1, len(decay))
+    latitude, longitude = utm.to_latlon(positions[0, :, 0], positions[0, :, 1], 16, "T")
+    smjxs = [(pathlib.Path("SCP-00-BNG-{0:04d}.wav".format(sensor)),
+              (sr, {"serialNumber": "SCP-00-BNG-{0:04d}".format(sensor), "startTimeUTC": "2022-09-21T06:52:00.000Z",
+                    "geolocation": {"latitude": latitude[sensor], "longitude": longitude[sensor], "elevation": 190.0},
+                    "weather": {"temperature": 20.0, "speed": 0, "direction": 0}}))
+             for sensor in range(sensors)]
+    return smjxs, list(signals), arrivals, sources[0]
+
+
+"""
+A feed of find_pulses.py style json pulses in arrival time order from sensors scattered over a
+square city size meters wide. Incidents happen at random places at rate per second and are heard
+by every sensor within radius, with 1 ms of onset noise, and stray pulses are added at random
+sensors. Returns the pulses, the weather and the incident (or -1 for stray pulses) of each pulse.
+"""
+def synthetic_feed(sensors, size, incidents, rate, radius, false_pulses, seed=0, temp=20.0):
+    rng = np.random.default_rng(seed)
+    origin = np.array([440000.0, 4620000.0])
+    positions = origin + rng.uniform(0, size, size=(sensors, 2))
+    latitude, longitude = utm.to_latlon(positions[:, 0], positions[:, 1], 16, "T")
+    speed = location().compute_speed(temp)
+    sources = origin + rng.uniform(0, size, size=(incidents, 2))
+    fired = np.cumsum(rng.exponential(1 / rate, incidents))
+    distance = np.linalg.norm(positions[np.newaxis] - sources[:, np.newaxis], axis=2)
+    incident, sensor = np.nonzero(distance <= radius)
+    arrivals = fired[incident] + distance[incident, sensor] / speed + rng.normal(0, 1e-3, len(incident))
+    strays = int(false_pulses * incidents)
+    incident = np.concatenate((incident, np.full(strays, -1)))
+    sensor = np.concatenate((sensor, rng.integers(0, sensors, strays)))
+    arrivals = np.concatenate((arrivals, rng.uniform(0, fired[-1], strays)))
+    order = np.argsort(arrivals)
+    start = utc_time.parse_utc_ns("2022-09-21T06:52:00.000Z")
+    pulses = [{"serialNumber": "SCP-00-BNG-{0:04d}".format(sensor[i]), "pulseId": str(uuid.UUID(bytes=rng.bytes(16))),
+               "arrivalTime": utc_time.isoformat_utc_ns(start + int(arrivals[i] * 1e9)),
+               "location": {"latitude": latitude[sensor[i]], "longitude": longitude[sensor[i]], "elevation": 190.0}}
+              for i in order]
+    return pulses, {"temperature": temp}, incident[order]
+
+
+"""
+Writes a copy of the ScepterTest example WAV into directory with its audio stretched to seconds of
+silence, its smjx chunk after the audio. Returns the path of the copy and the name of its smj*
+chunk.
+"""
+def stretched_wav(directory, seconds):
+    example = glob.glob(os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "examples",
+                                     "ScepterTest", "*.wav"))[0]
+    index = smjx_reader.read_chunk_index(example)
+    with open(example, "rb") as f:
+        bindata = f.read()
+    fmt_offset, fmt_length = index[b"fmt "]
+    smj_name = [name for name in index if name.startswith(b"smj")][0]
+    smj_offset, smj_length = index[smj_name]
+    sr = smjx_reader.read_sr(bindata[fmt_offset:fmt_offset+fmt_length])
+    data_length = int(seconds * sr) * 2
+    wavpath = os.path.join(directory, "{0}.wav".format(seconds))
+    with open(wavpath, "wb") as f:
+        f.write(b"RIFF" + (4 + 8 + fmt_length + 8 + data_length + 8 + smj_length + smj_length % 2)
+                .to_bytes(4, "little") + b"WAVE")
+        f.write(bindata[fmt_offset-8:fmt_offset+fmt_length])
+        f.write(b"data" + data_length.to_bytes(4, "little"))
+        f.truncate(f.tell() + data_length)
+        f.seek(0, os.SEEK_END)
+        f.write(bindata[smj_offset-8:smj_offset+smj_length+smj_length % 2])
+    return wavpath, smj_name
+
+
+def example_wavs(incident):
+    return sorted(glob.glob(os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "examples",
+                                         incident, "*.wav")))
+
+
+"""
+The find_pulses.py style pulse json of each example incident with a detectable impulse, the
+requests replayed by bench_service.
+"""
+def example_requests():
+    requests = []
+    for incident in ("ChicagoILDistrict5_783*", "ChicagoILDistrict7_312*"):
+        wavpaths = [pathlib.Path(wavpath) for wavpath in example_wavs(incident)]
+        smjxs = [(wavpath, smjx_reader.read_smjx_from_file(wavpath)) for wavpath in wavpaths]
+        requests.append(detect_pulses.detect_pulses(smjxs))
+    return requests
@@ -0,0 +1,207 @@
+"""
+tdoa.py: Cross-correlation time differences of arrival between every pair of sensors of an incident.
+         The PCM of each sensor is placed on a common timebase using its smjx startTimeUTC, a
+         short segment around its detect_pulses onset is cut from each, and every pair is
+         correlated with GCC-PHAT (the phase transform weighted generalized cross
+         correlation). Each sensor is transformed with a single rFFT whose spectrum is shared by
+         all of its pairs, and the cross spectra of all pairs are inverted in one batched irFFT.
+         Each pair's correlation peak is only searched for within a millisecond of the delay
+         between the detected onsets, and inside the lags that are physically possible, the
+         distance between the two sensors over the speed of sound plus a clock margin, and
+         refined to a sub-sample lag by parabolic interpolation. Pairs with a low peak are left
+         out and the rest are reconciled into one arrival time per sensor by least squares,
+         weighted by peak height and weakly anchored to the detected onsets, ready for
+         location.loc2D.
+
+Usage: Keep this file in your working directory and add:
+       import tdoa
+       or run find_pulses.py with --tdoa.
+"""
+
+import numpy as np
+
+import conversion as utm
+import detect_pulses
+from location import location
+from pulse_batch import pulse_batch
+import utc_time
+
+
+"""
+The smallest power of two no less than n, the lengths numpy's FFTs are fastest at.
+"""
+def fft_length(n):
+    return 1 << max(0, int(n) - 1).bit_length()
+
+
+"""
+Easting / northing of each sensor, all projected into the sensors' majority UTM zone so that
+distances between them are consistent even when the incident straddles a zone boundary.
+"""
+def sensor_positions(latitude, longitude):
+    latitude = np.asarray(latitude, dtype=np.float64)
+    longitude = np.asarray(longitude, dtype=np.float64)
+    zone_number, zone_letter, _ = pulse_batch.majority_zone(utm.latlon_to_zone_number(latitude, longitude),
+                                                            utm.latitude_to_zone_letter(latitude))
+    easting, northing, _, _ = pulse_batch.project(latitude, longitude, zone_number, zone_letter)
+    return np.stack((easting, northing), axis=1)
+
+
+"""
+Cuts a segment length samples long out of every row of stacked (padded as by
+detect_pulses.stack_signals), row i starting starts[i] seconds after the common epoch. offsets holds
+the time of each row's first sample in seconds after the epoch. Each row is cut at its nearest
+whole sample, the returned segment_times are the true times of each segment's first sample.
+Samples outside a row's recording are zero.
+"""
+def cut_segments(stacked, lengths, offsets, sr, starts, length):
+    first = np.rint((starts - offsets) * sr).astype(np.int64)
+    index = first[:, np.newaxis] + np.arange(length)
+    inside = (index >= 0) & (index < lengths[:, np.newaxis])
+    segments = np.where(inside, np.take_along_axis(stacked, np.clip(index, 0, stacked.shape[1] - 1), axis=1),
+                        0.0)
+    return segments, offsets + first / sr
+
+
+"""
+GCC-PHAT of every pair (first[p], second[p]) of rows of segments. Returns the (P, 2 * max_lag + 1)
+correlations at the integer lags -max_lag ... max_lag, a positive lag meaning the first sensor of
+the pair hears the sound later than the second.
+"""
+def gcc_phat(segments, first, second, max_lag):
+    n = fft_length(segments.shape[1] + max_lag)
+    spectra = np.fft.rfft(segments, n=n, axis=1)
+    cross = spectra[first] * np.conj(spectra[second])
+    magnitude = np.abs(cross)
+    cross /= np.maximum(magnitude, np.finfo(np.float64).tiny)
+    correlation = np.fft.irfft(cross, n=n, axis=1)
+    return correlation[:, np.arange(-max_lag, max_lag + 1) % n]
+
+
+"""
+The lag and height of each row's highest correlation among the allowed lags, with the lag refined
+by fitting a parabola through the peak and its two neighbours. Rows with no allowed lag have a nan
+lag and zero height.
+"""
+def correlation_peaks(correlation, allowed, max_lag):
+    masked = np.where(allowed, correlation, -np.inf)
+    peak = np.argmax(masked, axis=1)
+    rows = np.arange(len(correlation))
+    height = masked[rows, peak]
+    left = correlation[rows, np.maximum(peak - 1, 0)]
+    right = correlation[rows, np.minimum(peak + 1, correlation.shape[1] - 1)]
+    curvature = left - 2 * height + right
+    with np.errstate(divide="ignore", invalid="ignore"):
+        shift = np.where(curvature < 0, 0.5 * (left - right) / curvature, 0.0)
+    lag = peak - max_lag + np.clip(np.nan_to_num(shift), -0.5, 0.5)
+    found = np.isfinite(height)
+    return np.where(found, lag, np.nan), np.where(found, height, 0.0)
+
+
+"""
+Weighted least squares arrival times from the pairwise delays, delay[p] being the arrival time of
+sensor first[p] minus that of second[p]. The solution of the weighted graph Laplacian system is
+only defined up to a common shift, the minimum norm (zero mean) solution is returned. With anchors,
+the (M,) arrival times each sensor is otherwise thought to have, every sensor is also pulled
+towards its anchor with anchor_weight, which fixes the common shift and keeps a sensor that no
+measured pair reaches at its anchor.
+"""
+def reconcile_delays(m, first, second, delay, weight, anchors=None, anchor_weight=0.0):
+    weight = np.where(np.isnan(delay), 0.0, weight)
+    delay = np.nan_to_num(delay)
+    laplacian = np.zeros((m, m))
+    np.add.at(laplacian, (first, second), -weight)
+    np.add.at(laplacian, (second, first), -weight)
+    laplacian[np.diag_indices(m)] = -laplacian.sum(axis=1)
+    rhs = np.zeros(m)
+    np.add.at(rhs, first, weight * delay)
+    np.add.at(rhs, second, -weight * delay)
+    if anchors is None or anchor_weight <= 0:
+        return np.linalg.pinv(laplacian).dot(rhs)
+    laplacian[np.diag_indices(m)] += anchor_weight
+    return np.linalg.solve(laplacian, rhs + anchor_weight * np.asarray(anchors, dtype=np.float64))
+
+
+"""
+Refines the coarse onsets of one incident by cross correlating every pair of sensors.
+
+signals is a list of the M sample arrays of the incident at sample rate sr, offsets the time of
+each one's first sample in seconds after a common epoch (from the smjx startTimeUTC), positions an
+(M, 2) array of sensor easting / northing, speed the speed of sound and onsets the coarse onset
+sample of each signal, nan where none was detected. Only the sensors with an onset take part. Each
+sensor is correlated over a segment from pre seconds before its onset to duration seconds after it.
+A pair's delay is only searched for within search seconds of the delay between its coarse onsets,
+a refinement rather than a new detection, and is limited to the time sound takes between the two
+sensors plus margin seconds of clock error. Pairs whose GCC-PHAT peak is below min_height, most
+often two sensors that heard different echoes, are left out, and the rest are weighted by their
+peak height. Every sensor is also anchored to its coarse onset with anchor_weight, so one that no
+pair reaches keeps its coarse onset.
+
+Returns (onsets, delays, heights): the refined onset of each signal as a fractional sample of that
+signal (nan where there was no coarse onset), the (M, M) matrix of measured delays in seconds with
+delays[i, j] the arrival time at i minus that at j, and the matching (M, M) GCC-PHAT peak heights.
+"""
+def refine_onsets(signals, sr, offsets, positions, speed, onsets, pre=0.01, duration=0.05, margin=0.002,
+                  search=0.001, min_height=0.1, anchor_weight=0.01):
+    onsets = np.asarray(onsets, dtype=np.float64)
+    offsets = np.asarray(offsets, dtype=np.float64)
+    positions = np.asarray(positions, dtype=np.float64)
+    m = len(signals)
+    delays = np.full((m, m), np.nan)
+    heights = np.zeros((m, m))
+    used = np.flatnonzero(~np.isnan(onsets))
+    if len(used) < 2:
+        return onsets.copy(), delays, heights
+    stacked, lengths = detect_pulses.stack_signals([signals[i] for i in used])
+    coarse = offsets[used] + onsets[used] / sr
+    # Each sensor contributes a short segment around its own coarse onset, long impulse free
+    # stretches would otherwise dominate the phase transform
+    length = int(np.ceil((pre + duration) * sr))
+    segments, segment_times = cut_segments(stacked, lengths, offsets[used], sr, coarse - pre, length)
+    first, second = np.triu_indices(len(used), k=1)
+    # The segments are cut at the coarse onsets, so a lag of zero between them is the coarse delay
+    # of the pair and the lags searched are those within search seconds of it, one sample more
+    # either way for the parabola. Of those only the physically possible delays are allowed.
+    distance = np.linalg.norm(positions[used[first]] - positions[used[second]], axis=1)
+    bound = distance / speed + margin
+    max_lag = int(np.ceil(search * sr)) + 1
+    correlation = gcc_phat(segments, first, second, max_lag)
+    # A lag measured between the segments becomes a delay between the sensors once the sub-sample
+    # difference between where each segment was cut is added back
+    cut_difference = segment_times[first] - segment_times[second]
+    lags = np.arange(-max_lag, max_lag + 1) / sr
+    lag_delay = lags + cut_difference[:, np.newaxis]
+    allowed = (np.abs(lag_delay) <= bound[:, np.newaxis]) & (np.abs(lags) <= search)
+    lag, height = correlation_peaks(correlation, allowed, max_lag)
+    delay = lag / sr + cut_difference
+    weight = np.where(height >= min_height, height, 0.0)
+    # Solved relative to the mean coarse onset to keep the anchors small
+    origin = np.mean(coarse)
+    arrivals = origin + reconcile_delays(len(used), first, second, delay, weight, coarse - origin, anchor_weight)
+    refined = np.full(m, np.nan)
+    refined[used] = (arrivals - offsets[used]) * sr
+    delays[used[first], used[second]] = delay
+    delays[used[second], used[first]] = -delay
+    heights[used[first], used[second]] = height
+    heights[used[second], used[first]] = height
+    return refined, delays, heights
+
+
+"""
+Reads the PCM of every WAV file in smjxs, a list of (wavpath, (sample_rate, smjx)) as built by
+find_pulses.main, detects the coarse onsets with detect_pulses, refines them with refine_onsets and
+returns the same pulse_sample structure that find_pulses.manually_locate_pulses writes.
+"""
+def tdoa_pulses(smjxs, json_filename=None, **refine_args):
+    if not smjxs:
+        return detect_pulses.pulse_sample_from_onsets(smjxs, [], json_filename)
+    signals, sr = detect_pulses.read_signals(smjxs)
+    smjx_list = [smjx for _, (_, smjx) in smjxs]
+    start_times = np.array([utc_time.parse_utc_ns(smjx["startTimeUTC"]) for smjx in smjx_list])
+    offsets = utc_time.seconds_since(start_times, start_times.min())
+    positions = sensor_positions([smjx["geolocation"]["latitude"] for smjx in smjx_list],
+                                 [smjx["geolocation"]["longitude"] for smjx in smjx_list])
+    speed = location().compute_speed(np.mean([smjx["weather"]["temperature"] for smjx in smjx_list]))
+    onsets = detect_pulses.detect_onsets(signals, sr)
+    refined, _, _ = refine_onsets(signals, sr, offsets, positions, speed, onsets, **refine_args)
+    return detect_pulses.pulse_sample_from_onsets(smjxs, refined, json_filename)
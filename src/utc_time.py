@@ -0,0 +1,98 @@
+"""
+utc_time.py: Internal time representation for the location pipeline. Times are carried as int64
+             nanoseconds since the Unix epoch, and as float64 seconds relative to a per-incident
+             epoch inside the solvers, so that no datetime objects or strings are made between
+             reading the pulse JSON and writing a location_result. A float64 offset of a few
+             seconds keeps well under a nanosecond of precision, far below the sensor clock error
+             budget (lambda in the Scepter smjx).
+
+Usage: Keep this file in your working directory and add:
+       import utc_time
+"""
+
+import calendar
+from datetime import datetime, timezone
+import re
+
+import numpy as np
+
+
+NANOSECONDS = 1000000000
+
+_ISO_PATTERN = re.compile(r"(\d{4})-(\d{2})-(\d{2})[T ](\d{2}):(\d{2}):(\d{2})(?:\.(\d+))?"
+                          r"\s*(Z|[+-]\d{2}:?\d{2})?$")
+
+
+"""
+Parses an ISO 8601 timestamp such as the smjx startTimeUTC or a pulse arrivalTime into integer
+nanoseconds since the Unix epoch without rounding the fractional seconds. Timestamps without an
+offset are taken to be UTC.
+"""
+def parse_utc_ns(text):
+    match = _ISO_PATTERN.match(text.strip())
+    if match is None:
+        raise ValueError("Not an ISO 8601 UTC timestamp: {0}".format(text))
+    year, month, day, hour, minute, second, fraction, offset = match.groups()
+    seconds = calendar.timegm((int(year), int(month), int(day), int(hour), int(minute), int(second)))
+    if offset and offset != "Z":
+        sign = -1 if offset[0] == "-" else 1
+        digits = offset[1:].replace(":", "")
+        seconds -= sign * (int(digits[:2]) * 3600 + int(digits[2:]) * 60)
+    nanoseconds = int((fraction or "0")[:9].ljust(9, "0"))
+    return seconds * NANOSECONDS + nanoseconds
+
+
+"""
+parse_utc_ns over a sequence of timestamps. Every timestamp is first checked against the same
+pattern as parse_utc_ns, numpy's datetime64 parser also takes partial timestamps such as a bare
+date. Full UTC timestamps are then handed to numpy in one call. Anything else, explicit offsets,
+timestamps numpy rejects and invalid ones, is parsed singly, raising for the first invalid one.
+"""
+def parse_utc_ns_array(texts):
+    texts = [text.strip() for text in texts]
+    matches = [_ISO_PATTERN.match(text) for text in texts]
+    if all(match is not None and match.group(8) in (None, "Z") for match in matches):
+        try:
+            return np.array([text.rstrip("Z").replace(" ", "T") for text in texts],
+                            dtype="datetime64[ns]").astype(np.int64)
+        except ValueError:
+            pass
+    return np.array([parse_utc_ns(text) for text in texts], dtype=np.int64)
+
+
+"""
+Float seconds of each time in times_ns after epoch_ns. The subtraction is done in integers so the
+only rounding is the final conversion of a small offset to float64.
+"""
+def seconds_since(times_ns, epoch_ns):
+    return (np.asarray(times_ns, dtype=np.int64) - np.int64(epoch_ns)).astype(np.float64) / NANOSECONDS
+
+
+"""
+Inverse of seconds_since, rounds float second offsets from epoch_ns back to integer nanoseconds.
+"""
+def add_seconds(epoch_ns, seconds):
+    return np.int64(epoch_ns) + np.rint(np.asarray(seconds, dtype=np.float64) * NANOSECONDS).astype(np.int64)
+
+
+def _split(time_ns):
+    seconds, nanoseconds = divmod(int(time_ns), NANOSECONDS)
+    return datetime.fromtimestamp(seconds, tz=timezone.utc), nanoseconds
+
+
+"""
+Formats nanoseconds since the Unix epoch the way location_result has always reported discharge
+times, to the nearest microsecond: 2022-09-21 06:52:01.123456
+"""
+def format_utc_ns(time_ns):
+    whole, nanoseconds = _split((int(time_ns) + 500) // 1000 * 1000)
+    return "{0}.{1:06d}".format(whole.strftime("%Y-%m-%d %H:%M:%S"), nanoseconds // 1000)
+
+
+"""
+Formats nanoseconds since the Unix epoch as a full precision ISO 8601 string as found in pulse
+JSON: 2022-09-21T06:52:01.123456789Z
+"""
+def isoformat_utc_ns(time_ns):
+    whole, nanoseconds = _split(time_ns)
+    return "{0}.{1:09d}Z".format(whole.strftime("%Y-%m-%dT%H:%M:%S"), nanoseconds)
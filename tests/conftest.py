@@ -0,0 +1,8 @@
+"""
+The modules of src are imported by name, as they are when run from that directory.
+"""
+
+import os
+import sys
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "src"))
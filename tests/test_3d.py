@@ -0,0 +1,57 @@
+"""
+loc3D_batch resolves the heights of sensors at clearly different heights, and falls back to the
+two dimensional solve at a fixed height when they can't be resolved.
+"""
+
+import numpy as np
+
+from location import Status, location
+
+SPEED = 343.0
+
+
+def incidents(heights, n=200, m=8, noise=0.0, seed=0):
+    rng = np.random.default_rng(seed)
+    positions = rng.uniform(-1500, 1500, size=(n, m, 3))
+    positions[:, :, 2] = rng.uniform(0, heights, size=(n, m))
+    sources = np.concatenate((rng.uniform(-750, 750, size=(n, 2)), rng.uniform(0, heights, size=(n, 1))), axis=1)
+    arrivals = np.linalg.norm(positions - sources[:, np.newaxis], axis=2) / SPEED + rng.normal(0, noise, (n, m))
+    return positions, arrivals, sources
+
+
+def test_resolved_heights():
+    positions, arrivals, sources = incidents(150.0)
+    loc = location()
+    roots, times, status, resolved = loc.loc3D_batch(positions, arrivals, SPEED)
+    assert (status == Status.Ok).all() and resolved.all()
+    best, _ = loc.best_roots(positions, arrivals, roots, times, SPEED)
+    np.testing.assert_allclose(best, sources, atol=1e-4)
+
+
+def test_equal_heights_fall_back_to_2D():
+    positions, arrivals, sources = incidents(0.0)
+    positions[:, :, 2] = 12.0
+    loc = location()
+    roots, times, status, resolved = loc.loc3D_batch(positions, arrivals, SPEED)
+    flat_roots, flat_times, flat_status = loc.loc2D_batch(positions, arrivals, SPEED)
+    assert not resolved.any()
+    assert (status == flat_status).all()
+    np.testing.assert_array_equal(roots[..., :2], flat_roots)
+    np.testing.assert_array_equal(times, flat_times)
+    ok = status == Status.Ok
+    assert (roots[ok, :, 2] == 12.0).all()
+    _, _, _, fixed = loc.loc3D_batch(positions, arrivals, SPEED, height=3.0)
+    assert not fixed.any()
+    assert (loc.loc3D_batch(positions, arrivals, SPEED, height=3.0)[0][ok, :, 2] == 3.0).all()
+
+
+def test_unresolvable_heights_beat_guessing():
+    # Heights within 2 m over a 3 km array and 0.1 ms of onset noise: resolving the height is
+    # mostly worse than taking the height of the sensors, so most incidents fall back to it
+    positions, arrivals, sources = incidents(2.0, noise=1e-4)
+    loc = location()
+    roots, times, status, resolved = loc.loc3D_batch(positions, arrivals, SPEED)
+    assert np.count_nonzero(status == Status.Ok) >= 0.99 * len(status)
+    assert np.count_nonzero(resolved) < 0.2 * len(resolved)
+    best, _ = loc.best_roots(positions, arrivals, roots, times, SPEED)
+    assert np.nanmedian(np.abs(best[:, 2] - sources[:, 2])) < 1.0
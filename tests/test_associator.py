@@ -0,0 +1,85 @@
+"""
+associator.pulse_associator on hand built feeds: two shots heard at the same time on either side
+of a town come out as two candidates, and the pulses of a shot that a stray pulse drew into its
+own incident are moved back to the shot's when that incident closes.
+"""
+
+import uuid
+
+import numpy as np
+
+from associator import associate, pulse_associator
+import conversion as utm
+from location import location
+import utc_time
+
+WEATHER = {"temperature": 20.0}
+SPEED = location().compute_speed(20.0)
+ORIGIN = np.array([440000.0, 4620000.0])
+START = utc_time.parse_utc_ns("2022-09-21T06:52:00.000Z")
+
+
+"""
+The find_pulses.py style json pulses heard at (time, (x, y)) sensors, positions in meters from
+ORIGIN, in arrival time order. Each sensor has its own serial number and the pulse id is its
+index in heard.
+"""
+def feed(heard):
+    pulses = []
+    for index, (time, position) in enumerate(heard):
+        latitude, longitude = utm.to_latlon(*(ORIGIN + position), 16, "T")
+        pulses.append({"serialNumber": "SCP-00-BNG-{0:04d}".format(index), "pulseId": str(uuid.UUID(int=index)),
+                       "arrivalTime": utc_time.isoformat_utc_ns(START + int(round(time * 1e9))),
+                       "location": {"latitude": latitude, "longitude": longitude, "elevation": 190.0}})
+    order = sorted(range(len(pulses)), key=lambda index: heard[index][0])
+    return [pulses[index] for index in order]
+
+
+"""
+The (time, position) of a shot fired at fired from source heard by sensors.
+"""
+def shot(source, fired, sensors):
+    return [(fired + np.linalg.norm(np.subtract(sensor, source)) / SPEED, np.array(sensor, dtype=np.float64))
+            for sensor in sensors]
+
+
+def groups(incidents):
+    return sorted(sorted(uuid.UUID(pulse["pulseId"]).int for pulse in incident.pulses) for incident in incidents)
+
+
+def test_overlapping_incidents():
+    # Fired 0.1 s apart 1500 m from each other and heard out to 1000 m, each on its own side of the
+    # town. Their pulses arrive interleaved, but no sensor of one is a neighbour of the other's.
+    west = shot((0, 0), 0.0, [(-300, 0), (-600, 500), (-700, -400), (-1000, 100), (-400, -900)])
+    east = shot((1500, 0), 0.1, [(1800, 0), (2100, -500), (2200, 400), (2500, -100), (1900, 900)])
+    times = [time for time, _ in west + east]
+    assert sorted(times) != sorted(times[:5]) + sorted(times[5:])
+    closed = list(associate(feed(west + east), WEATHER, radius=1000.0, locate=False))
+    assert groups(closed) == [[0, 1, 2, 3, 4], [5, 6, 7, 8, 9]]
+
+
+def test_stray_pulse_is_left_alone():
+    # A stray heard west of the shot just before it, compatible with the first two pulses of the
+    # shot but not with those of the sensors near the stray, which open an incident of their own
+    heard = [(0.3, np.array([-1300.0, 0.0]))] + shot((0, 0), 0.0, [(300, 0), (0, 400), (-1000, 0), (-900, 400),
+                                                                    (-900, -400), (-1100, 200)])
+    associator = pulse_associator(WEATHER, radius=1500.0, locate=False)
+    closed = [incident for pulse in feed(heard) for incident in associator.add(pulse)] + associator.flush()
+    assert groups(closed) == [[0], [1, 2, 3, 4, 5, 6]]
+    assert associator.counters["moved"] == 2
+    assert associator.counters["incidents"] == 2 and associator.counters["dropped"] == 1
+    # Every pulse of a closed incident is in arrival time order
+    for incident in closed:
+        assert incident.times == sorted(incident.times)
+
+
+def test_incidents_close_two_windows_after_their_first_pulse():
+    associator = pulse_associator(WEATHER, radius=1500.0, locate=False)
+    heard = shot((0, 0), 0.0, [(300, 0), (0, 400), (-1000, 0)])
+    # Pulses far away, heard one and a half and two and a half windows after the first
+    first = heard[0][0]
+    heard += [(first + 1.5 * associator.window, np.array([6000.0, 6000.0])),
+              (first + 2.5 * associator.window, np.array([-6000.0, 6000.0]))]
+    closed = [associator.add(pulse) for pulse in feed(heard)]
+    assert closed[:4] == [[], [], [], []]
+    assert groups(closed[4]) == [[0, 1, 2]]
@@ -0,0 +1,61 @@
+"""
+location.loc2D_batch against the scalar location.loc2D it vectorizes, one incident at a time: the
+same Status for every incident and the same roots for those that solve, on the example incidents
+and on synthetic ones including collinear sensors and arrivals with no real roots.
+"""
+
+import glob
+import os
+import pathlib
+
+import numpy as np
+import pytest
+
+import detect_pulses
+from location import Status, location
+from pulse_batch import pulse_batch
+import smjx_reader
+
+EXAMPLES = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "examples")
+
+
+def assert_same_as_loc2D(locations, arrivals, speed):
+    loc = location()
+    positions, discharge_times, status = loc.loc2D_batch(locations, arrivals, speed)
+    for i in range(len(arrivals)):
+        expected = loc.loc2D(locations[i], arrivals[i], speed)
+        assert status[i] == expected.status
+        if expected.status != Status.Ok:
+            assert np.isnan(positions[i]).all() and np.isnan(discharge_times[i]).all()
+            continue
+        for root, (vector, discharge_time, _) in enumerate(expected):
+            np.testing.assert_allclose(positions[i, root], vector, rtol=0, atol=1e-6)
+            assert discharge_times[i, root] == pytest.approx(discharge_time, abs=1e-9)
+
+
+@pytest.mark.parametrize("incident", ["ChicagoILDistrict5_783*", "ChicagoILDistrict7_312*"])
+def test_example_incidents(incident):
+    wavpaths = sorted(glob.glob(os.path.join(EXAMPLES, incident, "*.wav")))
+    smjxs = [(pathlib.Path(wavpath), smjx_reader.read_smjx_from_file(wavpath)) for wavpath in wavpaths]
+    pulse_sample = detect_pulses.detect_pulses(smjxs)
+    batch = pulse_batch.from_json(pulse_sample["pulses"], common_zone=True)
+    speed = location().compute_speed(pulse_sample["weather"]["temperature"])
+    # Every sensor of the incident in turn as the reference, as loc2D_references solves them
+    m = len(batch)
+    order = (np.arange(m)[:, np.newaxis] + np.arange(m)) % m
+    assert_same_as_loc2D(batch.locations[order], batch.arrival_offset[order], speed)
+
+
+@pytest.mark.parametrize("sensors", [3, 4, 6, 10])
+def test_synthetic_incidents(sensors):
+    rng = np.random.default_rng(sensors)
+    speed = location().compute_speed(20.0)
+    n = 200
+    locations = np.zeros((n, sensors, 3))
+    locations[:, :, :2] = rng.uniform(-1500, 1500, size=(n, sensors, 2))
+    sources = rng.uniform(-750, 750, size=(n, 1, 2))
+    arrivals = np.linalg.norm(locations[:, :, :2] - sources, axis=2) / speed + rng.normal(0, 1e-3, (n, sensors))
+    # Collinear sensors, and arrivals too far apart for any source (no real roots)
+    locations[:20, :, 1] = 0.5 * locations[:20, :, 0] + 10.0
+    arrivals[20:40] = rng.uniform(0, 20, size=(20, sensors))
+    assert_same_as_loc2D(locations, arrivals, speed)
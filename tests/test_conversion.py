@@ -0,0 +1,70 @@
+"""
+conversion.from_latlon and conversion.to_latlon on arrays against the same conversions one point at
+a time, and the round trip back to latitude / longitude: points in mixed zones, points either side
+of the equator and points forced across the 60 / 1 zone wrap at the antimeridian.
+"""
+
+import numpy as np
+import pytest
+
+import conversion as utm
+
+
+"""
+Checks the array conversions of latitude / longitude against the scalar ones, point by point, and
+that converting back lands within tolerance (degrees) of where it started. Points forced far from
+their zone's central meridian come back less exactly, as the series are truncated.
+"""
+def assert_same_as_scalar(latitude, longitude, zone_number=None, zone_letter=None, tolerance=1e-5):
+    easting, northing, zone_numbers, zone_letters = utm.from_latlon(latitude, longitude, zone_number, zone_letter)
+    for i in range(len(latitude)):
+        expected = utm.from_latlon(float(latitude[i]), float(longitude[i]),
+                                   None if zone_number is None else int(zone_number[i]),
+                                   None if zone_letter is None else str(zone_letter[i]))
+        assert easting[i] == pytest.approx(expected[0], abs=1e-6)
+        assert northing[i] == pytest.approx(expected[1], abs=1e-6)
+        assert (zone_numbers[i], zone_letters[i]) == expected[2:]
+    back_latitude, back_longitude = utm.to_latlon(easting, northing, zone_numbers, zone_letters, strict=False)
+    for i in range(len(latitude)):
+        expected = utm.to_latlon(float(easting[i]), float(northing[i]), int(zone_numbers[i]),
+                                 str(zone_letters[i]), strict=False)
+        assert back_latitude[i] == pytest.approx(expected[0], abs=1e-9)
+        assert back_longitude[i] == pytest.approx(expected[1], abs=1e-9)
+    np.testing.assert_allclose(back_latitude, latitude, rtol=0, atol=tolerance)
+    np.testing.assert_allclose(back_longitude, longitude, rtol=0, atol=tolerance)
+
+
+def test_mixed_zones():
+    rng = np.random.default_rng(5)
+    # Including the Norway and Svalbard exceptions
+    latitude = np.concatenate((rng.uniform(-79.0, 83.0, 200), [60.0, 78.0, 78.0, 78.0]))
+    longitude = np.concatenate((rng.uniform(-179.0, 179.0, 200), [5.0, 8.0, 20.0, 40.0]))
+    assert len(np.unique(utm.from_latlon(latitude, longitude)[2])) > 40
+    assert_same_as_scalar(latitude, longitude)
+
+
+def test_across_the_equator():
+    latitude = np.array([-0.5, -0.01, 0.0, 0.01, 0.5, -0.2, 0.2])
+    longitude = np.array([-87.6, -87.6, -87.6, -87.6, -87.6, 36.8, 36.8])
+    assert utm.from_latlon(latitude, longitude)[3].tolist() == ["M", "M", "N", "N", "N", "M", "N"]
+    assert_same_as_scalar(latitude, longitude)
+    # Forced into one hemisphere's letter, the other side of the equator keeps its latitude
+    zones = np.array([16] * 5 + [37] * 2)
+    assert_same_as_scalar(latitude, longitude, zones, np.array(["N"] * 5 + ["M"] * 2))
+    assert_same_as_scalar(latitude, longitude, zones, np.array(["M"] * 7))
+
+
+def test_zone_wrap():
+    # Either side of the antimeridian, in zones 60 and 1, and each forced into the other's zone
+    latitude = np.array([-16.5, -16.6, 52.0, 52.1, -16.7, 52.2])
+    longitude = np.array([179.5, -179.5, 179.9, -179.9, 178.2, -178.2])
+    assert utm.from_latlon(latitude, longitude)[2].tolist() == [60, 1, 60, 1, 60, 1]
+    assert_same_as_scalar(latitude, longitude)
+    # Up to 4.8 degrees from the central meridian, a few metres of truncation error
+    assert_same_as_scalar(latitude, longitude, np.full(6, 60), None, tolerance=1e-4)
+    assert_same_as_scalar(latitude, longitude, np.full(6, 1), None, tolerance=1e-4)
+    assert_same_as_scalar(latitude, longitude, np.array([1, 60, 1, 60, 1, 60]), None, tolerance=1e-4)
+    # Forced across the wrap a point is a few hundred km from the zone's central meridian, not a
+    # whole turn of the earth
+    easting = utm.from_latlon(latitude, longitude, np.array([1, 60, 1, 60, 1, 60]))[0]
+    assert (np.abs(easting - 500000) < 700000).all()
@@ -0,0 +1,59 @@
+"""
+detect_pulses.detect_onsets and detect_all_onsets on synthetic recordings whose impulse onsets are
+known: onsets found to within a sample, rows of different lengths, rows without an impulse clear of
+the noise, and the impulses of a burst with the echoes that follow them held off.
+"""
+
+import numpy as np
+
+import detect_pulses
+
+SR = 12000
+
+
+"""
+White noise with a decaying 900 Hz burst of the given amplitude added at each onset sample.
+"""
+def recording(rng, length, onsets=(), amplitudes=(), noise=0.005):
+    samples = rng.normal(0, noise, length)
+    t = np.arange(int(0.03 * SR)) / SR
+    burst = np.sin(2 * np.pi * 900 * t) * np.exp(-t / 0.006)
+    for onset, amplitude in zip(onsets, amplitudes):
+        samples[onset:onset + len(burst)] += amplitude * burst[:length - onset]
+    return samples
+
+
+def test_detect_onsets():
+    for seed in range(5):
+        rng = np.random.default_rng(seed)
+        signals = [recording(rng, 24000, [5000], [1.0]), recording(rng, 20000, [7321], [0.5]),
+                   recording(rng, 24000), recording(rng, 24000, [100], [1.0]),
+                   # 17 dB above the noise, under the 20 dB min_snr_db
+                   recording(rng, 24000, [9000], [0.3], noise=0.01)]
+        onsets = detect_pulses.detect_onsets(signals, SR)
+        np.testing.assert_allclose(onsets[[0, 1, 3]], [5000, 7321, 100], rtol=0, atol=0.1)
+        assert np.isnan(onsets[[2, 4]]).all()
+        # Padding the rows to a common length changes nothing
+        np.testing.assert_array_equal(detect_pulses.detect_onsets(signals[1:2], SR), onsets[1:2])
+
+
+def test_detect_all_onsets():
+    for seed in range(5):
+        rng = np.random.default_rng(seed)
+        signals = [recording(rng, 36000, [3000, 9000, 20000], [1.0, 0.4, 0.6]),
+                   # An echo 100 samples (8 ms) behind the shot, within hold_seconds
+                   recording(rng, 36000, [4000, 4100], [1.0, 0.5]),
+                   recording(rng, 30000)]
+        onsets = detect_pulses.detect_all_onsets(signals, SR)
+        assert len(onsets) == 3
+        np.testing.assert_allclose(onsets[0], [3000, 9000, 20000], rtol=0, atol=0.1)
+        np.testing.assert_allclose(onsets[1], [4000], rtol=0, atol=0.1)
+        assert len(onsets[2]) == 0
+        # The first impulse of each row is the one detect_onsets finds
+        np.testing.assert_allclose(detect_pulses.detect_onsets(signals[:2], SR), [onsets[0][0], onsets[1][0]],
+                                   rtol=0, atol=0.1)
+
+
+def test_no_signals():
+    assert len(detect_pulses.detect_onsets([], SR)) == 0
+    assert detect_pulses.detect_all_onsets([], SR) == []
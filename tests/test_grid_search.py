@@ -0,0 +1,99 @@
+"""
+grid_search.grid_locate on synthetic incidents: the source of exact arrivals found to within the
+resolution, the least squares location of noisy arrivals that have no closed form root, the same
+result however the grid is tiled or spread over processes, and find_location falling back to it.
+"""
+
+import uuid
+
+import numpy as np
+import pytest
+
+import conversion as utm
+from find_location import find_location
+import grid_search
+from location import Algorithm, Status, location
+import utc_time
+
+SPEED = location().compute_speed(20.0)
+
+
+def incident(rng, sensors=4, noise=0.0):
+    locations = np.zeros((sensors, 3))
+    locations[:, :2] = rng.uniform(-1000, 1000, size=(sensors, 2))
+    source = rng.uniform(-500, 500, size=2)
+    arrivals = 0.5 + np.linalg.norm(locations[:, :2] - source, axis=1) / SPEED + rng.normal(0, noise, sensors)
+    return locations, arrivals, source
+
+
+"""
+A noisy incident of four sensors for which no reference of loc2D_references has a real root.
+"""
+def rootless_incident():
+    rng = np.random.default_rng(20)
+    while True:
+        locations, arrivals, source = incident(rng, noise=2e-3)
+        status = location().loc2D_references(locations, arrivals, SPEED)[4]
+        if (status == Status.NegativeRadicand).all():
+            return locations, arrivals, source
+
+
+def test_exact_arrivals():
+    rng = np.random.default_rng(1)
+    for sensors in (3, 5, 8):
+        locations, arrivals, source = incident(rng, sensors)
+        result = grid_search.grid_locate(locations, arrivals, SPEED)
+        assert np.linalg.norm(result.position - source) < 0.1
+        assert abs(result.discharge_time - 0.5) < 0.1 / SPEED
+        assert result.error < 0.01
+        # The coarse grid's best cell is the cell nearest the source
+        assert result.heat_map.shape == (101, 101)
+        row, column = np.unravel_index(np.argmin(result.heat_map), result.heat_map.shape)
+        step = result.eastings[1] - result.eastings[0]
+        assert abs(result.eastings[column] - source[0]) <= step and abs(result.northings[row] - source[1]) <= step
+
+
+def test_rootless_incident_is_the_least_squares_location():
+    locations, arrivals, _ = rootless_incident()
+    loc = location()
+    result = grid_search.grid_locate(locations, arrivals, SPEED)
+    # The residual is compute_mse's at the best cell, and least squares started there barely improves
+    # on it. The source is outside the sensors, the minimum lies along a flat valley and moves a few
+    # meters for a fraction of a percent of the residual.
+    assert result.error == pytest.approx(loc.compute_mse(locations[:, :2], arrivals, result.position,
+                                                         np.float64(result.discharge_time), SPEED))
+    refined, _, errors, _ = loc.refine_batch(locations[np.newaxis], arrivals[np.newaxis], SPEED,
+                                             result.position[np.newaxis], [result.discharge_time])
+    assert errors[0] <= result.error < 1.01 * errors[0]
+    assert np.linalg.norm(refined[0] - result.position) < 5.0
+
+
+def test_tiles_and_workers_agree():
+    locations, arrivals, _ = rootless_incident()
+    whole = grid_search.grid_locate(locations, arrivals, SPEED, tile_cells=2**30)
+    for tiled in (grid_search.grid_locate(locations, arrivals, SPEED, tile_cells=1000),
+                  grid_search.grid_locate(locations, arrivals, SPEED, tile_cells=1000, workers=2)):
+        np.testing.assert_array_equal(tiled.position, whole.position)
+        np.testing.assert_array_equal(tiled.heat_map, whole.heat_map)
+        assert tiled.error == whole.error and tiled.discharge_time == whole.discharge_time
+
+
+def test_find_location_falls_back_to_the_grid():
+    locations, arrivals, source = rootless_incident()
+    origin = np.array([440000.0, 4620000.0])
+    start = utc_time.parse_utc_ns("2022-09-21T06:52:00.000Z")
+    pulses = []
+    for i, (location_i, arrival) in enumerate(zip(locations, arrivals)):
+        latitude, longitude = utm.to_latlon(*(origin + location_i[:2]), 16, "T")
+        pulses.append({"serialNumber": "SCP-00-BNG-{0:04d}".format(i), "pulseId": str(uuid.UUID(int=i)),
+                       "arrivalTime": utc_time.isoformat_utc_ns(start + int(round(arrival * 1e9))),
+                       "location": {"latitude": latitude, "longitude": longitude, "elevation": 0.0}})
+    found = find_location({"pulses": pulses, "weather": {"temperature": 20.0}})
+    assert found.grid is not None
+    assert found.status == Status.Ok
+    [result] = found.computed_locations
+    assert result.algorithm == Algorithm.GridSearch and result.reference_sensor is None
+    easting, northing, _, _ = utm.from_latlon(result.geolocation[0], result.geolocation[1], 16, "T")
+    # Refined from the best cell over every arrival, a few meters from the source with 2 ms of noise
+    assert np.linalg.norm(np.array([easting, northing]) - found.grid.position) < 5.0
+    assert np.linalg.norm(np.array([easting, northing]) - origin - source) < 10.0
@@ -0,0 +1,68 @@
+"""
+index_wavs.build_index on a copy of the example WAV files: every row against the file's own smjx,
+unreadable files skipped, and a rerun reading only the files that changed and dropping the ones
+that are gone.
+"""
+
+import glob
+import os
+import shutil
+
+import numpy as np
+
+import index_wavs
+
+EXAMPLES = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "examples")
+
+
+def archive(tmp_path):
+    wavpaths = sorted(glob.glob(os.path.join(EXAMPLES, "ChicagoIL*", "*.wav")))
+    for i, wavpath in enumerate(wavpaths):
+        folder = tmp_path / "archive" / "sensor{0}".format(i % 3) / "day"
+        folder.mkdir(parents=True, exist_ok=True)
+        shutil.copy2(wavpath, folder / os.path.basename(wavpath))
+    (tmp_path / "archive" / "corrupt.wav").write_bytes(b"RIFF\0\0\0\0WAVEnot a chunk")
+    (tmp_path / "archive" / "notes.txt").write_text("not indexed")
+    return tmp_path / "archive", len(wavpaths)
+
+
+"""
+The index columns as a dictionary of path to row, compared with np.testing.assert_equal as the
+weather columns hold nan.
+"""
+def rows(columns):
+    return {path: tuple(columns[name][i] for name in index_wavs.COLUMNS)
+            for i, path in enumerate(columns["path"].tolist())}
+
+
+def test_index_matches_the_files(tmp_path):
+    root, files = archive(tmp_path)
+    columns, counts = index_wavs.build_index(root, tmp_path / "index.npz", workers=1)
+    assert counts == {"found": files + 1, "read": files, "reused": 0, "unreadable": 1}
+    assert set(columns) == set(index_wavs.COLUMNS)
+    for i, path in enumerate(columns["path"].tolist()):
+        expected = index_wavs.read_wav_metadata(path)
+        for name, value in zip(list(index_wavs.COLUMNS)[3:], expected):
+            np.testing.assert_array_equal(columns[name][i], value)
+        assert columns["size"][i] == os.path.getsize(path)
+    # The saved index is what was returned, and reading the files in worker processes changes nothing
+    saved = index_wavs.load_index(tmp_path / "index.npz")
+    np.testing.assert_equal(rows(saved), rows(columns))
+    pooled, _ = index_wavs.build_index(root, tmp_path / "pooled.npz", workers=2)
+    np.testing.assert_equal(rows(pooled), rows(columns))
+
+
+def test_rerun_reads_only_changed_files(tmp_path):
+    root, files = archive(tmp_path)
+    first, _ = index_wavs.build_index(root, tmp_path / "index.npz", workers=1)
+    paths = sorted(first["path"].tolist())
+    os.utime(paths[0], ns=(0, os.stat(paths[0]).st_mtime_ns + 10**9))
+    os.remove(paths[1])
+    second, counts = index_wavs.build_index(root, tmp_path / "index.npz", workers=1)
+    # The corrupt file is tried again, as it never made it into the index
+    assert counts == {"found": files, "read": 1, "reused": files - 2, "unreadable": 1}
+    assert sorted(second["path"].tolist()) == [path for path in paths if path != paths[1]]
+    before, after = rows(first), rows(second)
+    for path in paths[2:]:
+        np.testing.assert_equal(after[path], before[path])
+    assert after[paths[0]][1] == before[paths[0]][1] + 10**9
@@ -0,0 +1,51 @@
+"""
+location_service answers every request line, including those whose solve raises inside
+find_location.
+"""
+
+import asyncio
+import json
+
+import numpy as np
+
+import location_service
+
+REQUEST = {"pulses": [], "weather": {"temperature": 20.0}}
+
+
+class lines_reader:
+
+    def __init__(self, lines):
+        self.lines = [line.encode() + b"\n" for line in lines]
+
+    async def readline(self):
+        return self.lines.pop(0) if self.lines else b""
+
+
+def serve(lines):
+    service = location_service.location_service(workers=0, max_pending=4)
+    written = []
+
+    async def write(text):
+        written.append(json.loads(text))
+
+    asyncio.run(service.serve_stream(lines_reader(lines), write))
+    return sorted(written, key=lambda response: str(response["id"]))
+
+
+def test_every_request_gets_a_response(monkeypatch):
+    def failing(request, **kwargs):
+        if request["id"] == 2:
+            raise np.linalg.LinAlgError("SVD did not converge")
+        if request["id"] == 3:
+            raise FloatingPointError("overflow")
+        return real(request, **kwargs)
+
+    real = location_service.find_location
+    monkeypatch.setattr(location_service, "find_location", failing)
+    responses = serve([json.dumps(dict(REQUEST, id=i)) for i in (1, 2, 3)] + ["not json"])
+    assert [response["id"] for response in responses] == [1, 2, 3, None]
+    assert responses[0]["status"] == "TooFewPulses"
+    assert responses[1]["error"] == "LinAlgError: SVD did not converge"
+    assert responses[2]["error"] == "FloatingPointError: overflow"
+    assert responses[3]["error"].startswith("ValueError")
@@ -0,0 +1,105 @@
+"""
+smjx_reader.frame_dtype and the pcm_recording views built on it, on hand built WAV files of 16, 24
+and 32 bit integer PCM, IEEE float and WAVE_FORMAT_EXTENSIBLE, with and without padded frames: the
+same samples from the memory map of open_pcm and from pcm_from_bytes, scaled to the same pressure
+whatever the sample size.
+"""
+
+import json
+import zlib
+
+import numpy as np
+import pytest
+
+import smjx_reader
+
+SMJX = {"serialNumber": "SCP-00-BNG-0001", "startTimeUTC": "2022-09-21T06:52:00.000Z",
+        "transducers": [{"channel": 0, "fullScale": 120.0}, {"channel": 1, "fullScale": 100.0}]}
+
+
+"""
+A "fmt " chunk, for WAVE_FORMAT_EXTENSIBLE with an integer PCM sub format.
+"""
+def fmt_chunk(audio_format, channels, bits, block_align=None, sample_rate=12000):
+    block_align = channels * bits // 8 if block_align is None else block_align
+    fields = [(audio_format, 2), (channels, 2), (sample_rate, 4), (sample_rate * block_align, 4), (block_align, 2),
+              (bits, 2)]
+    if audio_format == smjx_reader.extensible_format:
+        # cbSize, valid bits, channel mask and the sub format GUID, whose first two bytes are the format
+        fields += [(22, 2), (bits, 2), (3, 4), (1, 2), (0, 14)]
+    return b"".join(value.to_bytes(size, "little") for value, size in fields)
+
+
+def wav(fmt, data):
+    chunks = b""
+    smjx = zlib.compress(json.dumps(SMJX).encode())
+    for name, payload in ((b"fmt ", fmt), (b"data", data), (b"smjx", smjx)):
+        chunks += name + len(payload).to_bytes(4, "little") + payload + b"\0" * (len(payload) % 2)
+    return b"RIFF" + (4 + len(chunks)).to_bytes(4, "little") + b"WAVE" + chunks
+
+
+"""
+Little endian bytes of (frames, channels) integer samples of the given bits, each frame padded to
+block_align bytes.
+"""
+def pack(samples, bits, block_align):
+    width = bits // 8
+    frames = bytearray()
+    for frame in samples.tolist():
+        packed = b"".join(int(value).to_bytes(width, "little", signed=True) for value in frame)
+        frames += packed + bytes(block_align - len(packed))
+    return bytes(frames)
+
+
+def recordings(tmp_path, bindata):
+    wavpath = tmp_path / "test.wav"
+    wavpath.write_bytes(bindata)
+    return smjx_reader.open_pcm(str(wavpath)), smjx_reader.pcm_from_bytes(bindata)
+
+
+def test_frame_dtype():
+    for audio_format, bits, sample in ((1, 16, "<i2"), (1, 32, "<i4"), (3, 32, "<f4"), (3, 64, "<f8"),
+                                       (1, 8, "u1")):
+        dtype = smjx_reader.frame_dtype(smjx_reader.read_fmt(fmt_chunk(audio_format, 2, bits)))
+        assert dtype.itemsize == 2 * bits // 8
+        assert dtype["samples"] == np.dtype((sample, (2,)))
+    # 24 bit samples are viewed as their bytes, padded frames keep their block_align
+    dtype = smjx_reader.frame_dtype(smjx_reader.read_fmt(fmt_chunk(1, 2, 24, block_align=8)))
+    assert dtype.itemsize == 8 and dtype["samples"] == np.dtype(("u1", (2, 3)))
+    dtype = smjx_reader.frame_dtype(smjx_reader.read_fmt(fmt_chunk(smjx_reader.extensible_format, 2, 24)))
+    assert dtype.itemsize == 6 and dtype["samples"] == np.dtype(("u1", (2, 3)))
+    for fmt in (fmt_chunk(1, 2, 12), fmt_chunk(1, 2, 16, block_align=3), fmt_chunk(2, 1, 16), fmt_chunk(1, 0, 16)):
+        with pytest.raises(ValueError):
+            smjx_reader.frame_dtype(smjx_reader.read_fmt(fmt))
+
+
+@pytest.mark.parametrize("bits,block_align,extensible", [(16, 4, False), (16, 6, False), (24, 6, False),
+                                                         (24, 8, True), (32, 8, False), (32, 8, True)])
+def test_integer_samples(tmp_path, bits, block_align, extensible):
+    rng = np.random.default_rng(bits)
+    full_scale = 2**(bits - 1)
+    samples = rng.integers(-full_scale, full_scale, size=(1200, 2))
+    samples[:2] = [[-full_scale, full_scale - 1], [0, -1]]
+    audio_format = smjx_reader.extensible_format if extensible else 1
+    bindata = wav(fmt_chunk(audio_format, 2, bits, block_align), pack(samples, bits, block_align))
+    for recording in recordings(tmp_path, bindata):
+        assert recording.samples.shape == (1200, 2)
+        # 24 bit samples are widened into the top three bytes of an int32
+        scale = 256 if bits == 24 else 1
+        np.testing.assert_array_equal(recording.samples, samples * scale)
+        pascals = 20e-6 * 10**(np.array([120.0, 100.0]) / 20)
+        np.testing.assert_allclose(recording.pressure(), samples / full_scale * pascals)
+        window = recording.window("2022-09-21T06:52:00.010Z", "2022-09-21T06:52:00.020Z")
+        np.testing.assert_array_equal(window, samples[120:240] * scale)
+
+
+def test_float_samples(tmp_path):
+    samples = np.random.default_rng(3).uniform(-1, 1, size=(600, 2)).astype("<f4")
+    for recording in recordings(tmp_path, wav(fmt_chunk(3, 2, 32), samples.tobytes())):
+        np.testing.assert_array_equal(recording.samples, samples)
+
+
+def test_empty_data_chunk(tmp_path):
+    for bits in (16, 24):
+        for recording in recordings(tmp_path, wav(fmt_chunk(1, 2, bits), b"")):
+            assert recording.samples.shape == (0, 2) and recording.samples.dtype.kind == "i"
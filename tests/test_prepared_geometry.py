@@ -0,0 +1,100 @@
+"""
+loc2D with a prepared geometry against loc2D building its own, for the same sensors heard again
+with new arrivals, and the reference geometries a sensor_registry hands out: reused for repeat
+sensor sets, evicted least recently used first and dropped when a sensor moves.
+"""
+
+import numpy as np
+
+from location import Status, location, prepared_geometry, reference_geometry
+from sensor_registry import sensor_registry
+
+
+def incidents(rng, sensors, n):
+    speed = location().compute_speed(20.0)
+    locations = np.zeros((sensors, 3))
+    locations[:, :2] = rng.uniform(-1500, 1500, size=(sensors, 2))
+    sources = rng.uniform(-750, 750, size=(n, 2))
+    arrivals = np.linalg.norm(locations[:, :2] - sources[:, np.newaxis], axis=2) / speed \
+        + rng.normal(0, 1e-3, (n, sensors))
+    return locations, arrivals, speed
+
+
+def test_prepared_geometry_matches_loc2D():
+    rng = np.random.default_rng(13)
+    loc = location()
+    for sensors in (3, 4, 6, 12):
+        locations, arrivals, speed = incidents(rng, sensors, 50)
+        geometry = prepared_geometry(locations)
+        references = reference_geometry(locations)
+        for incident in arrivals:
+            expected = loc.loc2D(locations, incident, speed)
+            assert loc.loc2D(locations, incident, speed, geometry) == expected
+            # Every reference of a reference_geometry, against loc2D on the reordered sensors
+            for row, order in enumerate(references.order):
+                result = loc.loc2D(locations[order], incident[order], speed, references.prepared(row))
+                assert result == loc.loc2D(locations[order], incident[order], speed)
+
+
+def test_prepared_geometry_of_collinear_sensors():
+    locations = np.array([[0.0, 0.0, 0.0], [100.0, 100.0, 0.0], [200.0, 200.0, 0.0], [300.0, 300.0, 0.0]])
+    geometry = prepared_geometry(locations)
+    assert not geometry.full_rank
+    result = location().loc2D(locations, [0.0, 0.1, 0.2, 0.25], 343.0, geometry)
+    assert result.status == Status.SingularGeometry and len(result) == 0
+
+
+def registered(registry, serials, locations):
+    latitude = 41.8 + locations[:, 1] / 111000.0
+    longitude = -87.6 + locations[:, 0] / 83000.0
+    subset = registry.project(np.array(serials), latitude, longitude, locations[:, 2])
+    projected = np.stack((subset.easting, subset.northing, locations[:, 2]), axis=1)
+    return registry.geometry(np.array(serials), subset.zone_number, subset.zone_letter, projected)
+
+
+def test_registry_reuses_geometry():
+    rng = np.random.default_rng(1)
+    locations, arrivals, speed = incidents(rng, 5, 20)
+    registry = sensor_registry()
+    serials = ["SN{0}".format(i) for i in range(5)]
+    geometry = registered(registry, serials, locations)
+    for _ in range(3):
+        assert registered(registry, serials, locations) is geometry
+    assert registry.stats()["geometry_misses"] == 1 and registry.stats()["geometry_hits"] == 3
+    # The cached geometry (pseudo-inverses) solves as loc2D_batch (normal equations) does
+    projected = geometry.locations
+    loc = location()
+    for incident in arrivals:
+        cached = loc.loc2D_references(projected, incident, speed, geometry)
+        fresh = loc.loc2D_references(projected, incident, speed)
+        for a, b in zip(cached, fresh):
+            np.testing.assert_allclose(a, b, rtol=1e-6, atol=1e-6)
+
+
+def test_registry_evicts_and_invalidates():
+    rng = np.random.default_rng(2)
+    positions = incidents(rng, 6, 1)[0]
+    registry = sensor_registry(max_subsets=2, max_geometries=2)
+    sets = [[0, 1, 2, 3], [1, 2, 3, 4], [2, 3, 4, 5]]
+
+    def register(sensors, locations=positions):
+        return registered(registry, ["SN{0}".format(i) for i in sensors], locations[sensors])
+
+    first = register(sets[0])
+    register(sets[1])
+    # Using the first set again makes the second the least recently used, the third evicts it
+    assert register(sets[0]) is first
+    register(sets[2])
+    assert register(sets[0]) is first
+    assert registry.stats()["geometries"] == 2
+    misses = registry.stats()["geometry_misses"]
+    register(sets[1])
+    assert registry.stats()["geometry_misses"] == misses + 1
+    # SN3 is in every set, moving it drops every geometry computed from its old position
+    moved = positions.copy()
+    moved[3, :2] += 50.0
+    geometry = register(sets[0], moved)
+    assert geometry is not first
+    assert registry.stats()["invalidations"] == 1
+    assert registry.stats()["geometries"] == 1
+    np.testing.assert_allclose(geometry.locations[3, :2] - first.locations[3, :2], [50.0, 50.0], atol=0.5)
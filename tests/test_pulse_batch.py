@@ -0,0 +1,73 @@
+"""
+pulse_batch.from_json against the pulse json it reads, field by field, and its majority zone
+coercion against projecting every pulse on its own and coercing afterwards.
+"""
+
+import uuid
+
+import numpy as np
+
+import conversion as utm
+from pulse_batch import pulse_batch
+import utc_time
+
+
+def json_pulses(latitude, longitude):
+    pulses = []
+    for i, (lat, lon) in enumerate(zip(latitude, longitude)):
+        pulses.append({"serialNumber": "SCP-00-BNG-{0:04d}".format(i), "pulseId": str(uuid.UUID(int=i + 1)),
+                       "arrivalTime": "2022-09-21T06:52:0{0}.{1:09d}Z".format(i % 10, 123456789 * i % 10**9),
+                       "location": {"latitude": lat, "longitude": lon, "elevation": 180.0 + i}})
+    return pulses
+
+
+def test_columns_match_the_json():
+    pulses = json_pulses([41.79, 41.80, 41.81, 41.82], [-87.63, -87.64, -87.65, -87.66])
+    pulses[1]["location"]["pdop"] = 1.5
+    pulses[2]["lambda"] = 2e-6
+    batch = pulse_batch.from_json(pulses)
+    assert len(batch) == 4
+    for i, pulse in enumerate(pulses):
+        row = batch[i]
+        assert row.serial_number == pulse["serialNumber"]
+        assert str(row.pulse_id) == pulse["pulseId"]
+        assert row.arrival_time == utc_time.parse_utc_ns(pulse["arrivalTime"])
+        easting, northing, zone_number, zone_letter = utm.from_latlon(pulse["location"]["latitude"],
+                                                                      pulse["location"]["longitude"])
+        np.testing.assert_allclose(row.location, [easting, northing, 180.0 + i], rtol=0, atol=1e-6)
+        assert (row.zone_number, row.zone_letter) == (zone_number, zone_letter)
+    np.testing.assert_array_equal(batch.pdop, [np.nan, 1.5, np.nan, np.nan])
+    np.testing.assert_array_equal(batch.clock_error, [np.nan, np.nan, 2e-6, np.nan])
+    # Offsets in seconds after the earliest arrival, exact to the nanosecond
+    assert batch.epoch == batch.arrival_time.min()
+    np.testing.assert_array_equal(batch.arrival_offset, (batch.arrival_time - batch.epoch) / 1e9)
+
+
+def test_common_zone_matches_coerce_utm():
+    # Two zone 16 sensors, one in zone 17, one in zone 15 across the other boundary and one far away
+    latitude = [41.0, 41.01, 41.02, 41.03, 41.04]
+    longitude = [-84.02, -84.03, -83.99, -90.01, -70.0]
+    pulses = json_pulses(latitude, longitude)
+    coerced = pulse_batch.from_json(pulses).coerce_utm()
+    common = pulse_batch.from_json(pulses, common_zone=True)
+    assert common.serial_number.tolist() == coerced.serial_number.tolist() == [
+        "SCP-00-BNG-{0:04d}".format(i) for i in range(4)]
+    assert common.zone_number.tolist() == [16] * 4 and common.zone_letter.tolist() == ["T"] * 4
+    np.testing.assert_allclose(common.locations, coerced.locations, rtol=0, atol=1e-6)
+    np.testing.assert_array_equal(common.arrival_time, coerced.arrival_time)
+
+
+def test_majority_zone_ties_go_to_the_lowest_zone():
+    zone_number = np.array([17, 16, 17, 16], dtype=np.int16)
+    zone_letter = np.array(["T", "S", "S", "T"], dtype="U1")
+    assert pulse_batch.majority_zone(zone_number, zone_letter)[:2] == (16, "S")
+    # Zone 1 neighbours zone 60 across the wrap, zone 2 doesn't
+    zone_number = np.array([60, 60, 1, 2, 59], dtype=np.int16)
+    _, _, keep = pulse_batch.majority_zone(zone_number, np.array(["T"] * 5, dtype="U1"))
+    assert keep.tolist() == [True, True, True, False, True]
+
+
+def test_empty_batch():
+    batch = pulse_batch.from_json([], common_zone=True)
+    assert len(batch) == 0 and batch.locations.shape == (0, 3)
+    assert batch.coerce_utm() is batch
@@ -0,0 +1,64 @@
+"""
+location.ransac_inliers on synthetic incidents with corrupted arrivals: the delayed sensors are the
+outliers, the rest inliers, and incidents nobody agrees on are Status.Inconsistent.
+"""
+
+import numpy as np
+
+from location import Status, location, sensor_subsets
+
+SPEED = location().compute_speed(20.0)
+
+
+"""
+Sensors spread around the source at 500 - 1500 m, so that every direction is pinned down by several
+of them, with the arrival times of a shot fired at 0.
+"""
+def incident(rng, sensors, noise=1e-5):
+    angles = 2 * np.pi * (np.arange(sensors) + rng.uniform(0, 0.5, sensors)) / sensors
+    distance = rng.uniform(500, 1500, sensors)
+    source = rng.uniform(-750, 750, size=2)
+    locations = np.zeros((sensors, 3))
+    locations[:, :2] = source + distance[:, np.newaxis] * np.stack((np.cos(angles), np.sin(angles)), axis=1)
+    return locations, distance / SPEED + rng.normal(0, noise, sensors)
+
+
+def test_delayed_arrivals_are_outliers():
+    rng = np.random.default_rng(17)
+    loc = location()
+    for sensors, corrupted in ((8, 1), (12, 2), (20, 3)):
+        for _ in range(20):
+            locations, arrivals = incident(rng, sensors)
+            outliers = rng.choice(sensors, corrupted, replace=False)
+            # An echo, heard 50 - 200 ms (17 - 69 m of path) after the direct sound
+            arrivals[outliers] += rng.uniform(0.05, 0.2, corrupted)
+            inliers, status = loc.ransac_inliers(locations, arrivals, SPEED)
+            assert status == Status.Ok
+            assert np.flatnonzero(~inliers).tolist() == sorted(outliers.tolist())
+
+
+def test_clean_incident_keeps_every_sensor():
+    rng = np.random.default_rng(1)
+    locations, arrivals = incident(rng, 10)
+    inliers, status = location().ransac_inliers(locations, arrivals, SPEED)
+    assert status == Status.Ok and inliers.all()
+    # Too few sensors to check a solve against, all are inliers
+    inliers, status = location().ransac_inliers(locations[:4], arrivals[:4] + [0, 0.1, 0, 0], SPEED)
+    assert status == Status.Ok and inliers.all()
+
+
+def test_random_arrivals_are_inconsistent():
+    rng = np.random.default_rng(2)
+    locations, _ = incident(rng, 8)
+    _, status = location().ransac_inliers(locations, rng.uniform(0, 5, 8), SPEED)
+    assert status == Status.Inconsistent
+
+
+def test_sensor_subsets():
+    # Every combination while there are few enough, then distinct random sorted subsets
+    assert sensor_subsets(6, 4, 500).shape == (15, 4)
+    subsets = sensor_subsets(20, 4, 100)
+    assert 90 < len(subsets) <= 100
+    assert (np.diff(subsets, axis=1) > 0).all()
+    assert len(np.unique(subsets, axis=0)) == len(subsets)
+    assert sensor_subsets(20, 4, 100) is subsets and not subsets.flags.writeable
@@ -0,0 +1,150 @@
+"""
+loc2D_references, the batched reference selection, against a frozen copy of the per reference
+rotation loop find_location ran before it: the same winning reference, location and error.
+"""
+
+import glob
+import os
+import pathlib
+
+import numpy as np
+import pytest
+
+import detect_pulses
+from location import location
+from pulse_batch import pulse_batch
+import smjx_reader
+
+EXAMPLES = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "examples")
+
+
+"""
+The baseline location.loc2D with arrivals in float seconds: a list of (position, discharge time)
+for both roots, empty when the radicand is negative.
+"""
+def baseline_loc2D(locations, arrivals, speed):
+    output = []
+    m = len(locations) - 1
+    a = np.zeros(shape=(m, 2))
+    d = np.zeros(shape=(m, 1))
+    w = np.zeros(shape=(m, 1))
+    for i in range(m):
+        temp_vector = locations[i+1] - locations[0]
+        r_squared = (temp_vector[0]**2) + (temp_vector[1]**2)
+        a[i][0] = temp_vector[0]
+        a[i][1] = temp_vector[1]
+        d[i][0] = speed * (arrivals[i+1] - arrivals[0])
+        w[i][0] = float(r_squared - (d[i][0] * d[i][0])) / 2
+    B = np.linalg.pinv(a)
+    C = B.dot(d)
+    Y = B.dot(w)
+    c = (C[0, 0], C[1, 0])
+    y = (Y[0, 0], Y[1, 0])
+    qA = (C.T.dot(C))[0, 0] - 1
+    if qA == 0:
+        return output
+    qB = float(((C.T.dot(Y)) + (Y.T.dot(C)))[0, 0])
+    qC = float((Y.T.dot(Y))[0, 0])
+    radicand = float(qB * qB - 4 * qA * qC)
+    root = 0.0
+    if radicand > 0:
+        root = radicand**(1/2)
+    elif radicand < 0:
+        return output
+    if qB >= 0:
+        qQ = -0.5 * (qB + root)
+        pos_vector = [i * (float(qC) / qQ) for i in c]
+        neg_vector = [i * (float(qQ) / qA) for i in c]
+    else:
+        qQ = -0.5 * (qB - root)
+        pos_vector = [i * (float(qQ) / qA) for i in c]
+        neg_vector = [i * (float(qC) / qQ) for i in c]
+    for vector in ([sum(x) for x in zip(pos_vector, y)], [sum(x) for x in zip(neg_vector, y)]):
+        discharge_time = arrivals[0] - np.linalg.norm(vector) / speed
+        output.append(([sum(x) for x in zip(vector, locations[0])], discharge_time))
+    return output
+
+
+"""
+The baseline find_location.compute_mse with the discharge time in float seconds.
+"""
+def baseline_mse(locations, computed_location, arrivals, discharge_time, speed):
+    distance = np.sqrt(np.sum(np.square(locations - np.array(computed_location)), axis=1))
+    discharge_distance = (arrivals - discharge_time) * speed
+    return np.square(discharge_distance - distance).sum() / discharge_distance.shape[0]
+
+
+"""
+The baseline find_location.compute_loc2D rotation loop, returning the index of the sensor used as
+reference by the winning rotation, its (position, discharge time) roots and their errors, or None
+when no root beats the 10000 error cut off.
+"""
+def baseline_references(locations, arrivals, speed):
+    compute_pulses = np.array(locations, dtype=np.float64)
+    compute_pulses[:, 2] = 0.0
+    arrivals = np.array(arrivals, dtype=np.float64)
+    best_index = 0
+    best_error = 10000
+    for i in range(len(arrivals)):
+        for position_vector, discharge_time in baseline_loc2D(compute_pulses, arrivals, speed):
+            mse_error = baseline_mse(compute_pulses, (position_vector[0], position_vector[1], 0.0), arrivals,
+                                     discharge_time, speed)
+            if mse_error < best_error:
+                best_error = mse_error
+                best_index = i
+        compute_pulses = np.roll(compute_pulses, 3)
+        arrivals = np.roll(arrivals, 1)
+    if best_error >= 10000:
+        return None
+    compute_pulses = np.roll(compute_pulses, 3 * best_index)
+    arrivals = np.roll(arrivals, best_index)
+    roots = baseline_loc2D(compute_pulses, arrivals, speed)
+    errors = [baseline_mse(compute_pulses, (vector[0], vector[1], 0.0), arrivals, discharge_time, speed)
+              for vector, discharge_time in roots]
+    return (-best_index) % len(arrivals), roots, errors
+
+
+def assert_same_reference(locations, arrivals, speed):
+    expected = baseline_references(locations, arrivals, speed)
+    locations = np.array(locations, dtype=np.float64)
+    locations[:, 2] = 0.0
+    references, positions, discharge_times, errors, _ = location().loc2D_references(locations, arrivals, speed)
+    errors = np.where(np.isnan(errors), np.inf, errors)
+    best_index = np.unravel_index(np.argmin(errors), errors.shape)[0]
+    if expected is None:
+        assert errors[best_index].min() >= 10000
+        return
+    reference, roots, expected_errors = expected
+    if min(expected_errors) < 1e-12 and references[best_index] != reference:
+        # With three sensors every reference fits exactly, rounding decides which one wins and
+        # the batched winner only has to fit as well
+        assert errors[best_index].min() < 1e-12
+        return
+    assert references[best_index] == reference
+    for root, (vector, discharge_time) in enumerate(roots):
+        np.testing.assert_allclose(positions[best_index, root], vector[:2], rtol=0, atol=1e-6)
+        assert discharge_times[best_index, root] == pytest.approx(discharge_time, abs=1e-9)
+        assert errors[best_index, root] == pytest.approx(expected_errors[root], rel=1e-6, abs=1e-6)
+
+
+@pytest.mark.parametrize("incident", ["ChicagoILDistrict5_783*", "ChicagoILDistrict7_312*"])
+def test_example_incidents(incident):
+    wavpaths = sorted(glob.glob(os.path.join(EXAMPLES, incident, "*.wav")))
+    smjxs = [(pathlib.Path(wavpath), smjx_reader.read_smjx_from_file(wavpath)) for wavpath in wavpaths]
+    pulse_sample = detect_pulses.detect_pulses(smjxs)
+    batch = pulse_batch.from_json(pulse_sample["pulses"], common_zone=True)
+    assert len(batch) >= 3
+    speed = location().compute_speed(pulse_sample["weather"]["temperature"])
+    assert_same_reference(batch.locations, batch.arrival_offset, speed)
+
+
+@pytest.mark.parametrize("sensors", [3, 4, 6, 10])
+def test_synthetic_incidents(sensors):
+    rng = np.random.default_rng(sensors)
+    speed = location().compute_speed(20.0)
+    for _ in range(50):
+        locations = np.zeros((sensors, 3))
+        locations[:, :2] = rng.uniform(-1500, 1500, size=(sensors, 2))
+        source = rng.uniform(-750, 750, size=2)
+        arrivals = np.linalg.norm(locations[:, :2] - source, axis=1) / speed + rng.normal(0, 1e-3, sensors)
+        assert_same_reference(locations, arrivals, speed)
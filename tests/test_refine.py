@@ -0,0 +1,73 @@
+"""
+location.refine_batch on synthetic incidents: exact arrivals are fitted exactly from a seed metres
+off, noisy arrivals end closer to the source than the closed form root they start from, and rows
+it can't refine are left as they are.
+"""
+
+import numpy as np
+
+from location import Status, location
+
+SPEED = location().compute_speed(20.0)
+
+
+def incidents(rng, n, sensors, noise, dimensions=2):
+    locations = np.zeros((n, sensors, 3))
+    locations[..., :2] = rng.uniform(-1500, 1500, size=(n, sensors, 2))
+    sources = np.zeros((n, 3))
+    sources[:, :2] = rng.uniform(-750, 750, size=(n, 2))
+    if dimensions == 3:
+        locations[..., 2] = rng.uniform(0, 200, size=(n, sensors))
+        sources[:, 2] = rng.uniform(0, 50, size=n)
+    distance = np.linalg.norm(locations[..., :dimensions] - sources[:, np.newaxis, :dimensions], axis=2)
+    arrivals = distance / SPEED + rng.normal(0, noise, (n, sensors))
+    return locations, arrivals, sources[:, :dimensions]
+
+
+def test_exact_arrivals_are_fitted_exactly():
+    rng = np.random.default_rng(16)
+    for dimensions in (2, 3):
+        locations, arrivals, sources = incidents(rng, 200, 6, 0.0, dimensions)
+        seeds = sources + rng.normal(0, 5.0, sources.shape)
+        positions, discharge_times, errors, _ = location().refine_batch(locations, arrivals, SPEED, seeds,
+                                                                        rng.normal(0, 0.01, 200))
+        np.testing.assert_allclose(positions, sources, rtol=0, atol=1e-3)
+        np.testing.assert_allclose(discharge_times, 0.0, rtol=0, atol=1e-8)
+        assert (errors < 1e-6).all()
+
+
+def test_refined_roots_beat_the_closed_form():
+    rng = np.random.default_rng(17)
+    loc = location()
+    for sensors in (6, 12):
+        locations, arrivals, sources = incidents(rng, 2000, sensors, 1e-4)
+        positions, discharge_times, status = loc.loc2D_batch(locations, arrivals, SPEED)
+        errors = loc.compute_mse(locations[:, np.newaxis, :, :2], arrivals[:, np.newaxis], positions,
+                                 discharge_times, SPEED)
+        best = np.argmin(np.where(np.isnan(errors), np.inf, errors), axis=1)
+        rows = np.arange(len(best))
+        seeds, seed_times = positions[rows, best], discharge_times[rows, best]
+        refined, _, refined_errors, covariance = loc.refine_batch(locations, arrivals, SPEED, seeds, seed_times)
+        ok = status == Status.Ok
+        closed_miss = np.linalg.norm(seeds[ok] - sources[ok], axis=1)
+        refined_miss = np.linalg.norm(refined[ok] - sources[ok], axis=1)
+        assert np.median(refined_miss) < 0.8 * np.median(closed_miss)
+        # Least squares over every arrival never fits worse than the root it started from
+        assert (refined_errors[ok] <= errors[rows, best][ok] * (1 + 1e-9)).all()
+        # With 0.1 ms arrival noise the position errors are centimetres, as the covariance says
+        sigma = np.sqrt(np.nanmedian(covariance[ok, 0, 0] + covariance[ok, 1, 1]))
+        assert 0.5 < np.median(refined_miss) / sigma < 2.0
+
+
+def test_rows_without_a_seed_or_spare_sensors():
+    rng = np.random.default_rng(18)
+    locations, arrivals, sources = incidents(rng, 3, 3, 1e-4)
+    seeds = sources.copy()
+    seeds[1] = np.nan
+    positions, discharge_times, errors, covariance = location().refine_batch(locations, arrivals, SPEED, seeds,
+                                                                             [0.0, np.nan, 0.0])
+    assert np.isnan(positions[1]).all() and np.isnan(discharge_times[1]) and np.isnan(errors[1])
+    assert np.isfinite(positions[[0, 2]]).all()
+    # Three sensors fit exactly, there is nothing left to estimate a covariance from
+    assert (errors[[0, 2]] < 1e-6).all()
+    assert np.isnan(covariance).all()
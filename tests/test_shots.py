@@ -0,0 +1,56 @@
+"""
+multi_shot: group_shots matches the impulses of a burst across sensors, and locate_shots gives every
+shot the status find_location gives a single incident.
+"""
+
+import uuid
+
+import numpy as np
+
+import conversion as utm
+from location import Status, location
+import multi_shot
+import utc_time
+
+POSITIONS = np.array([[0.0, 0.0], [400.0, 0.0], [0.0, 400.0], [400.0, 400.0], [200.0, 600.0]])
+SOURCE = np.array([150.0, 250.0])
+SPEED = location().compute_speed(20.0)
+
+
+def burst(shots, interval=0.1):
+    fired = np.arange(shots) * interval
+    return fired[:, np.newaxis] + np.linalg.norm(POSITIONS - SOURCE, axis=1) / SPEED
+
+
+def pulse_sample(arrivals, sensors):
+    origin = np.array([440000.0, 4620000.0])
+    start = utc_time.parse_utc_ns("2022-09-21T06:52:00.000Z")
+    pulses = []
+    for sensor in sensors:
+        latitude, longitude = utm.to_latlon(*(origin + POSITIONS[sensor]), 16, "T")
+        pulses.append({"serialNumber": "SCP-00-BNG-{0:04d}".format(sensor), "pulseId": str(uuid.UUID(int=sensor)),
+                       "arrivalTime": utc_time.isoformat_utc_ns(start + int(round(arrivals[sensor] * 1e9))),
+                       "location": {"latitude": latitude, "longitude": longitude, "elevation": 190.0}})
+    return {"pulses": pulses, "weather": {"temperature": 20.0}}
+
+
+def test_group_shots():
+    arrivals = burst(300)
+    grouped = multi_shot.group_shots(list(arrivals.T), POSITIONS, SPEED)
+    np.testing.assert_allclose(grouped, arrivals)
+
+
+def test_group_shots_missed_impulse():
+    arrivals = burst(20)
+    heard = [np.delete(arrivals[:, sensor], 7 if sensor == 2 else []) for sensor in range(len(POSITIONS))]
+    grouped = multi_shot.group_shots(heard, POSITIONS, SPEED)
+    assert np.isnan(grouped[7, 2])
+    np.testing.assert_allclose(np.delete(grouped, 7, axis=0), np.delete(arrivals, 7, axis=0))
+
+
+def test_locate_shots_status():
+    arrivals = burst(2)
+    samples = [pulse_sample(arrivals[0], range(len(POSITIONS))), pulse_sample(arrivals[1], range(3))]
+    results, status = multi_shot.locate_shots(samples)
+    assert status.tolist() == [Status.Ok, Status.Underdetermined]
+    assert all(results)
@@ -0,0 +1,67 @@
+"""
+The RIFF chunk walk of smjx_reader on hand built files: odd length chunks and their pad byte,
+chunks declared longer than the file (cut short recordings), partial headers at the end, and the
+same chunks from a file, from memory, and from read_all_chunks given the chunk list alone.
+"""
+
+import io
+
+import pytest
+
+import smjx_reader
+
+
+def riff(*chunks):
+    body = b"WAVE" + b"".join(chunks)
+    return b"RIFF" + len(body).to_bytes(4, "little") + body
+
+
+def chunk(name, data, length=None):
+    length = len(data) if length is None else length
+    return name + length.to_bytes(4, "little") + data + (b"\0" if len(data) % 2 else b"")
+
+
+def headers(bindata):
+    from_memory = list(smjx_reader.iter_chunk_headers(bindata))
+    assert list(smjx_reader.iter_chunk_headers(io.BytesIO(bindata))) == from_memory
+    return from_memory
+
+
+def test_odd_length_chunks_are_padded():
+    bindata = riff(chunk(b"fmt ", b"abc"), chunk(b"smjx", b"z"), chunk(b"data", b"0123"))
+    assert headers(bindata) == [(b"fmt ", 20, 3), (b"smjx", 32, 1), (b"data", 42, 4)]
+    names, lengths, chunks = smjx_reader.read_RIFF_chunks(bindata)
+    assert names == [b"fmt ", b"smjx", b"data"] and lengths == [3, 1, 4]
+    assert [bytes(x) for x in chunks] == [b"abc", b"z", b"0123"]
+
+
+def test_overlong_chunk_is_truncated():
+    # A data chunk that declares 1000 bytes in a recording cut short after 6 of them
+    bindata = riff(chunk(b"fmt ", b"ab"), chunk(b"data", b"012345", length=1000))
+    assert headers(bindata) == [(b"fmt ", 20, 2), (b"data", 30, 6)]
+    _, lengths, chunks = smjx_reader.read_RIFF_chunks(bindata)
+    assert lengths == [2, 6] and bytes(chunks[1]) == b"012345"
+
+
+def test_truncated_header_is_ignored():
+    bindata = riff(chunk(b"fmt ", b"ab"), chunk(b"data", b"0123"))
+    for cut in range(1, 8):
+        assert headers(bindata + b"LIST"[:cut]) == [(b"fmt ", 20, 2), (b"data", 30, 4)]
+    # Cut inside the data chunk's header, only the fmt chunk is left
+    assert headers(bindata[:30 - 3]) == [(b"fmt ", 20, 2)]
+    assert headers(riff()) == []
+
+
+def test_read_all_chunks_takes_the_chunk_list():
+    bindata = riff(chunk(b"fmt ", b"abc"), chunk(b"data", b"0123", length=9))
+    names, lengths, chunks = smjx_reader.read_all_chunks(bindata[12:])
+    assert names == [b"fmt ", b"data"] and lengths == [3, 4]
+    assert [bytes(x) for x in chunks] == [b"abc", b"0123"]
+    assert (names, lengths) == smjx_reader.read_RIFF_chunks(bindata)[:2]
+
+
+def test_not_riff_raises():
+    with pytest.raises(IOError):
+        headers(b"RIFX\0\0\0\0WAVE")
+    with pytest.raises(IOError):
+        smjx_reader.read_RIFF_chunks(b"RIFF\0\0\0\0AVI ")
@@ -0,0 +1,37 @@
+"""
+Collinear sensors have no unique solution: every solver reports Status.SingularGeometry for them
+rather than Status.Ok with least norm roots.
+"""
+
+import numpy as np
+
+import diagnostics
+from location import Status, location, reference_geometry
+
+COLLINEAR = np.array([[0.0, 0.0, 0.0], [100.0, 100.0, 0.0], [200.0, 200.0, 0.0], [300.0, 300.0, 0.0]])
+ARRIVALS = np.array([0.0, 0.1, 0.2, 0.25])
+
+
+def test_loc2D():
+    diagnostics.reset()
+    result = location().loc2D(COLLINEAR, ARRIVALS, 343.0)
+    assert result.status == Status.SingularGeometry
+    assert len(result) == 0
+    assert diagnostics.counters[diagnostics.SINGULAR_GEOMETRY] == 1
+
+
+def test_loc2D_batch():
+    locations = np.stack((COLLINEAR, COLLINEAR + [[0.0, 0.0, 0.0], [0.0, 50.0, 0.0], [0.0, 0.0, 0.0],
+                                                  [0.0, 0.0, 0.0]]))
+    positions, discharge_times, status = location().loc2D_batch(locations, np.stack((ARRIVALS, ARRIVALS)), 343.0)
+    assert status.tolist() == [Status.SingularGeometry, Status.Ok]
+    assert np.isnan(positions[0]).all() and np.isnan(discharge_times[0]).all()
+    assert np.isfinite(positions[1]).all()
+
+
+def test_loc2D_references():
+    loc = location()
+    for geometry in (None, reference_geometry(COLLINEAR)):
+        _, positions, _, errors, status = loc.loc2D_references(COLLINEAR, ARRIVALS, 343.0, geometry)
+        assert (status == Status.SingularGeometry).all()
+        assert np.isnan(positions).all() and np.isnan(errors).all()
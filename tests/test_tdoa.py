@@ -0,0 +1,62 @@
+"""
+tdoa.refine_onsets against the energy envelope onsets of detect_pulses on synthetic incidents whose
+arrival times are known: the refined relative arrival times must be the closer ones.
+"""
+
+import numpy as np
+
+import detect_pulses
+import tdoa
+
+SR = 12000
+SPEED = 343.0
+
+
+"""
+A decaying 900 Hz burst heard by m sensors around a source, delayed by a fractional number of
+samples, scaled by 1 / distance and buried in white noise. Returns the signals, the sensor
+positions and the true arrival times in seconds.
+"""
+def synthetic_incident(seed, m=6, noise=0.02):
+    rng = np.random.default_rng(seed)
+    positions = rng.uniform(0, 800, size=(m, 2))
+    source = rng.uniform(200, 600, size=2)
+    distance = np.linalg.norm(positions - source, axis=1)
+    arrivals = 0.2 + distance / SPEED
+    n = 4 * SR
+    t = np.arange(n) / SR
+    spectrum = np.fft.rfft(np.where(t < 0.03, np.sin(2 * np.pi * 900 * t) * np.exp(-t / 0.006), 0.0))
+    frequencies = np.fft.rfftfreq(n, 1 / SR)
+    signals = [1000.0 / distance[i] * np.fft.irfft(spectrum * np.exp(-2j * np.pi * frequencies * arrivals[i]), n)
+               + rng.normal(0, noise, n) for i in range(m)]
+    return signals, positions, arrivals
+
+
+"""
+RMS error of onsets (in samples) against the true arrivals, after removing the common shift that
+cross correlation can't measure and that location doesn't depend on.
+"""
+def relative_error(onsets, arrivals):
+    error = onsets / SR - arrivals
+    return np.sqrt(np.mean((error - error.mean()) ** 2))
+
+
+def test_refined_onsets_beat_envelope_onsets():
+    coarse_errors, refined_errors = [], []
+    for seed in range(1, 11):
+        signals, positions, arrivals = synthetic_incident(seed)
+        coarse = detect_pulses.detect_onsets(signals, SR)
+        refined, _, _ = tdoa.refine_onsets(signals, SR, np.zeros(len(signals)), positions, SPEED, coarse)
+        coarse_errors.append(relative_error(coarse, arrivals))
+        refined_errors.append(relative_error(refined, arrivals))
+    coarse_errors, refined_errors = np.array(coarse_errors), np.array(refined_errors)
+    assert (refined_errors < coarse_errors).all()
+    assert np.median(refined_errors) < 0.1 * np.median(coarse_errors)
+    assert np.median(refined_errors) < 10e-6
+
+
+def test_unreached_sensor_keeps_its_anchor():
+    # Sensor 2 is in no measured pair, it stays at its anchor while 0 and 1 follow their delay
+    arrivals = tdoa.reconcile_delays(3, np.array([0, 0]), np.array([1, 2]), np.array([0.004, np.nan]),
+                                     np.array([1.0, 1.0]), np.array([0.0, 0.0, 0.5]), 1e-6)
+    np.testing.assert_allclose(arrivals, [0.002, -0.002, 0.5], atol=1e-6)
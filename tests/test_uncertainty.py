@@ -0,0 +1,59 @@
+"""
+The Monte Carlo confidence ellipse: confidence_ellipse of known covariances, error_budget of the
+reported sensor errors, and the 95% ellipses of monte_carlo_batch holding the true source of about
+95% of synthetic incidents located from arrivals and sensor positions with those errors.
+"""
+
+import numpy as np
+import pytest
+
+from location import Status, confidence_ellipse, error_budget, location
+
+SPEED = location().compute_speed(20.0)
+
+
+def test_confidence_ellipse():
+    # 95% of a 2D normal lies within sqrt(5.991) standard deviations
+    semi_major, semi_minor, orientation = confidence_ellipse(np.diag([9.0, 1.0]))
+    assert semi_major == pytest.approx(3 * np.sqrt(5.991), rel=1e-3)
+    assert semi_minor == pytest.approx(np.sqrt(5.991), rel=1e-3)
+    assert orientation == pytest.approx(90.0)
+    # Major axis along the north east diagonal, and a stack with an unknown covariance in it
+    rotation = np.array([[1.0, -1.0], [1.0, 1.0]]) / np.sqrt(2)
+    covariance = np.stack((rotation @ np.diag([9.0, 1.0]) @ rotation.T, np.full((2, 2), np.nan)))
+    semi_major, semi_minor, orientation = confidence_ellipse(covariance)
+    assert semi_major[0] == pytest.approx(3 * np.sqrt(5.991), rel=1e-3) and orientation[0] == pytest.approx(45.0)
+    assert np.isnan([semi_major[1], semi_minor[1], orientation[1]]).all()
+
+
+def test_error_budget():
+    arrival_sigma, position_sigma = error_budget([2.0, 1.0, np.nan], [3e-6, np.nan, 1e-6])
+    np.testing.assert_allclose(arrival_sigma[[0, 2]], np.sqrt(1e-8 + np.array([9e-12, 1e-12]) / 3))
+    np.testing.assert_allclose(position_sigma[:2], [2.0 * 3.0 / np.sqrt(3), 3.0 / np.sqrt(3)])
+    assert np.isnan(arrival_sigma[1]) and np.isnan(position_sigma[2])
+
+
+def test_ellipses_cover_the_source():
+    rng = np.random.default_rng(21)
+    n, m = 300, 6
+    arrival_sigma, position_sigma = 2e-4, 1.0
+    locations = rng.uniform(-1000, 1000, size=(n, m, 2))
+    sources = rng.uniform(-400, 400, size=(n, 2))
+    arrivals = np.linalg.norm(locations - sources[:, np.newaxis], axis=2) / SPEED
+    # What the sensors report: arrivals and positions off by errors of the budgeted size
+    observed_arrivals = arrivals + rng.normal(0, arrival_sigma, (n, m))
+    observed_locations = locations + rng.normal(0, position_sigma, (n, m, 2))
+    loc = location()
+    positions, _, status = loc.loc2D_batch(observed_locations, observed_arrivals, SPEED)
+    nearest = np.argmin(np.nan_to_num(np.linalg.norm(positions - sources[:, np.newaxis], axis=2), nan=np.inf),
+                        axis=1)
+    located = positions[np.arange(n), nearest]
+    covariance, solved = loc.monte_carlo_batch(observed_locations, observed_arrivals, SPEED, located,
+                                               arrival_sigma, position_sigma, draws=500)
+    # Poorly conditioned geometries lose some draws to negative radicands, most keep them all
+    assert np.median(solved) == 1.0
+    # Inside the 95% ellipse: a squared Mahalanobis distance under 5.991
+    offsets = sources - located
+    distance = np.einsum("ni,nij,nj->n", offsets, np.linalg.inv(covariance), offsets)
+    coverage = np.mean(distance[(status == Status.Ok) & (solved > 0.9)] < 5.991)
+    assert 0.9 < coverage < 0.99
@@ -0,0 +1,37 @@
+"""
+parse_utc_ns_array agrees with parse_utc_ns on which timestamps are valid and on their values.
+"""
+
+import numpy as np
+import pytest
+
+import utc_time
+
+VALID = ["2022-09-21T06:52:01.123456789Z", "2022-09-21T06:52:01Z", "2022-09-21 06:52:01.5",
+         "2022-09-21T06:52:01.1234567891Z", "2022-09-21T08:52:01.25+02:00", "2022-09-21T01:52:01-0500",
+         "1969-12-31T23:59:59.999999999Z"]
+INVALID = ["2022-09-21", "2022-09-21T06", "2022-09-21T06:52", "2022-09-21T06:52Z", "+2022-09-21T06:52:01",
+           "2022-9-21T06:52:01", "20220921T065201Z", "2022-09-21T06:52:01.Z", "not a time", ""]
+
+
+@pytest.mark.parametrize("text", VALID)
+def test_valid(text):
+    expected = utc_time.parse_utc_ns(text)
+    assert utc_time.parse_utc_ns_array([text]).tolist() == [expected]
+    assert utc_time.parse_utc_ns_array([VALID[0], text]).tolist() == [utc_time.parse_utc_ns(VALID[0]), expected]
+
+
+@pytest.mark.parametrize("text", INVALID)
+def test_invalid(text):
+    with pytest.raises(ValueError):
+        utc_time.parse_utc_ns(text)
+    with pytest.raises(ValueError):
+        utc_time.parse_utc_ns_array([text])
+    with pytest.raises(ValueError):
+        utc_time.parse_utc_ns_array([VALID[0], text])
+
+
+def test_many():
+    times = utc_time.parse_utc_ns("2022-09-21T06:52:00Z") + np.arange(0, 10**10, 123456789)
+    texts = [utc_time.isoformat_utc_ns(time) for time in times]
+    assert (utc_time.parse_utc_ns_array(texts) == times).all()
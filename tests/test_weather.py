@@ -0,0 +1,33 @@
+"""
+find_location takes the speed of sound from the temperature alone unless use_weather, the humidity
+and wind of the weather only change the locations when asked to.
+"""
+
+import glob
+import os
+import pathlib
+
+import detect_pulses
+from find_location import find_location
+import smjx_reader
+
+EXAMPLES = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "examples")
+
+
+def example_request(pattern):
+    wavpaths = sorted(glob.glob(os.path.join(EXAMPLES, pattern, "*.wav")))
+    return detect_pulses.detect_pulses([(pathlib.Path(path), smjx_reader.read_smjx_from_file(path))
+                                        for path in wavpaths])
+
+
+def test_weather_is_opt_in():
+    request = example_request("ChicagoILDistrict5*")
+    assert request["weather"]["windspeed"]
+    calm = dict(request, weather={"temperature": request["weather"]["temperature"]})
+    default = find_location(request)
+    assert default.wind is None
+    assert ([x.as_dict() for x in default.computed_locations]
+            == [x.as_dict() for x in find_location(calm).computed_locations])
+    corrected = find_location(request, use_weather=True)
+    assert corrected.wind is not None
+    assert corrected.computed_locations[0].geolocation != default.computed_locations[0].geolocation
@@ -0,0 +1,90 @@
+"""
+The UTM zone coercion of pulse_batch: the majority vote, neighbouring zones reprojected into the
+majority zone and kept, zones two or more away dropped, counting across the 60 / 1 wrap.
+"""
+
+import numpy as np
+
+import conversion as utm
+from pulse_batch import pulse_batch
+
+
+def batch(latitude, longitude):
+    n = len(latitude)
+    return pulse_batch(["SN{0}".format(i) for i in range(n)], [bytes([i]) * 16 for i in range(n)], latitude,
+                       longitude, np.zeros(n), np.arange(n) * 1000000)
+
+
+def test_single_zone_is_kept_as_is():
+    pulses = batch([41.79, 41.80, 41.81], [-87.63, -87.64, -87.65])
+    zone_number, zone_letter, keep = pulse_batch.majority_zone(pulses.zone_number, pulses.zone_letter)
+    assert (zone_number, zone_letter, keep) == (16, "T", None)
+    assert pulses.coerce_utm() is pulses
+
+
+def test_neighbour_zone_is_reprojected_and_kept():
+    # Three sensors in zone 16 and one just across the boundary at 84 W, in zone 17
+    pulses = batch([41.0, 41.01, 41.02, 41.03], [-84.02, -84.03, -84.04, -83.99])
+    assert pulses.zone_number.tolist() == [16, 16, 16, 17]
+    coerced = pulses.coerce_utm()
+    assert len(coerced) == 4
+    assert coerced.zone_number.tolist() == [16] * 4
+    easting, northing, _, _ = utm.from_latlon(41.03, -83.99, 16, "T")
+    assert coerced.easting[3] == easting and coerced.northing[3] == northing
+    # Reprojected into zone 16 it lies east of the others, about a degree of longitude from its own
+    # zone's easting
+    assert coerced.easting[3] > coerced.easting[:3].max()
+    assert abs(coerced.easting[3] - pulses.easting[3]) > 100000
+
+
+def test_zones_two_or_more_away_are_dropped():
+    # Zone 16 has the majority, zone 18 (two away) and zone 20 (four away) are dropped
+    pulses = batch([41.0, 41.01, 41.02, 41.03, 41.04], [-87.0, -87.1, -87.2, -75.0, -62.0])
+    assert pulses.zone_number.tolist() == [16, 16, 16, 18, 20]
+    _, _, keep = pulse_batch.majority_zone(pulses.zone_number, pulses.zone_letter)
+    assert keep.tolist() == [True, True, True, False, False]
+    coerced = pulses.coerce_utm()
+    assert coerced.serial_number.tolist() == ["SN0", "SN1", "SN2"]
+    assert coerced.zone_number.tolist() == [16] * 3
+
+
+def test_zone_60_wraps_to_zone_1():
+    # Zone 60 has the majority, zone 1 is its neighbour across the antimeridian and zone 2 is two
+    # zones away
+    pulses = batch([-17.0, -17.1, -17.2, -17.0, -17.1], [179.5, 179.6, 179.7, -179.8, -173.0])
+    assert pulses.zone_number.tolist() == [60, 60, 60, 1, 2]
+    zone_number, _, keep = pulse_batch.majority_zone(pulses.zone_number, pulses.zone_letter)
+    assert zone_number == 60
+    assert keep.tolist() == [True, True, True, True, False]
+    coerced = pulses.coerce_utm()
+    assert coerced.serial_number.tolist() == ["SN0", "SN1", "SN2", "SN3"]
+    # Reprojected across the antimeridian it sits just east of the zone 60 sensors
+    assert 0 < coerced.easting[3] - coerced.easting[2] < 60000
+    latitude, longitude = utm.to_latlon(coerced.easting[3], coerced.northing[3], 60, "K")
+    assert np.isclose(latitude, -17.0) and np.isclose(longitude, -179.8)
+
+
+def test_zone_1_wraps_to_zone_60():
+    pulses = batch([-17.0, -17.1, -17.2, -17.3], [-179.5, -179.6, -179.7, 179.8])
+    _, _, keep = pulse_batch.majority_zone(pulses.zone_number, pulses.zone_letter)
+    assert keep.all()
+    coerced = pulses.coerce_utm()
+    assert coerced.zone_number.tolist() == [1] * 4
+    # Reprojected across the antimeridian it sits just west of the zone 1 sensors
+    assert 0 < coerced.easting[:3].min() - coerced.easting[3] < 60000
+
+
+def test_majority_tie_goes_to_the_lowest_zone():
+    # Two sensors each in zones 16 and 17, and two letters each (T and S either side of 40 N)
+    pulses = batch([40.1, 39.9, 40.1, 39.9], [-84.1, -84.2, -83.9, -83.8])
+    assert pulses.zone_number.tolist() == [16, 16, 17, 17]
+    assert pulses.zone_letter.tolist() == ["T", "S", "T", "S"]
+    zone_number, zone_letter, keep = pulse_batch.majority_zone(pulses.zone_number, pulses.zone_letter)
+    assert (zone_number, zone_letter) == (16, "S")
+    assert keep.all()
+    coerced = pulses.coerce_utm()
+    assert coerced.zone_number.tolist() == [16] * 4
+    assert coerced.zone_letter.tolist() == ["S"] * 4
+    # Forcing a northern hemisphere letter changes nothing north of the equator
+    easting, northing, _, _ = utm.from_latlon(40.1, -83.9, 16, "S")
+    assert coerced.easting[2] == easting and coerced.northing[2] == northing